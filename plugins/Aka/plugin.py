@@ -48,6 +48,7 @@ _ = PluginInternationalization('Aka')
 
 try:
     import sqlite3
+    import supybot.sqlitedb as sqlitedb
 except ImportError:
     sqlite3 = None
 try:
@@ -75,36 +76,31 @@ class Alias(object):
         return "<Alias('%r', '%r')>" % (self.name, self.alias)
 if sqlite3:
     class SQLiteAkaDB(object):
-        __slots__ = ('engines', 'filename', 'dbs',)
+        __slots__ = ('filename', 'dbs',)
         def __init__(self, filename):
-            self.engines = ircutils.IrcDict()
             self.filename = filename.replace('sqlite3', 'sqlalchemy')
+            self.dbs = sqlitedb.ChannelDatabases(self.filename,
+                                                 self._setup_db)
 
         def close(self):
-            self.dbs.clear()
+            self.dbs.close()
+
+        @staticmethod
+        def _setup_db(db):
+            cursor = db.cursor()
+            cursor.execute("""CREATE TABLE IF NOT EXISTS aliases (
+                    id INTEGER NOT NULL,
+                    name VARCHAR NOT NULL,
+                    alias VARCHAR NOT NULL,
+                    locked BOOLEAN NOT NULL,
+                    locked_by VARCHAR,
+                    locked_at DATETIME,
+                    PRIMARY KEY (id),
+                    UNIQUE (name))""")
+            db.commit()
 
         def get_db(self, channel):
-            if channel in self.engines:
-                engine = self.engines[channel]
-            else:
-                filename = plugins.makeChannelFilename(self.filename, channel)
-                exists = os.path.exists(filename)
-                engine = sqlite3.connect(filename, check_same_thread=False)
-                if not exists:
-                    cursor = engine.cursor()
-                    cursor.execute("""CREATE TABLE aliases (
-                            id INTEGER NOT NULL,
-                            name VARCHAR NOT NULL,
-                            alias VARCHAR NOT NULL,
-                            locked BOOLEAN NOT NULL,
-                            locked_by VARCHAR,
-                            locked_at DATETIME,
-                            PRIMARY KEY (id),
-                            UNIQUE (name))""")
-                    engine.commit()
-                self.engines[channel] = engine
-            assert engine.execute("select 1").fetchone() == (1,)
-            return engine
+            return self.dbs.connect(channel)
 
 
         def has_aka(self, channel, name):
@@ -212,7 +208,7 @@ elif sqlalchemy:
             self.sqlalchemy = sqlalchemy
 
         def close(self):
-            self.dbs.clear()
+            self.engines.clear()
 
         def get_db(self, channel):
             if channel in self.engines:
@@ -224,7 +220,6 @@ elif sqlalchemy:
                 if not exists:
                     Base.metadata.create_all(engine)
                 self.engines[channel] = engine
-            assert engine.execute("select 1").scalar() == 1
             Session = sqlalchemy.orm.sessionmaker()
             Session.configure(bind=engine)
             return Session()
@@ -314,6 +309,107 @@ elif sqlalchemy:
     available_db.update({'sqlalchemy': SqlAlchemyAkaDB})
 
 
+class CachedAkaDB(object):
+    """Wraps an Aka database, and keeps in memory the Akas of the channels
+    it was queried about, as well as a trie of their names; so the
+    database is only queried once per channel, and then on writes.
+
+    Akas are looked up for every command the bot receives, so this avoids
+    running several queries each time."""
+    def __init__(self, db):
+        self.db = db
+        # {channel: ({name: (alias, (locked, locked_by, locked_at))}, trie)}
+        # Each node of the trie is a dictionary from words to child nodes,
+        # with the None key if the words leading to it are an Aka name.
+        self.channels = ircutils.IrcDict()
+
+    def close(self):
+        self.channels.clear()
+        self.db.close()
+
+    def _get_channel(self, channel):
+        cached = self.channels.get(channel)
+        if cached is None:
+            akas = {}
+            trie = {}
+            for row in self.db.get_all(channel):
+                # The SQLAlchemy database does not return the id.
+                (name, alias, locked, locked_by, locked_at) = row[-5:]
+                akas[name] = (alias, (bool(locked), locked_by, locked_at))
+                node = trie
+                for word in name.split(' '):
+                    node = node.setdefault(word, {})
+                node[None] = True
+            cached = self.channels[channel] = (akas, trie)
+        return cached
+
+    def _invalidate(self, channel):
+        self.channels.pop(channel, None)
+
+    def get_aka_lengths(self, channel, words):
+        """Returns the set of integers i such that words[0:i] is the name
+        of an Aka of the channel."""
+        lengths = set()
+        node = self._get_channel(channel)[1]
+        for (i, word) in enumerate(words, 1):
+            node = node.get(word)
+            if node is None:
+                break
+            if None in node:
+                lengths.add(i)
+        return lengths
+
+    def has_aka(self, channel, name):
+        name = callbacks.canonicalName(name, preserve_spaces=True)
+        return name in self._get_channel(channel)[0]
+
+    def get_aka_list(self, channel):
+        return [(name,) for name in sorted(self._get_channel(channel)[0])]
+
+    def get_alias(self, channel, name):
+        name = callbacks.canonicalName(name, preserve_spaces=True)
+        aka = self._get_channel(channel)[0].get(name)
+        if aka:
+            return aka[0]
+        else:
+            return None
+
+    def get_aka_lock(self, channel, name):
+        name = callbacks.canonicalName(name, preserve_spaces=True)
+        aka = self._get_channel(channel)[0].get(name)
+        if aka:
+            return aka[1]
+        else:
+            raise AkaError(_('This Aka does not exist.'))
+
+    def get_all(self, channel):
+        return self.db.get_all(channel)
+
+    def add_aka(self, channel, name, alias):
+        try:
+            self.db.add_aka(channel, name, alias)
+        finally:
+            self._invalidate(channel)
+
+    def remove_aka(self, channel, name):
+        try:
+            self.db.remove_aka(channel, name)
+        finally:
+            self._invalidate(channel)
+
+    def lock_aka(self, channel, name, by):
+        try:
+            self.db.lock_aka(channel, name, by)
+        finally:
+            self._invalidate(channel)
+
+    def unlock_aka(self, channel, name, by):
+        try:
+            self.db.unlock_aka(channel, name, by)
+        finally:
+            self._invalidate(channel)
+
+
 def getArgs(args, required=1, optional=0, wildcard=0):
     if len(args) < required:
         raise callbacks.ArgumentError
@@ -535,7 +631,7 @@ class Aka(callbacks.Plugin):
         self.__parent.__init__(irc)
         # "sqlalchemy" is only for backward compatibility
         filename = conf.supybot.directories.data.dirize('Aka.sqlalchemy.db')
-        self._db = AkaDB(filename)
+        self._db = CachedAkaDB(AkaDB(filename))
         self._http_running = False
         conf.supybot.plugins.Aka.web.enable.addCallback(self._httpConfCallback)
         if self.registryValue('web.enable'):
@@ -544,6 +640,7 @@ class Aka(callbacks.Plugin):
     def die(self):
         if self._http_running:
             self._stopHttp()
+        self._db.close()
 
     def _httpConfCallback(self):
         if self.registryValue('web.enable'):
@@ -596,8 +693,16 @@ class Aka(callbacks.Plugin):
             if ret:
                 return [first] + ret
         max_length = self.registryValue('maximumWordsInName')
+        # Only try the lengths that may be the name of an Aka, or of a
+        # command of this plugin.
+        channel = dynamic.channel or 'global'
+        words = args[0:max_length-1]
+        lengths = self._db.get_aka_lengths(channel, words) | \
+            self._db.get_aka_lengths('global', words)
+        lengths.add(1)
         for i in range(1, min(len(args)+1, max_length)):
-            if self.isCommandMethod(callbacks.formatCommand(args[0:i])):
+            if i in lengths and \
+                    self.isCommandMethod(callbacks.formatCommand(args[0:i])):
                 return args[0:i]
         return []
 
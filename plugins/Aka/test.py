@@ -293,6 +293,39 @@ class AkaTestCase(PluginTestCase):
         # This should be case insensitive too.
         self.assertRegexp('aka search MaNY', 'many words')
 
+    def testDatabaseOnlyUsedForWrites(self):
+        class LoggingDB(object):
+            def __init__(self, db):
+                self.db = db
+                self.calls = []
+            def __getattr__(self, name):
+                self.calls.append(name)
+                return getattr(self.db, name)
+        self.assertNotError('register tacocat hunter2')
+        self.assertNotError('aka add greet "echo bar"')
+        self.assertNotError('aka add "say hi there" "echo qux"')
+        self.assertResponse('greet', 'bar')
+        cb = self.irc.getCallback('Aka')
+        db = cb._db.db = LoggingDB(cb._db.db)
+
+        self.assertResponse('greet', 'bar')
+        self.assertResponse('say hi there', 'qux')
+        self.assertResponse('greet bar', 'bar')
+        self.assertResponse('echo greet', 'greet')
+        self.assertNotRegexp('help greet', 'Locked')
+        self.assertEqual(db.calls, [])
+
+        self.assertNotError('aka set greet "echo baz"')
+        self.assertResponse('greet', 'baz')
+        self.assertNotError('aka lock greet')
+        self.assertRegexp('help greet', 'Locked by tacocat')
+        self.assertNotError('aka unlock greet')
+        self.assertNotRegexp('help greet', 'Locked')
+        self.assertNotError('aka remove "say hi there"')
+        self.assertRegexp('say hi there', 'not a valid command')
+        self.assertNotIn('has_aka', db.calls)
+        self.assertNotIn('get_alias', db.calls)
+
 class AkaWebUITestCase(ChannelHTTPPluginTestCase):
     plugins = ('Aka',)
     config = {
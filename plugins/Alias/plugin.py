@@ -258,6 +258,9 @@ class Alias(callbacks.Plugin):
     called. (In this case, not quoting the nested command would mean that
     ``@randpercent`` always responds with the same value!)
     """
+    # Aliases are listed by listCommands.
+    indexCommands = True
+
     def __init__(self, irc):
         self.__parent = super(Alias, self)
         self.__parent.__init__(irc)
@@ -300,6 +303,7 @@ class Alias(callbacks.Plugin):
                 self.log.exception('Exception when trying to add alias %s.  '
                                    'Removing from the Alias database.', alias)
                 del self.aliases[alias]
+                self.commandsChanged()
 
     def isCommandMethod(self, name):
         if not self.__parent.isCommandMethod(name):
@@ -408,6 +412,7 @@ class Alias(callbacks.Plugin):
         conf.registerGlobalValue(aliasGroup.get(confname), 'locked',
                                  registry.Boolean(lock, ''))
         self.aliases[name] = [alias, lock, f]
+        self.commandsChanged()
 
     def removeAlias(self, name, evenIfLocked=False):
         name = callbacks.canonicalName(name)
@@ -415,6 +420,7 @@ class Alias(callbacks.Plugin):
             if evenIfLocked or not self.aliases[name][1]:
                 del self.aliases[name]
                 self.aliasRegistryRemove(name)
+                self.commandsChanged()
             else:
                 raise AliasError('That alias is locked.')
         else:
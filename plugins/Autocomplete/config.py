@@ -65,6 +65,31 @@ conf.registerChannelValue(
         ),
     ),
 )
+conf.registerGlobalValue(
+    Autocomplete,
+    "maximumRequests",
+    registry.NonNegativeInteger(
+        20,
+        _(
+            """Determines how many autocomplete requests a user can send
+    within the number of seconds given by
+    supybot.plugins.Autocomplete.maximumRequests.interval; further requests
+    are ignored until older ones expire.  Clients may send a request on every
+    keystroke.  If this is 0, requests are never ignored."""
+        ),
+    ),
+)
+conf.registerGlobalValue(
+    Autocomplete.maximumRequests,
+    "interval",
+    registry.PositiveInteger(
+        5,
+        _(
+            """Determines the number of seconds during which
+    supybot.plugins.Autocomplete.maximumRequests applies."""
+        ),
+    ),
+)
 
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
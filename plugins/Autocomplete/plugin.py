@@ -53,7 +53,118 @@ def _commonPrefix(L):
     assert False
 
 
-def _getAutocompleteResponse(irc, msg, payload):
+class CommandTrie(object):
+    """Prefix tree of the names of the commands of a list of callbacks, both
+    with and without the plugin name first.
+
+    Each node is a dictionary from characters to child nodes; and the None
+    key maps to the number of callbacks having the command whose name leads
+    to this node.
+
+    :py:meth:`refresh` only lists the commands of callbacks that were added
+    to the list since the last call, unless
+    :py:data:`supybot.callbacks.commandIndex` was invalidated since then
+    (a command was renamed, or a plugin's set of commands changed), in which
+    case the commands of all callbacks are listed again.  In both cases, only
+    the names that were added or removed are updated in the tree."""
+
+    def __init__(self):
+        self.root = {}
+        self.generation = None
+        self.callbacks = []
+        # {callback: frozenset of command names}
+        self.commands = {}
+
+    def __len__(self):
+        return sum(map(len, self.commands.values()))
+
+    def add(self, name):
+        node = self.root
+        for char in name:
+            child = node.get(char)
+            if child is None:
+                child = node[char] = {}
+            node = child
+        node[None] = node.get(None, 0) + 1
+
+    def remove(self, name):
+        path = []
+        node = self.root
+        for char in name:
+            path.append((node, char))
+            node = node[char]
+        if node[None] > 1:
+            node[None] -= 1
+            return
+        del node[None]
+        # Remove nodes that do not lead to any command anymore
+        while path and not node:
+            (node, char) = path.pop()
+            del node[char]
+
+    @staticmethod
+    def _listCommands(cb):
+        if not hasattr(cb, "listCommands"):
+            return frozenset()
+        try:
+            commands = cb.listCommands()
+        except Exception:
+            cb.log.exception(
+                "Uncaught exception in %s.listCommands:", cb.name()
+            )
+            return frozenset()
+        # copy them with the plugin name (optional when calling a command)
+        # at the beginning
+        plugin_name = cb.canonicalName()
+        return frozenset(commands) | frozenset(
+            plugin_name + " " + command for command in commands
+        )
+
+    def refresh(self, cbs):
+        """Updates the tree if the commands of the callbacks in ``cbs`` may
+        have changed since the last call."""
+        generation = callbacks.commandIndex.generation
+        upToDate = generation == self.generation
+        if upToDate and cbs == self.callbacks:
+            return
+        commands = {}
+        for cb in cbs:
+            if cb in commands:
+                continue
+            if upToDate and cb in self.commands:
+                commands[cb] = self.commands[cb]
+            else:
+                commands[cb] = self._listCommands(cb)
+        for (cb, names) in self.commands.items():
+            for name in names - commands.get(cb, frozenset()):
+                self.remove(name)
+        for (cb, names) in commands.items():
+            for name in names - self.commands.get(cb, frozenset()):
+                self.add(name)
+        self.generation = generation
+        self.callbacks = list(cbs)
+        self.commands = commands
+
+    def complete(self, prefix):
+        """Returns a list of the commands starting with ``prefix``."""
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        commands = []
+        stack = [(prefix, node)]
+        while stack:
+            (name, node) = stack.pop()
+            for (char, child) in node.items():
+                if char is None:
+                    commands.append(name)
+                else:
+                    stack.append((name + char, child))
+        return commands
+
+
+def _getAutocompleteResponse(irc, msg, payload, trie):
     """Returns the value of the +draft/autocomplete-response tag for the given
     +draft/autocomplete-request payload."""
     tokens = callbacks.tokenize(
@@ -61,7 +172,7 @@ def _getAutocompleteResponse(irc, msg, payload):
     )
     normalized_payload = " ".join(tokens)
 
-    candidate_commands = _getCandidates(irc, normalized_payload)
+    candidate_commands = _getCandidates(irc, normalized_payload, trie)
 
     if len(candidate_commands) == 0:
         # No result
@@ -72,10 +183,9 @@ def _getAutocompleteResponse(irc, msg, payload):
     else:
         # Multiple results, return only the longest common prefix + one word
 
-        tokenized_candidates = [
-            callbacks.tokenize(c, channel=msg.channel, network=irc.network)
-            for c in candidate_commands
-        ]
+        # command names are canonical names separated by spaces, so there
+        # is no need to tokenize them.
+        tokenized_candidates = [c.split(" ") for c in candidate_commands]
 
         common_prefix = _commonPrefix(tokenized_candidates)
 
@@ -97,29 +207,32 @@ def _getAutocompleteResponse(irc, msg, payload):
     return "\t".join(sorted(response_items))
 
 
-def _getCandidates(irc, normalized_payload):
+def _getCandidates(irc, normalized_payload, trie):
     """Returns a list of commands starting with the normalized_payload."""
-    candidates = set()
-    for cb in irc.callbacks:
-        cb_commands = cb.listCommands()
-
-        # copy them with the plugin name (optional when calling a command)
-        # at the beginning
-        plugin_name = cb.canonicalName()
-        cb_commands += [plugin_name + " " + command for command in cb_commands]
-
-        candidates |= {
-            command
-            for command in cb_commands
-            if command.startswith(normalized_payload)
-        }
-
-    return candidates
+    trie.refresh(irc.callbacks)
+    return trie.complete(normalized_payload)
 
 
 class Autocomplete(callbacks.Plugin):
     """Provides command completion for IRC clients that support it."""
 
+    def __init__(self, irc):
+        self.__parent = super(Autocomplete, self)
+        self.__parent.__init__(irc)
+        self.trie = CommandTrie()
+        self.requests = ircutils.FloodQueue(
+            lambda: self.registryValue("maximumRequests.interval")
+        )
+
+    def _throttled(self, msg):
+        maximum = self.registryValue("maximumRequests")
+        if not maximum:
+            return False
+        if self.requests.len(msg) >= maximum:
+            return True
+        self.requests.enqueue(msg)
+        return False
+
     def _enabled(self, irc, msg):
         return (
             conf.supybot.protocols.irc.experimentalExtensions()
@@ -157,7 +270,13 @@ class Autocomplete(callbacks.Plugin):
             # address the bot, so it can't be a method to be completed.
             return
 
-        autocomplete_response = _getAutocompleteResponse(irc, msg, payload)
+        if self._throttled(msg):
+            # Clients may send a request on every keystroke
+            return
+
+        autocomplete_response = _getAutocompleteResponse(
+            irc, msg, payload, self.trie
+        )
         if not autocomplete_response:
             return
 
@@ -31,6 +31,8 @@
 from supybot import conf, ircmsgs
 from supybot.test import *
 
+from .plugin import CommandTrie
+
 
 class AutocompleteTestCase(PluginTestCase):
     plugins = ("Autocomplete", "Later", "Misc")
@@ -116,6 +118,59 @@ class AutocompleteTestCase(PluginTestCase):
             self._sendRequest("apro")
             self.assertIsNone(self.irc.takeMsg())
 
+    def testPluginRemoved(self):
+        with conf.supybot.protocols.irc.experimentalExtensions.context(True):
+            with conf.supybot.plugins.Autocomplete.enabled.context(True):
+                self._assertAutocompleteResponse("te", "ll\tstplugin")
+                self.irc.removeCallback("Later")
+                self._sendRequest("lat")
+                self.assertIsNone(self.irc.takeMsg())
+                # still provided by Misc
+                self._assertAutocompleteResponse("tel", "l")
+
+    def testCommandRenamed(self):
+        with conf.supybot.protocols.irc.experimentalExtensions.context(True):
+            with conf.supybot.plugins.Autocomplete.enabled.context(True):
+                self._assertAutocompleteResponse("apro", "pos")
+                cb = self.irc.getCallback("Misc")
+                plugin.renameCommand(cb, "apropos", "aproposx")
+                try:
+                    self._assertAutocompleteResponse("apro", "posx")
+                finally:
+                    plugin.renameCommand(cb, "aproposx", "apropos")
+
+    def testMaximumRequests(self):
+        with conf.supybot.protocols.irc.experimentalExtensions.context(True):
+            with conf.supybot.plugins.Autocomplete.enabled.context(True):
+                with conf.supybot.plugins.Autocomplete.maximumRequests.context(
+                    2
+                ):
+                    self._assertAutocompleteResponse("apro", "pos")
+                    self._assertAutocompleteResponse("apr", "opos")
+                    self._sendRequest("ap")
+                    self.assertIsNone(self.irc.takeMsg())
+                    timeFastForward(6)
+                    self._assertAutocompleteResponse("apro", "pos")
+
+
+class CommandTrieTestCase(SupyTestCase):
+    def testAddRemove(self):
+        trie = CommandTrie()
+        trie.add("tell")
+        trie.add("tell")
+        trie.add("test")
+        trie.add("later tell")
+        self.assertEqual(sorted(trie.complete("te")), ["tell", "test"])
+        self.assertEqual(trie.complete("later "), ["later tell"])
+        self.assertEqual(trie.complete("x"), [])
+        trie.remove("tell")
+        self.assertEqual(sorted(trie.complete("te")), ["tell", "test"])
+        trie.remove("tell")
+        self.assertEqual(trie.complete("te"), ["test"])
+        trie.remove("test")
+        trie.remove("later tell")
+        self.assertEqual(trie.root, {})
+
 
 class AutocompleteChannelTestCase(ChannelPluginTestCase):
     plugins = ("Autocomplete", "Later", "Misc")
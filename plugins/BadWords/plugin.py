@@ -29,11 +29,9 @@
 # POSSIBILITY OF SUCH DAMAGE.
 ###
 
-import re
-import time
-
 import supybot.conf as conf
 import supybot.utils as utils
+import supybot.registry as registry
 import supybot.ircdb as ircdb
 import supybot.ircmsgs as ircmsgs
 from supybot.commands import *
@@ -42,6 +40,132 @@ import supybot.callbacks as callbacks
 from supybot.i18n import PluginInternationalization, internationalizeDocstring
 _ = PluginInternationalization('BadWords')
 
+def _lower(s):
+    """Lowers the string, without changing its length (so indexes in the
+    lowered string are the same as in the original string)."""
+    lowered = s.lower()
+    if len(lowered) != len(s):
+        # Some characters, like U+0130, are lowered to two characters.
+        lowered = ''.join(c if len(c.lower()) != 1 else c.lower() for c in s)
+    return lowered
+
+def _isWordCharacter(c):
+    # Same as \w in regular expressions
+    return c.isalnum() or c == '_'
+
+class AhoCorasick(object):
+    """Case-insensitive matcher of a set of words and phrases, which finds
+    all their occurrences in a single pass over the text, whatever the
+    number of words (unlike an alternation in a regular expression, which
+    tries every word at each position)."""
+    def __init__(self, words):
+        # State 0 is the root.  goto[state] maps characters to the next
+        # state (or is None if there is no transition), fail[state] is the
+        # state of the longest proper suffix that is a prefix of a word, and
+        # lengths[state] are the lengths of the words ending at this state,
+        # including through fail links.
+        self.goto = [None]
+        fail = [0]
+        lengths = [()]
+        goto = self.goto
+        for word in words:
+            word = _lower(word)
+            if not word:
+                continue
+            state = 0
+            for c in word:
+                transitions = goto[state]
+                if transitions is None:
+                    transitions = goto[state] = {}
+                next = transitions.get(c)
+                if next is None:
+                    next = transitions[c] = len(goto)
+                    goto.append(None)
+                    fail.append(0)
+                    lengths.append(())
+                state = next
+            if len(word) not in lengths[state]:
+                lengths[state] += (len(word),)
+
+        # Breadth-first traversal, so the fail link of a state is computed
+        # before its children's.
+        queue = list((goto[0] or {}).values())
+        for state in queue:
+            transitions = goto[state]
+            if transitions is None:
+                continue
+            for (c, next) in transitions.items():
+                queue.append(next)
+                f = fail[state]
+                while f and c not in (goto[f] or ()):
+                    f = fail[f]
+                f = (goto[f] or {}).get(c, 0)
+                fail[next] = f
+                lengths[next] += lengths[f]
+        self.fail = fail
+        self.lengths = lengths
+
+    def iterOccurrences(self, s):
+        """Yields the (start, end) indexes of all the occurrences of the
+        words in s, including overlapping ones, by increasing end."""
+        goto = self.goto
+        fail = self.fail
+        lengths = self.lengths
+        state = 0
+        for (i, c) in enumerate(_lower(s)):
+            while True:
+                transitions = goto[state]
+                if transitions is not None and c in transitions:
+                    state = transitions[c]
+                    break
+                elif not state:
+                    break
+                state = fail[state]
+            for length in lengths[state]:
+                yield (i + 1 - length, i + 1)
+
+    def iterMatches(self, s, wordBoundaries=False):
+        """Yields the (start, end) indexes of the occurrences of the words
+        in s, without overlaps, like re.finditer.  The longest word is used
+        when several start at the same index.  If wordBoundaries is True,
+        occurrences must start and end at word boundaries (as with \\b in
+        regular expressions)."""
+        occurrences = self.iterOccurrences(s)
+        if wordBoundaries:
+            def isBoundary(i):
+                before = i > 0 and _isWordCharacter(s[i-1])
+                after = i < len(s) and _isWordCharacter(s[i])
+                return before != after
+            occurrences = ((start, end) for (start, end) in occurrences
+                           if isBoundary(start) and isBoundary(end))
+        occurrences = sorted(occurrences, key=lambda o: (o[0], -o[1]))
+        position = 0
+        for (start, end) in occurrences:
+            if start >= position:
+                yield (start, end)
+                position = end
+
+    def search(self, s, wordBoundaries=False):
+        """Returns whether any of the words is in s."""
+        for __ in self.iterMatches(s, wordBoundaries):
+            return True
+        return False
+
+    def sub(self, repl, s, wordBoundaries=False):
+        """Returns s with each of the matches of the words replaced by
+        repl(word)."""
+        L = []
+        position = 0
+        for (start, end) in self.iterMatches(s, wordBoundaries):
+            L.append(s[position:start])
+            L.append(repl(s[start:end]))
+            position = end
+        if not L:
+            return s
+        L.append(s[position:])
+        return ''.join(L)
+
+
 class BadWords(callbacks.Privmsg):
     """Maintains a list of words that the bot is not allowed to say.
     Can also be used to kick people that say these words, if the bot
@@ -52,9 +176,14 @@ class BadWords(callbacks.Privmsg):
         # This is so we can not filter certain outgoing messages (like list,
         # which would be kinda useless if it were filtered).
         self.filtering = True
-        self.lastModified = 0
         self.words = conf.supybot.plugins.BadWords.words
         self.phrases = conf.supybot.plugins.BadWords.phrases
+        # The matcher only depends on the words and phrases; word
+        # boundaries are checked when matching, so it is shared by all
+        # channels and networks.
+        self.matcher = None
+        self.matcherWords = None
+        self.matcherGeneration = None
 
     def callCommand(self, name, irc, msg, *args, **kwargs):
         if ircdb.checkCapability(msg.prefix, 'admin'):
@@ -62,12 +191,12 @@ class BadWords(callbacks.Privmsg):
         else:
             irc.errorNoCapability('admin')
 
-    def sub(self, m):
+    def sub(self, word):
         replaceMethod = self.registryValue('replaceMethod')
         if replaceMethod == 'simple':
             return self.registryValue('simpleReplacement')
         elif replaceMethod == 'nastyCharacters':
-            return self.registryValue('nastyChars')[:len(m.group(1))]
+            return self.registryValue('nastyChars')[:len(word)]
 
     def inFilter(self, irc, msg):
         self.filtering = True
@@ -75,11 +204,12 @@ class BadWords(callbacks.Privmsg):
         # messages don't get to doPrivmsg if the user is ignored.
         if msg.command == 'PRIVMSG' and (self.words() or self.phrases()):
             channel = msg.channel
-            self.updateRegexp(channel, irc.network)
-            s = ircutils.stripFormatting(msg.args[1])
             if irc.isChannel(channel) \
                     and self.registryValue('kick', channel, irc.network):
-                if self.regexp.search(s):
+                s = ircutils.stripFormatting(msg.args[1])
+                wordBoundaries = self.registryValue('requireWordBoundaries',
+                                                    channel, irc.network)
+                if self.getMatcher().search(s, wordBoundaries):
                     c = irc.state.channels[channel]
                     cap = ircdb.makeChannelCapability(channel, 'op')
                     if c.isHalfopPlus(irc.nick):
@@ -97,32 +227,32 @@ class BadWords(callbacks.Privmsg):
                                          msg.nick, channel)
         return msg
 
-    def updateRegexp(self, channel, network):
-        if self.lastModified < self.words.lastModified \
-                or self.lastModified < self.phrases.lastModified:
-            self.makeRegexp(self.words() | self.phrases(), channel, network)
-            self.lastModified = time.time()
+    def getMatcher(self):
+        """Returns the matcher of the current words and phrases, building it
+        again only if they changed."""
+        if self.matcherGeneration != registry._generation:
+            words = frozenset(self.words()) | frozenset(self.phrases())
+            if words != self.matcherWords:
+                self.matcher = AhoCorasick(words)
+                self.matcherWords = words
+            self.matcherGeneration = registry._generation
+        return self.matcher
 
     def outFilter(self, irc, msg):
         channel = msg.channel
         if self.filtering and msg.command == 'PRIVMSG' \
                 and (self.words() or self.phrases()) \
                 and self.registryValue('selfCensor', channel, irc.network):
-            self.updateRegexp(channel, irc.network)
             s = msg.args[1]
             if self.registryValue('stripFormatting'):
                 s = ircutils.stripFormatting(s)
-            t = self.regexp.sub(self.sub, s)
+            wordBoundaries = self.registryValue('requireWordBoundaries',
+                                                channel, irc.network)
+            t = self.getMatcher().sub(self.sub, s, wordBoundaries)
             if t != s:
                 msg = ircmsgs.privmsg(msg.args[0], t, msg=msg)
         return msg
 
-    def makeRegexp(self, iterable, channel, network):
-        s = '(%s)' % '|'.join(map(re.escape, iterable))
-        if self.registryValue('requireWordBoundaries', channel, network):
-            s = r'\b%s\b' % s
-        self.regexp = re.compile(s, re.I)
-
     @internationalizeDocstring
     def list(self, irc, msg, args):
         """takes no arguments
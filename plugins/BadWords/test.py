@@ -28,7 +28,11 @@
 # POSSIBILITY OF SUCH DAMAGE.
 ###
 
+import re
+import random
+
 import supybot.conf as conf
+import supybot.registry as registry
 from supybot.test import *
 
 class BadWordsTestCase(PluginTestCase):
@@ -80,5 +84,87 @@ class BadWordsTestCase(PluginTestCase):
         self.assertNotError('badwords add "fuck you"')
         self.assertResponse('badwords list', 'ass, fuck you, and shit')
 
+
+class BadWordsChannelTestCase(ChannelPluginTestCase):
+    plugins = ('BadWords', 'Utilities')
+    def tearDown(self):
+        conf.supybot.plugins.BadWords.words.setValue([])
+        conf.supybot.plugins.BadWords.phrases.setValue([])
+        super(BadWordsChannelTestCase, self).tearDown()
+
+    def testChannelSpecificWordBoundaries(self):
+        self.assertNotError('badwords add darn')
+        with conf.supybot.plugins.BadWords.requireWordBoundaries \
+                .get(self.channel).context(True):
+            self.assertResponse('echo darnit darn', 'darnit !@#&')
+        self.assertResponse('echo darnit darn', '!@#&it !@#&')
+
+    def testReload(self):
+        self.assertNotError('badwords add darn')
+        self.assertResponse('echo darn heck', '!@#& heck')
+        filename = conf.supybot.directories.conf.dirize(
+            'BadWords_testReload.conf')
+        with open(filename, 'w') as fd:
+            fd.write('supybot.plugins.BadWords.words: heck\n')
+        lastModified = registry._lastModified
+        try:
+            registry.open_registry(filename)
+            self.assertResponse('echo darn heck', 'darn !@#&')
+        finally:
+            del registry._cache['supybot.plugins.BadWords.words']
+            registry._lastModified = lastModified
+            os.remove(filename)
+
+    def testPhrases(self):
+        self.assertNotError('badwords add "fuck you" fuck')
+        self.assertResponse('echo FUCK YOU and fuckers',
+                            '!@#&!@#& and !@#&ers')
+
+
+class AhoCorasickTestCase(SupyTestCase):
+    def setUp(self):
+        super(AhoCorasickTestCase, self).setUp()
+        from . import plugin
+        self.plugin = plugin
+
+    def testMatches(self):
+        m = self.plugin.AhoCorasick(['he', 'she', 'hers', 'his', 'Sh', ''])
+        self.assertEqual(sorted(m.iterOccurrences('ushers')),
+                         [(1, 3), (1, 4), (2, 4), (2, 6)])
+        self.assertEqual(list(m.iterMatches('USHERS')), [(1, 4)])
+        self.assertEqual(m.sub(lambda s: '[%s]' % s, 'she said his hershey'),
+                         '[she] said [his] [hers][he]y')
+        self.assertEqual(m.sub(lambda s: '[%s]' % s, 'she said his hershey',
+                               wordBoundaries=True),
+                         '[she] said [his] hershey')
+        self.assertTrue(m.search('this'))
+        self.assertFalse(m.search('this', wordBoundaries=True))
+        self.assertFalse(self.plugin.AhoCorasick([]).search('foo'))
+
+    def testSameAsRegexp(self):
+        random.seed(42)
+        for i in range(200):
+            words = set(''.join(random.choice('abAB _-')
+                                for j in range(random.randint(1, 5)))
+                        for k in range(random.randint(1, 10)))
+            words.discard('')
+            m = self.plugin.AhoCorasick(words)
+            # Longest words first, so the regexp finds the longest match.
+            alternation = '(%s)' % '|'.join(
+                map(re.escape, sorted(words, key=len, reverse=True)))
+            for j in range(10):
+                s = ''.join(random.choice('abAB _-')
+                            for k in range(random.randint(0, 30)))
+                for boundaries in (False, True):
+                    if boundaries:
+                        regexp = re.compile(r'\b%s\b' % alternation, re.I)
+                    else:
+                        regexp = re.compile(alternation, re.I)
+                    self.assertEqual(
+                        list(m.iterMatches(s, boundaries)),
+                        [match.span() for match in regexp.finditer(s)],
+                        (words, s, boundaries))
+
+
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
 
@@ -130,6 +130,8 @@ class UserStat(ChannelStat):
         self.kicks += 1
 
 class StatsDB(plugins.ChannelUserDB):
+    journaled = True
+
     def __init__(self, *args, **kwargs):
         plugins.ChannelUserDB.__init__(self, *args, **kwargs)
 
@@ -149,6 +151,7 @@ class StatsDB(plugins.ChannelUserDB):
             if (channel, 'channelStats') not in self:
                 self[channel, 'channelStats'] = ChannelStat()
             self[channel, 'channelStats'].addMsg(msg)
+            self.markDirty(channel, 'channelStats')
             try:
                 if id is None:
                     id = ircdb.users.getUserId(msg.prefix)
@@ -157,6 +160,7 @@ class StatsDB(plugins.ChannelUserDB):
             if (channel, id) not in self:
                 self[channel, id] = UserStat()
             self[channel, id].addMsg(msg)
+            self.markDirty(channel, id)
 
     def getChannelStats(self, channel):
         return self[channel, 'channelStats']
@@ -203,6 +207,7 @@ class ChannelStats(callbacks.Plugin):
         oldUsers = self.db[channel, 'channelStats'].users
         newUsers = len(irc.state.channels[channel].users)
         self.db[channel, 'channelStats'].users = max(oldUsers, newUsers)
+        self.db.markDirty(channel, 'channelStats')
 
     def doJoin(self, irc, msg):
         self._setUsers(irc, msg.args[0])
@@ -219,10 +224,12 @@ class ChannelStats(callbacks.Plugin):
             if (channel, 'channelStats') not in self.db:
                 self.db[channel, 'channelStats'] = ChannelStat()
             self.db[channel, 'channelStats'].quits += 1
+            self.db.markDirty(channel, 'channelStats')
             if id is not None:
                 if (channel, id) not in self.db:
                     self.db[channel, id] = UserStat()
                 self.db[channel, id].quits += 1
+                self.db.markDirty(channel, id)
 
     def doKick(self, irc, msg):
         (channel, nick, _) = msg.args
@@ -234,6 +241,7 @@ class ChannelStats(callbacks.Plugin):
         if (channel, id) not in self.db:
             self.db[channel, id] = UserStat()
         self.db.channels[channel][id].kicked += 1
+        self.db.markDirty(channel, id)
 
     @internationalizeDocstring
     def stats(self, irc, msg, args, channel, name):
@@ -29,16 +29,18 @@
 # POSSIBILITY OF SUCH DAMAGE.
 ###
 
-import os
 import sys
 import time
 import string
+import threading
 
 import supybot.conf as conf
 import supybot.ircdb as ircdb
 import supybot.utils as utils
+import supybot.world as world
 from supybot.commands import *
 import supybot.plugins as plugins
+import supybot.sqlitedb as sqlitedb
 import supybot.ircutils as ircutils
 import supybot.callbacks as callbacks
 import supybot.httpserver as httpserver
@@ -49,7 +51,8 @@ _ = PluginInternationalization('Factoids')
 import sqlite3
 
 import re
-from supybot.utils.seq import dameraulevenshtein
+from supybot.utils.seq import dameraulevenshtein, \
+        unrestricteddameraulevenshtein
 
 def getFactoid(irc, msg, args, state):
     assert not state.channel
@@ -160,25 +163,28 @@ class FactoidsCallback(httpserver.SupyHTTPServerCallback):
                 if key not in factoids:
                     factoids[key] = {}
                 factoids[key][id_] = fact
-            content = ''
-            keys = sorted(factoids.keys())
-            for key in keys:
-                facts = factoids[key]
-                content += '<tr>'
-                content += ('<td rowspan="%i" class="key">'
-                                '<a name="%s" href="#%s">%s</a>'
-                           '</td>') % (len(facts), key, key, key)
-                for id_, fact in facts.items():
-                    content += '<td class="id">%i</td>' % id_
-                    content += '<td class="fact">%s</td>' % fact
-                    content += '</tr><tr>'
-                content = content[:-len('<tr>')]
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            if write_content:
-                self.write(httpserver.get_template('factoids/channel.html')%
-                        {'channel': channel, 'rows': content})
+            def rows():
+                for key in sorted(factoids):
+                    facts = factoids[key]
+                    cells = [('<td class="id">%i</td>'
+                              '<td class="fact">%s</td>') % (id_, fact)
+                             for (id_, fact) in facts.items()]
+                    yield ('<tr>'
+                           '<td rowspan="%i" class="key">'
+                               '<a name="%s" href="#%s">%s</a>'
+                           '</td>%s</tr>') % (len(facts), key, key, key,
+                                              '</tr><tr>'.join(cells))
+            # Stream the rows instead of building the whole page, as some
+            # channels have many factoids.
+            template = httpserver.get_template('factoids/channel.html')
+            (head, sep, tail) = template.partition('%(rows)s')
+            def page():
+                yield head % {'channel': channel}
+                yield from rows()
+                yield tail % {'channel': channel}
+            self.writeStream(handler, 200,
+                {'Content-type': 'text/html; charset=utf-8'}, page(),
+                write_content=write_content)
     def doPost(self, handler, path, form):
         if 'chan' in form:
             self.send_response(303)
@@ -191,11 +197,31 @@ class FactoidsCallback(httpserver.SupyHTTPServerCallback):
             self.end_headers()
             self.write('Missing field \'chan\'.')
 
-class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
+class FactoidsDb(sqlitedb.Connection):
+    """Connection to the factoids database of a channel, which remembers
+    whether it has full-text indexes."""
+    trigram = False
+
+class Factoids(callbacks.Plugin):
     """Provides the ability to show Factoids."""
     def __init__(self, irc):
         callbacks.Plugin.__init__(self, irc)
-        plugins.ChannelDBHandler.__init__(self)
+        self.dbs = sqlitedb.ChannelDatabases('Factoids.db', self.setupDb,
+                                             FactoidsDb)
+        # {database filename: {first letter: BK-tree of the keys}}, to
+        # suggest keys close to the ones users mistyped; while a tree is
+        # built, it is replaced by the list of the (added, key) changes
+        # to apply to it.
+        self._keyTrees = {}
+        self._keyTreesLock = threading.Lock()
+        # Held by the thread building a tree, so they are built one at a
+        # time instead of all taking the GIL from the main thread.
+        self._keyTreeBuildLock = threading.Lock()
+        # {channel: {relation id: uses}}, for the uses not written to the
+        # databases by _flushRanks() yet; keyed by plugins.getChannel(), as
+        # linked channels share their database
+        self._ranks = ircutils.IrcDict()
+        world.flushers.append(self._flushRanks)
         self._http_running = False
         conf.supybot.plugins.Factoids.web.enable.addCallback(self._doHttpConf)
         if self.registryValue('web.enable'):
@@ -218,33 +244,170 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
     def die(self):
         if self.registryValue('web.enable'):
             self._stopHttp()
+        world.flushers.remove(self._flushRanks)
+        self._flushRanks()
+        self.dbs.close()
         super(self.__class__, self).die()
 
-    def makeDb(self, filename):
-        if os.path.exists(filename):
-            db = sqlite3.connect(filename)
-            return db
-        db = sqlite3.connect(filename)
+    def makeFilename(self, channel):
+        return self.dbs.makeFilename(channel)
+
+    def getDb(self, channel):
+        """Use this to get a database for a specific channel."""
+        return self.dbs.connect(channel)
+
+    def setupDb(self, db):
+        # Each statement is committed on its own.
+        db.isolation_level = None
         cursor = db.cursor()
-        cursor.execute("""CREATE TABLE keys (
+        cursor.execute("""CREATE TABLE IF NOT EXISTS keys (
                           id INTEGER PRIMARY KEY,
                           key TEXT UNIQUE ON CONFLICT REPLACE
                           )""")
-        cursor.execute("""CREATE TABLE factoids (
+        cursor.execute("""CREATE TABLE IF NOT EXISTS factoids (
                           id INTEGER PRIMARY KEY,
                           added_by TEXT,
                           added_at TIMESTAMP,
                           fact TEXT UNIQUE ON CONFLICT REPLACE,
                           locked BOOLEAN
                           )""")
-        cursor.execute("""CREATE TABLE relations (
+        cursor.execute("""CREATE TABLE IF NOT EXISTS relations (
                           id INTEGER PRIMARY KEY,
                           key_id INTEGER,
                           fact_id INTEGER,
                           usage_count INTEGER
                           )""")
+        self._upgradeDb(db)
+
+    def _upgradeDb(self, db):
+        """Adds the indexes missing from databases created by older
+        versions of this plugin."""
+        # Makes the rows replaced because of UNIQUE ON CONFLICT REPLACE
+        # fire the DELETE triggers keeping the full-text indexes up to date.
+        db.execute("PRAGMA recursive_triggers = ON")
+        cursor = db.cursor()
+        cursor.execute("""CREATE INDEX IF NOT EXISTS keys_key_nocase
+                          ON keys (key COLLATE NOCASE)""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS relations_key_id
+                          ON relations (key_id)""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS relations_fact_id
+                          ON relations (fact_id)""")
         db.commit()
-        return db
+        cursor.execute("""SELECT name FROM sqlite_master WHERE name IN
+                          ('keys_trigram', 'factoids_trigram')""")
+        if len(cursor.fetchall()) == 2:
+            db.trigram = True
+            return
+        try:
+            cursor.execute("BEGIN")
+            for (table, column) in (('keys', 'key'), ('factoids', 'fact')):
+                index = table + '_trigram'
+                values = {'table': table, 'column': column, 'index': index}
+                cursor.execute("""CREATE VIRTUAL TABLE %(index)s
+                                  USING fts5(%(column)s, content=%(table)s,
+                                             content_rowid=id,
+                                             tokenize=trigram)""" % values)
+                cursor.execute("""INSERT INTO %(index)s (%(index)s)
+                                  VALUES ('rebuild')""" % values)
+                cursor.execute("""CREATE TRIGGER %(index)s_insert
+                                  AFTER INSERT ON %(table)s BEGIN
+                                    INSERT INTO %(index)s (rowid, %(column)s)
+                                    VALUES (new.id, new.%(column)s);
+                                  END""" % values)
+                cursor.execute("""CREATE TRIGGER %(index)s_delete
+                                  AFTER DELETE ON %(table)s BEGIN
+                                    INSERT INTO %(index)s
+                                      (%(index)s, rowid, %(column)s)
+                                    VALUES ('delete', old.id, old.%(column)s);
+                                  END""" % values)
+                cursor.execute("""CREATE TRIGGER %(index)s_update
+                                  AFTER UPDATE ON %(table)s BEGIN
+                                    INSERT INTO %(index)s
+                                      (%(index)s, rowid, %(column)s)
+                                    VALUES ('delete', old.id, old.%(column)s);
+                                    INSERT INTO %(index)s (rowid, %(column)s)
+                                    VALUES (new.id, new.%(column)s);
+                                  END""" % values)
+            db.commit()
+        except sqlite3.OperationalError as e:
+            # SQLite older than 3.34 or built without FTS5; searches fall
+            # back to scanning the tables.
+            db.rollback()
+            self.log.debug('Could not create trigram indexes: %s', e)
+            return
+        db.trigram = True
+
+    def _getKeyTree(self, db, key):
+        """Returns the BK-tree of the keys starting with the same letter as
+        `key`, or None if it is not built yet.  The first call starts
+        building it in a thread, as it takes seconds on large databases."""
+        letter = key[0].lower()
+        with self._keyTreesLock:
+            trees = self._keyTrees.setdefault(db.filename, {})
+            tree = trees.get(letter)
+            if tree is None:
+                trees[letter] = []
+                threading.Thread(target=self._buildKeyTree,
+                                 args=(db.filename, letter),
+                                 name='Factoids key tree of %s' % db.filename,
+                                 daemon=True).start()
+                return None
+            elif isinstance(tree, list):
+                return None
+            else:
+                return tree
+
+    def _buildKeyTree(self, filename, letter):
+        try:
+            # The connections of self.dbs belong to the main thread.
+            with self._keyTreeBuildLock:
+                db = sqlite3.connect(filename)
+                try:
+                    cursor = db.cursor()
+                    cursor.execute("""SELECT key FROM keys
+                                      WHERE substr(key, 1, 1) IN (?, ?)""",
+                                   (letter, letter.upper()))
+                    tree = utils.structures.BKTree(
+                        unrestricteddameraulevenshtein,
+                        (row[0] for row in cursor))
+                finally:
+                    db.close()
+        except Exception:
+            self.log.exception('Could not build the key tree of %s:',
+                               filename)
+            with self._keyTreesLock:
+                # Tried again on the next search
+                del self._keyTrees[filename][letter]
+            return
+        with self._keyTreesLock:
+            trees = self._keyTrees[filename]
+            # The changes made since the list was created are replayed in
+            # order; whether the query saw them or not, the tree ends up
+            # with the current keys.
+            for (added, key) in trees[letter]:
+                if added:
+                    tree.add(key)
+                else:
+                    tree.discard(key)
+            trees[letter] = tree
+
+    def _changeKeyTree(self, db, key, added):
+        with self._keyTreesLock:
+            tree = self._keyTrees.get(db.filename, {}).get(key[0].lower())
+            if tree is None:
+                return
+            elif isinstance(tree, list):
+                tree.append((added, key))
+            elif added:
+                tree.add(key)
+            else:
+                tree.discard(key)
+
+    def _addKey(self, db, key):
+        self._changeKeyTree(db, key, True)
+
+    def _discardKey(self, db, key):
+        self._changeKeyTree(db, key, False)
 
     def getCommandHelp(self, command, simpleSyntax=None):
         method = self.getCommandMethod(command)
@@ -294,6 +457,7 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         if len(keyid) == 0:
             cursor.execute("""INSERT INTO keys VALUES (NULL, ?)""", (key,))
             db.commit()
+            self._addKey(db, key)
         if len(factid) == 0:
             if ircdb.users.hasUser(msg.prefix):
                 name = ircdb.users.getUser(msg.prefix).name
@@ -332,7 +496,7 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         db = self.getDb(channel)
         cursor = db.cursor()
         cursor.execute("""SELECT factoids.fact, factoids.id, relations.id FROM factoids, keys, relations
-                          WHERE keys.key LIKE ? AND relations.key_id=keys.id AND relations.fact_id=factoids.id
+                          WHERE keys.key=? COLLATE NOCASE AND relations.key_id=keys.id AND relations.fact_id=factoids.id
                           ORDER BY factoids.id
                           LIMIT 20""", (key,))
         return cursor.fetchall()
@@ -350,37 +514,62 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
             
         db = self.getDb(channel)
         cursor = db.cursor()
-        cursor.execute("""SELECT key FROM keys WHERE key LIKE ?""", ('%' + key + '%',))
+        if db.trigram:
+            cursor.execute("""SELECT key FROM keys_trigram WHERE key LIKE ?""",
+                           ('%' + key + '%',))
+        else:
+            cursor.execute("""SELECT key FROM keys WHERE key LIKE ?""",
+                           ('%' + key + '%',))
         wildcardkeys = cursor.fetchall()
         if len(wildcardkeys) > 0:
             return [line[0] for line in wildcardkeys]
         
-        cursor.execute("""SELECT key FROM keys WHERE key LIKE ?""", (key[0] + '%',))
-        flkeys = cursor.fetchall()
-        if len(flkeys) == 0:
-            return []
-        flkeys = [line[0] for line in flkeys]
-        dl_metrics = [dameraulevenshtein(key, sourcekey) for sourcekey in flkeys]
-        dict_metrics = dict(list(zip(flkeys, dl_metrics)))
-        if min(dl_metrics) <= 2:
-            return [key for key,item in dict_metrics.items() if item <= 2]
-        if min(dl_metrics) <= 3:
-            return [key for key,item in dict_metrics.items() if item <= 3]
+        # The tree is indexed by the unrestricted distance, which is a
+        # metric and never greater than the optimal string alignment
+        # distance computed by dameraulevenshtein(), so it finds all the keys
+        # the latter considers close enough.
+        tree = self._getKeyTree(db, key)
+        if tree is None:
+            # Until the tree is built, all the keys starting with the same
+            # letter are compared.
+            cursor.execute("""SELECT key FROM keys
+                              WHERE substr(key, 1, 1) IN (?, ?)""",
+                           (key[0].lower(), key[0].upper()))
+            distances = [(dameraulevenshtein(key, row[0]), row[0])
+                         for row in cursor]
+        for maxdistance in (2, 3):
+            if tree is not None:
+                distances = [(dameraulevenshtein(key, sourcekey), sourcekey)
+                             for (_, sourcekey)
+                             in tree.search(key, maxdistance)]
+            keys = [sourcekey for (distance, sourcekey) in distances
+                    if distance <= maxdistance]
+            if keys:
+                return keys
         
         return []
                 
     def _updateRank(self, network, channel, factoids):
         if self.registryValue('keepRankInfo', channel, network):
+            # Written by _flushRanks(), so lookups do not each wait for a
+            # commit.
+            ranks = self._ranks.setdefault(plugins.getChannel(channel), {})
+            for (fact,factid,relationid) in factoids:
+                ranks[relationid] = ranks.get(relationid, 0) + 1
+
+    def _flushRanks(self):
+        """Writes the uses of factoids counted since the last call to the
+        databases, in one transaction per database."""
+        for channel in list(self._ranks):
+            ranks = self._ranks.pop(channel)
             db = self.getDb(channel)
             cursor = db.cursor()
-            for (fact,factid,relationid) in factoids:
-                cursor.execute("""SELECT relations.usage_count
-                          FROM relations
-                          WHERE relations.id=?""", (relationid,))
-                old_count = cursor.fetchall()[0][0]
-                cursor.execute("UPDATE relations SET usage_count=? WHERE id=?", 
-                            (old_count + 1, relationid,))
-                db.commit()
+            cursor.execute("BEGIN")
+            cursor.executemany("""UPDATE relations
+                                  SET usage_count=usage_count+? WHERE id=?""",
+                               [(uses, relationid)
+                                for (relationid, uses) in ranks.items()])
+            db.commit()
         
     def _replyFactoids(self, irc, msg, key, channel, factoids,
                        number=0, error=True, raw=False):
@@ -501,6 +690,7 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
                 cursor.execute("""INSERT INTO keys VALUES (NULL, ?)""",
                             (newkey,))
                 db.commit()
+                self._addKey(db, newkey)
                 cursor.execute("""SELECT id FROM keys WHERE key=?""", (newkey,))
                 newkey_info = cursor.fetchall()
             return newkey_info
@@ -563,12 +753,31 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
             number = self.registryValue('rankListLength', channel, irc.network)
         db = self.getDb(channel)
         cursor = db.cursor()
-        cursor.execute("""SELECT keys.key, relations.usage_count
+        ranks = self._ranks.get(plugins.getChannel(channel), {})
+        # At most len(ranks) of them may be overtaken by factoids with uses
+        # not written to the database yet.
+        cursor.execute("""SELECT relations.id, keys.key, relations.usage_count
                           FROM keys, relations
                           WHERE relations.key_id=keys.id
                           ORDER BY relations.usage_count DESC
-                          LIMIT ?""", (number,))
-        factkeys = cursor.fetchall()
+                          LIMIT ?""", (number + len(ranks),))
+        counts = {relationid: [key, usage_count]
+                  for (relationid, key, usage_count) in cursor.fetchall()}
+        for (relationid, uses) in ranks.items():
+            if relationid not in counts:
+                cursor.execute("""SELECT keys.key, relations.usage_count
+                                  FROM keys, relations
+                                  WHERE relations.id=? AND
+                                  relations.key_id=keys.id""",
+                               (relationid,))
+                result = cursor.fetchone()
+                if result is None:
+                    # Deleted since
+                    continue
+                counts[relationid] = list(result)
+            counts[relationid][1] += uses
+        factkeys = sorted(counts.items(), key=lambda t: (-t[1][1], t[0]))
+        factkeys = [key for (relationid, key) in factkeys[:number]]
         plain=False
         alpha=False
         for (option, arg) in optlist:
@@ -600,7 +809,8 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         cursor.execute("UPDATE factoids "
                 "SET locked=1 WHERE factoids.id IN "
                 "(SELECT fact_id FROM relations WHERE key_id IN "
-                "(SELECT id FROM keys WHERE key LIKE ?));", (key,))
+                "(SELECT id FROM keys WHERE key=? COLLATE NOCASE));",
+                (key,))
         db.commit()
         irc.replySuccess()
     lock = wrap(lock, ['channel', 'text'])
@@ -618,7 +828,8 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         cursor.execute("UPDATE factoids "
                 "SET locked=0 WHERE factoids.id IN "
                 "(SELECT fact_id FROM relations WHERE key_id IN "
-                "(SELECT id FROM keys WHERE key LIKE ?));", (key,))
+                "(SELECT id FROM keys WHERE key=? COLLATE NOCASE));",
+                (key,))
         db.commit()
         irc.replySuccess()
     unlock = wrap(unlock, ['channel', 'text'])
@@ -629,12 +840,19 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         for (keyid, factid, relationid) in relationlist:
             cursor.execute("""DELETE FROM relations where relations.id=?""",
                         (relationid,))
+            # Or they would count for the next relation with the same id
+            self._ranks.get(plugins.getChannel(channel), {}) \
+                .pop(relationid, None)
             db.commit()
 
             cursor.execute("""SELECT id FROM relations
                             WHERE relations.key_id=?""", (keyid,))
             remaining_key_relations = cursor.fetchall()
             if len(remaining_key_relations) == 0:
+                cursor.execute("""SELECT key FROM keys WHERE id=?""",
+                               (keyid,))
+                for (key,) in cursor.fetchall():
+                    self._discardKey(db, key)
                 cursor.execute("""DELETE FROM keys where id=?""", (keyid,))
 
             cursor.execute("""SELECT id FROM relations
@@ -676,7 +894,7 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         cursor = db.cursor()
         cursor.execute("""SELECT keys.id, factoids.id, relations.id
                         FROM keys, factoids, relations
-                        WHERE key LIKE ? AND
+                        WHERE key=? COLLATE NOCASE AND
                         relations.key_id=keys.id AND
                         relations.fact_id=factoids.id""", (key,))
         results = cursor.fetchall()
@@ -739,13 +957,14 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         """
         db = self.getDb(channel)
         cursor = db.cursor()
-        cursor.execute("SELECT id FROM keys WHERE key LIKE ?", (key,))
+        cursor.execute("SELECT id FROM keys WHERE key=? COLLATE NOCASE",
+                       (key,))
         results = cursor.fetchall()
         if len(results) == 0:
             irc.error(_('No factoid matches that key.'))
             return
         id = results[0][0]
-        cursor.execute("""SELECT factoids.added_by, factoids.added_at, factoids.locked, relations.usage_count
+        cursor.execute("""SELECT factoids.added_by, factoids.added_at, factoids.locked, relations.usage_count, relations.id
                         FROM factoids, relations
                         WHERE relations.key_id=? AND
                         relations.fact_id=factoids.id
@@ -753,7 +972,9 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         factoids = cursor.fetchall()
         L = []
         counter = 0
-        for (added_by, added_at, locked, usage_count) in factoids:
+        ranks = self._ranks.get(plugins.getChannel(channel), {})
+        for (added_by, added_at, locked, usage_count, relationid) in factoids:
+            usage_count += ranks.get(relationid, 0)
             counter += 1
             added_at = time.strftime(conf.supybot.reply.format.time(),
                                      time.localtime(int(added_at)))
@@ -779,7 +1000,7 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         cursor = db.cursor()
         cursor.execute("""SELECT factoids.id, factoids.fact
                         FROM keys, factoids, relations
-                        WHERE keys.key LIKE ? AND
+                        WHERE keys.key=? COLLATE NOCASE AND
                         keys.id=relations.key_id AND
                         factoids.id=relations.fact_id""", (key,))
         results = cursor.fetchall()
@@ -797,6 +1018,18 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
                            'factoidId', 'regexpReplacer'])
 
     _sqlTrans = utils.str.MultipleReplacer({'*': '%', '?': '_'})
+    def _expandTarget(self, db, sql, target):
+        if db.trigram:
+            # Matches the globs with the trigram indexes instead of scanning
+            # the whole table.
+            (table, column) = target.split('.')
+            sql = sql.replace('TARGET_LIKE',
+                              '%s.id IN (SELECT rowid FROM %s_trigram '
+                              'WHERE %s LIKE ?)' % (table, table, column))
+        else:
+            sql = sql.replace('TARGET_LIKE', 'TARGET LIKE ?')
+        return sql.replace('TARGET', target)
+
     @internationalizeDocstring
     def search(self, irc, msg, args, channel, optlist, globs):
         """[<channel>] [--values] [--regexp <value>] [--author <username>] [<glob> ...]
@@ -811,6 +1044,9 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         join_factoids = False
         formats = []
         criteria = []
+        # Python functions called for each row, only after the indexed
+        # criteria have filtered them out
+        predicates = []
         join_criteria = []
         target = 'keys.key'
         predicateName = 'p'
@@ -820,7 +1056,7 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
                 target = 'factoids.fact'
                 join_factoids = True
             elif option == 'regexp':
-                criteria.append('%s(TARGET)' % predicateName)
+                predicates.append('%s(TARGET)' % predicateName)
                 def p(s, r=arg):
                     return int(bool(r.search(s)))
                 db.create_function(predicateName, 1, p)
@@ -830,8 +1066,9 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
                 criteria.append('factoids.added_by=?')
                 formats.append(arg)
         for glob in globs:
-            criteria.append('TARGET LIKE ?')
+            criteria.append('TARGET_LIKE')
             formats.append(self._sqlTrans(glob))
+        criteria.extend(predicates)
 
         def _join_factoids():
             if 'factoids' not in tables:
@@ -847,7 +1084,7 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
         sql = """SELECT DISTINCT keys.key FROM %s WHERE %s""" % \
               (', '.join(tables), ' AND '.join(criteria + join_criteria))
         sql = sql + " ORDER BY keys.key"
-        sql = sql.replace('TARGET', target)
+        sql = self._expandTarget(db, sql, target)
         cursor.execute(sql, formats)
 
         if cursor.rowcount == 0:
@@ -883,7 +1120,7 @@ class Factoids(callbacks.Plugin, plugins.ChannelDBHandler):
             """ % \
                   (' AND '.join(criteria), ', '.join(tables),
                    ' AND '.join(['keys.key=?', *join_criteria]))
-            sql = sql.replace('TARGET', target)
+            sql = self._expandTarget(db, sql, target)
             formats.append(key)
             cursor.execute(sql, formats)
             factoids = cursor.fetchall()
@@ -31,7 +31,9 @@
 
 from supybot.test import *
 import supybot.conf as conf
+import supybot.httpserver as httpserver
 
+import time
 import sqlite3
 
 class FactoidsTestCase(ChannelPluginTestCase):
@@ -225,6 +227,53 @@ class FactoidsTestCase(ChannelPluginTestCase):
         self.assertRegexp('factoids rank --plain --alpha', 'foo, moo')
         self.assertResponse('factoids rank --plain 1', 'moo')
 
+    def testRankFlush(self):
+        cb = self.irc.getCallback('Factoids')
+        db = cb.getDb(self.channel)
+        def usage_counts():
+            return db.execute(
+                'SELECT usage_count FROM relations ORDER BY id').fetchall()
+        self.assertEqual(db.execute('PRAGMA journal_mode').fetchone(),
+                         ('wal',))
+        self.assertNotError('learn foo is bar')
+        self.assertNotError('learn moo is cow')
+        self.assertNotError('whatis moo')
+        self.assertNotError('whatis moo')
+        self.assertEqual(usage_counts(), [(0,), (0,)])
+        self.assertRegexp('factoids rank', r'#1 moo \(2\), #2 foo \(0\)')
+        self.assertRegexp('info moo', 'recalled 2 times')
+        self.assertNotError('flush')
+        self.assertEqual(usage_counts(), [(0,), (2,)])
+        self.assertRegexp('factoids rank', r'#1 moo \(2\), #2 foo \(0\)')
+
+        self.assertNotError('whatis foo')
+        self.assertNotError('whatis foo')
+        self.assertNotError('whatis foo')
+        self.assertResponse('factoids rank 1', '#1 foo (3)')
+        self.assertRegexp('info foo', 'recalled 3 times')
+        self.assertNotError('flush')
+        self.assertEqual(usage_counts(), [(3,), (2,)])
+
+        # The counts of removed relations are not given to new ones
+        self.assertNotError('whatis moo')
+        self.assertNotError('forget moo')
+        self.assertNotError('learn zoo is zap')
+        self.assertNotError('flush')
+        self.assertRegexp('info zoo', 'recalled 0 times')
+
+    def testRankLinkedChannels(self):
+        with conf.supybot.databases.plugins.channelSpecific.context(False):
+            self.assertNotError('learn #a foo is bar')
+            self.assertNotError('learn #a moo is cow')
+            self.assertNotError('whatis #a foo')
+            self.assertNotError('whatis #b foo')
+            self.assertRegexp('factoids rank #b', r'#1 foo \(2\)')
+            self.assertRegexp('info #a foo', 'recalled 2 times')
+            self.assertNotError('forget #b foo')
+            self.assertRegexp('factoids rank #a', r'#1 moo \(0\)')
+            self.assertNotError('flush')
+            self.assertRegexp('factoids rank #a', r'#1 moo \(0\)')
+
     def testQuoteHandling(self):
         self.assertNotError('learn foo is "\\"bar\\""')
         self.assertRegexp('whatis foo', r'"bar"')
@@ -234,5 +283,109 @@ class FactoidsTestCase(ChannelPluginTestCase):
         self.assertNotError('lock foo')
         self.assertNotError('unlock foo')
 
+    def testIndexesFollowChanges(self):
+        self.assertNotError('learn water is wet')
+        self.assertNotError('learn fire is hot')
+        self.assertResponse('factoids search --values wet', 'water is wet')
+        self.assertNotError('change water 1 s/wet/damp/')
+        self.assertResponse('factoids search --values wet',
+                            'No keys matched that query.')
+        self.assertResponse('factoids search --values dam', 'water is damp')
+        # Replaces the other fact, as facts are unique
+        self.assertNotError('change fire 1 s/hot/damp/')
+        self.assertResponse('factoids search --values dam', 'fire is damp')
+        self.assertNotError('forget fire')
+        self.assertResponse('factoids search --values dam',
+                            'No keys matched that query.')
+        self.assertResponse('factoids search fir*',
+                            'No keys matched that query.')
+
+        self.assertRegexp('whatis wated', 'water')
+        self.assertNotError('learn waiter is a person')
+        self.assertRegexp('whatis wated', "'waiter', 'water'")
+        self.assertNotError('alias waiter wader')
+        self.assertRegexp('whatis wated', "'wader', 'waiter', 'water'")
+        self.assertNotError('forget waiter')
+        self.assertRegexp('whatis wated', "'wader', 'water'")
+        self.assertNotRegexp('whatis wated', 'waiter')
+        self.assertNotError('forget wader')
+        self.assertNotError('forget water')
+        self.assertError('whatis wated')
+
+    def testKeyTreeFollowsChanges(self):
+        cb = self.irc.getCallback('Factoids')
+        db = cb.getDb(self.channel)
+        self.assertNotError('learn water is wet')
+        self.assertNotError('learn waiter is a person')
+        # Starts building the tree, and falls back to comparing all the keys
+        self.assertRegexp('whatis wated', "'waiter', 'water'")
+        # Replayed on the tree once built
+        self.assertNotError('alias waiter wader')
+        self.assertNotError('forget waiter')
+        timeout = time.time() + 10
+        while cb._getKeyTree(db, 'w') is None:
+            self.assertLess(time.time(), timeout)
+            time.sleep(0.01)
+        self.assertEqual(sorted(cb._getKeyTree(db, 'w')), ['wader', 'water'])
+        self.assertRegexp('whatis wated', "'wader', 'water'")
+        self.assertNotError('learn wafer is thin')
+        self.assertRegexp('whatis wated', "'wader', 'wafer', 'water'")
+
+    def testUpgradeDatabase(self):
+        cb = self.irc.getCallback('Factoids')
+        filename = cb.makeFilename(self.channel)
+        db = sqlite3.connect(filename)
+        db.executescript("""
+            CREATE TABLE keys (id INTEGER PRIMARY KEY,
+                               key TEXT UNIQUE ON CONFLICT REPLACE);
+            CREATE TABLE factoids (id INTEGER PRIMARY KEY, added_by TEXT,
+                                   added_at TIMESTAMP,
+                                   fact TEXT UNIQUE ON CONFLICT REPLACE,
+                                   locked BOOLEAN);
+            CREATE TABLE relations (id INTEGER PRIMARY KEY, key_id INTEGER,
+                                    fact_id INTEGER, usage_count INTEGER);
+            INSERT INTO keys VALUES (1, 'Water');
+            INSERT INTO factoids VALUES (1, 'test', 0, 'wet', 0);
+            INSERT INTO relations VALUES (1, 1, 1, 0);
+            """)
+        db.close()
+        self.assertRegexp('whatis water', 'wet')
+        self.assertResponse('factoids search --values we', 'Water is wet')
+        self.assertResponse('factoids search wat*', 'Water is wet')
+        self.assertRegexp('whatis wated', 'Water')
+        self.assertNotError('forget water')
+        self.assertResponse('factoids search --values we',
+                            'No keys matched that query.')
+
+
+class FactoidsWebTestCase(ChannelHTTPPluginTestCase):
+    plugins = ('Factoids',)
+    config = {
+        'servers.http.keepAlive': True,
+        'plugins.Factoids.web.enable': False,
+        'plugins.Factoids.web.channel': True,
+    }
+
+    def setUp(self):
+        super(ChannelHTTPPluginTestCase, self).setUp()
+        httpserver.startServer()
+
+    def tearDown(self):
+        httpserver.stopServer()
+        super(ChannelHTTPPluginTestCase, self).tearDown()
+
+    def testChannelPage(self):
+        self.assertNotError('config plugins.Factoids.web.enable True')
+        self.assertNotError('learn foo is bar')
+        self.assertNotError('learn foo is baz')
+        self.assertNotError('learn qux is quux')
+        (respCode, body) = self.request('/factoids/%23test/')
+        self.assertEqual(respCode, 200)
+        self.assertIn(b'<h1>Factoids of #test</h1>', body)
+        self.assertIn(b'<td class="fact">bar</td></tr>'
+                      b'<tr><td class="id">2</td>', body)
+        self.assertIn(b'<td class="fact">quux</td></tr>\n    </table>',
+                      body)
+
 
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
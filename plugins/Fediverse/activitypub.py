@@ -30,12 +30,20 @@
 
 import os
 import json
+import time
 import email
+import queue
 import base64
+import socket
+import hashlib
 import functools
+import threading
 import contextlib
+import collections
+import multiprocessing
 import urllib.error
 import urllib.parse
+import concurrent.futures
 import xml.etree.ElementTree as ET
 
 from cryptography.hazmat.backends import default_backend
@@ -45,13 +53,28 @@ from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.asymmetric.rsa import generate_private_key
 
 
-from supybot import commands, conf
+from supybot import commands, conf, registry, world
 from supybot.utils import gen, web
 
 
 XRD_URI = "{http://docs.oasis-open.org/ns/xri/xrd-1.0}"
 ACTIVITY_MIMETYPE = "application/activity+json"
 
+SANDBOX_TIMEOUT = 20
+SANDBOX_HEAP_SIZE = 1024 * 1024 * 1024
+
+MAX_SANDBOX_WORKERS = 4
+"""Maximum number of processes running sandboxed functions at the same
+time."""
+
+MAX_CONCURRENT_REQUESTS = 8
+"""Maximum number of requests a sandbox process sends at the same time."""
+
+SIGNATURE_LIFETIME = 5 * 60
+"""Number of seconds during which the HTTP Signature of a request is reused
+for requests with the same headers. Servers accept signatures whose Date
+header is much older than this (eg. 12 hours for Mastodon)."""
+
 
 class ActivityPubError(Exception):
     pass
@@ -73,25 +96,165 @@ class ActorNotFound(ActivityPubError):
     pass
 
 
+def _run_worker(requests, responses, heap_size):
+    """Main loop of :class:`SandboxWorker` processes."""
+    while True:
+        (name, args, kwargs) = requests.get()
+        f = globals()[name].__wrapped__
+        commands._process_target(f, responses, heap_size, *args, **kwargs)
+
+
+class SandboxWorker:
+    """A process running functions decorated with :func:`sandbox` one
+    after the other, so each call does not need to start a new process.
+
+    It runs with a copy of the state of the bot when it was started, so
+    ``generation`` is the value of :data:`supybot.registry._generation` at
+    that time."""
+
+    def __init__(self):
+        self.generation = registry._generation
+        context = world.SUPYPROCESS_MULTIPROCESSING_CONTEXT
+        self.requests = context.Queue()
+        self.responses = context.Queue()
+        self.process = world.SupyProcess(
+            target=_run_worker,
+            args=(self.requests, self.responses, SANDBOX_HEAP_SIZE),
+            name="Process #%s (for Fediverse sandbox)"
+            % world.processesSpawned,
+            daemon=True,
+        )
+        self.process.start()
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def run(self, f, args, kwargs, timeout):
+        """Runs ``f(*args, **kwargs)`` in the process and returns its result,
+        or None if the process died.
+
+        The process is stopped if it does not return within ``timeout``
+        seconds, and :exc:`supybot.commands.ProcessTimeoutError` is
+        raised."""
+        self.requests.put((f.__name__, args, kwargs))
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.stop()
+                raise commands.ProcessTimeoutError(
+                    "%s aborted due to timeout." % self.process.name
+                )
+            try:
+                (raised, value) = self.responses.get(timeout=min(remaining, 1))
+            except queue.Empty:
+                if not self.process.is_alive():
+                    # eg. killed by the OOM killer
+                    self.stop()
+                    return None
+                continue
+            if raised:
+                raise value
+            return value
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.requests.close()
+        self.responses.close()
+
+
+class SandboxPool:
+    """Keeps the :class:`SandboxWorker` processes running sandboxed
+    functions, so they are reused by later calls; and starts new ones
+    (up to :data:`MAX_SANDBOX_WORKERS`) when they are all busy.
+
+    Workers started before a registry value was set are replaced, as they
+    would not see it; eg. supybot.protocols.http.proxy, which changes the
+    urllib opener of the process that sets it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(MAX_SANDBOX_WORKERS)
+        self._idle = []
+
+    def run(self, f, args, kwargs, timeout):
+        with self._semaphore:
+            with self._lock:
+                worker = self._idle.pop() if self._idle else None
+            if worker is not None and (
+                not worker.is_alive()
+                or worker.generation != registry._generation
+            ):
+                worker.stop()
+                worker = None
+            if worker is None:
+                worker = SandboxWorker()
+            try:
+                result = worker.run(f, args, kwargs, timeout)
+            except commands.ProcessTimeoutError:
+                raise
+            except MemoryError:
+                # Whatever is left of its heap is not worth keeping
+                worker.stop()
+                raise
+            except Exception:
+                self._release(worker)
+                raise
+            else:
+                self._release(worker)
+                return result
+
+    def _release(self, worker):
+        if worker.is_alive():
+            with self._lock:
+                self._idle.append(worker)
+
+    def stop(self):
+        """Stops the processes that are not running a function."""
+        with self._lock:
+            (workers, self._idle) = (self._idle, [])
+        for worker in workers:
+            worker.stop()
+
+
+workers = SandboxPool()
+
+
+def stop_workers():
+    workers.stop()
+
+
 def sandbox(f):
     """Runs a function in a process with limited memory and a timeout
     to prevent XML memory bombs
     <https://docs.python.org/3/library/xml.html#xml-vulnerabilities>,
     or exhausting resources on excessively long files, slow servers etc.
+
+    When possible, the process is one of the :data:`workers`, so it is
+    reused by later calls instead of starting a new one for each of them.
     """
 
     @functools.wraps(f)
     def newf(*args, **kwargs):
         try:
-            return commands.process(
-                f,
-                *args,
-                timeout=20,
-                heap_size=1024 * 1024 * 1024,
-                pn="Fediverse",
-                cn=f.__name__,
-                **kwargs
-            )
+            if world.disableMultiprocessing or not isinstance(
+                world.SUPYPROCESS_MULTIPROCESSING_CONTEXT,
+                multiprocessing.context.ForkContext,
+            ):
+                # Workers need to find the function in their copy of this
+                # module.
+                return commands.process(
+                    f,
+                    *args,
+                    timeout=SANDBOX_TIMEOUT,
+                    heap_size=SANDBOX_HEAP_SIZE,
+                    pn="Fediverse",
+                    cn=f.__name__,
+                    **kwargs
+                )
+            return workers.run(f, args, kwargs, timeout=SANDBOX_TIMEOUT)
         except commands.ProcessTimeoutError:
             raise web.Error("The server took too much time to answer the request.")
         except MemoryError:
@@ -100,6 +263,178 @@ def sandbox(f):
     return newf
 
 
+def _get_header(headers, name):
+    name = name.lower()
+    for (header_name, value) in headers.items():
+        if header_name.lower() == name:
+            return value
+    return None
+
+
+def _get_expiry(headers, now):
+    """Returns the time until which a response with the given headers
+    (whose names are lower-case) is fresh, or None if it must not be
+    stored."""
+    directives = {}
+    for directive in headers.get("cache-control", "").split(","):
+        (name, _, value) = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+    if "no-store" in directives or headers.get("vary", "").strip() == "*":
+        return None
+    if "no-cache" in directives:
+        return now
+    try:
+        age = int(headers.get("age", 0))
+    except ValueError:
+        age = 0
+    if "max-age" in directives:
+        try:
+            return now + int(directives["max-age"]) - age
+        except ValueError:
+            return now
+    if "expires" in headers:
+        try:
+            expires = email.utils.parsedate_to_datetime(headers["expires"])
+            if "date" in headers:
+                date = email.utils.parsedate_to_datetime(headers["date"])
+                return now + (expires - date).total_seconds()
+            return expires.timestamp()
+        except (TypeError, ValueError):
+            # Invalid dates mean the response is already expired.
+            return now
+    return now
+
+
+class ResourceCache:
+    """On-disk cache of the responses to GET requests, whose size is
+    bounded by ``supybot.plugins.Fediverse.cache.maximumSize``.
+
+    Responses are reused and revalidated according to their Cache-Control,
+    Expires, ETag and Last-Modified headers, and the least recently used
+    ones are removed first when the cache is full."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._directory = None
+        # {key: size}, least recently used first
+        self._entries = collections.OrderedDict()
+        self._size = 0
+
+    def _get_directory(self):
+        """Returns the directory of the cache, and indexes its files if
+        this is a different directory than in the last call."""
+        directory = conf.supybot.directories.data.dirize("Fediverse/cache")
+        if directory != self._directory:
+            os.makedirs(directory, exist_ok=True)
+            files = []
+            for name in os.listdir(directory):
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, name, stat.st_size))
+            files.sort()
+            self._entries = collections.OrderedDict(
+                (name, size) for (_, name, size) in files
+            )
+            self._size = sum(self._entries.values())
+            self._directory = directory
+        return directory
+
+    @staticmethod
+    def _get_key(url, headers):
+        accept = _get_header(headers, "Accept") or ""
+        return hashlib.sha256(("%s\n%s" % (url, accept)).encode()).hexdigest()
+
+    def _remove(self, directory, key):
+        self._size -= self._entries.pop(key, 0)
+        try:
+            os.unlink(os.path.join(directory, key))
+        except OSError:
+            pass
+
+    def get(self, url, headers):
+        """Returns ``(metadata, content)`` for the response to a GET request
+        to ``url`` with the given headers, or None if it is not cached.
+
+        ``metadata`` is a dict with the time until which the response is
+        fresh as ``expires``, and its ``etag`` and ``last_modified`` (which
+        may be None)."""
+        maximum_size = conf.supybot.plugins.Fediverse.cache.maximumSize()
+        with self._lock:
+            if not maximum_size:
+                return None
+            directory = self._get_directory()
+            key = self._get_key(url, headers)
+            if key not in self._entries:
+                return None
+            try:
+                with open(os.path.join(directory, key), "rb") as fd:
+                    metadata = json.loads(fd.readline().decode())
+                    content = fd.read()
+            except (OSError, ValueError):
+                self._remove(directory, key)
+                return None
+            if metadata.get("url") != url:
+                return None
+            self._entries.move_to_end(key)
+            return (metadata, content)
+
+    def store(self, url, headers, response_headers, content):
+        """Stores the response to a GET request to ``url`` with the given
+        headers, if its headers allow it. The names of
+        ``response_headers`` must be lower-case."""
+        maximum_size = conf.supybot.plugins.Fediverse.cache.maximumSize()
+        expires = _get_expiry(response_headers, time.time())
+        metadata = {
+            "url": url,
+            "expires": expires,
+            "etag": response_headers.get("etag"),
+            "last_modified": response_headers.get("last-modified"),
+        }
+        data = json.dumps(metadata).encode() + b"\n" + content
+        with self._lock:
+            if not maximum_size:
+                return
+            directory = self._get_directory()
+            key = self._get_key(url, headers)
+            if (
+                expires is None
+                or len(data) > maximum_size
+                or (
+                    expires <= time.time()
+                    and not metadata["etag"]
+                    and not metadata["last_modified"]
+                )
+            ):
+                # Also removes the previous response, which is outdated.
+                if key in self._entries:
+                    self._remove(directory, key)
+                return
+            path = os.path.join(directory, key)
+            try:
+                with open(path + ".tmp", "wb") as fd:
+                    fd.write(data)
+                os.replace(path + ".tmp", path)
+            except OSError:
+                return
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self._size > maximum_size:
+                self._remove(directory, next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            directory = self._get_directory()
+            for key in list(self._entries):
+                self._remove(directory, key)
+
+
+cache = ResourceCache()
+
+
 @contextlib.contextmanager
 def convert_exceptions(to_class, msg="", from_none=False):
     try:
@@ -112,19 +447,142 @@ def convert_exceptions(to_class, msg="", from_none=False):
             raise to_class(arg) from e
 
 
-@sandbox
-def _get_webfinger_url(hostname):
+def _fetch(url, headers, data):
+    """Sends a request, and returns the ``(status, headers, content)`` of
+    the response; with lower-case header names."""
     try:
-        doc = ET.fromstring(
-            web.getUrlContent("https://%s/.well-known/host-meta" % hostname)
-        )
+        fd = web.getUrlFd(url, headers=headers, data=data)
+    except web.Error as e:
+        cause = e.__cause__
+        if isinstance(cause, urllib.error.HTTPError) and cause.code == 304:
+            # Not Modified, in response to a conditional request
+            return (304, _lower_header_names(cause.headers), b"")
+        raise
+    try:
+        content = fd.read()
+    except socket.timeout:
+        raise web.Error(web.TIMED_OUT)
+    finally:
+        fd.close()
+    return (fd.status, _lower_header_names(fd.headers), content)
+
+
+def _lower_header_names(headers):
+    lowered = {}
+    for (name, value) in headers.items():
+        name = name.lower()
+        if name in lowered:
+            lowered[name] += ", " + value
+        else:
+            lowered[name] = value
+    return lowered
+
 
-        for link in doc.iter(XRD_URI + "Link"):
-            if link.attrib["rel"] == "lrdd":
-                return link.attrib["template"]
-    except web.Error:
+@sandbox
+def _fetch_all(requests):
+    """Sends the ``(url, headers, data)`` requests, concurrently, and
+    returns a list of ``(raised, value)`` where ``value`` is the exception
+    raised by the request, or the value returned by :func:`_fetch`."""
+
+    def fetch(request):
+        try:
+            return (False, _fetch(*request))
+        except Exception as e:
+            return (True, e)
+
+    if len(requests) == 1:
+        return [fetch(requests[0])]
+    max_workers = min(len(requests), MAX_CONCURRENT_REQUESTS)
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        return list(executor.map(fetch, requests))
+
+
+def _get_all(urls, headers=None, signed=True):
+    """Sends GET requests to the ``urls``, concurrently, and returns a dict
+    from each of them to the content of the response, or to the exception
+    raised while fetching it.
+
+    Responses are taken from the :data:`cache` when they are fresh, and
+    revalidated when they are stale and can be."""
+    results = {}
+    requests = []
+    for url in dict.fromkeys(urls):
+        if signed:
+            request_headers = gen.InsensitivePreservingDict(
+                {**web.defaultHeaders, **(headers or {})}
+            )
+        else:
+            request_headers = gen.InsensitivePreservingDict(
+                headers or web.defaultHeaders
+            )
+        cached = cache.get(url, request_headers)
+        if cached:
+            (metadata, content) = cached
+            if metadata["expires"] > time.time():
+                results[url] = content
+                continue
+            if metadata["etag"]:
+                request_headers["If-None-Match"] = metadata["etag"]
+            if metadata["last_modified"]:
+                request_headers["If-Modified-Since"] = metadata[
+                    "last_modified"
+                ]
+        if signed:
+            _sign("get", url, request_headers)
+        requests.append((url, request_headers, cached))
+
+    if not requests:
+        return results
+
+    responses = _fetch_all(
+        [
+            (url, dict(request_headers), None)
+            for (url, request_headers, _) in requests
+        ]
+    )
+    if responses is None:
+        raise web.Error("The process fetching the page died.")
+
+    for ((url, request_headers, cached), (raised, value)) in zip(
+        requests, responses
+    ):
+        if raised:
+            results[url] = value
+            continue
+        (status, response_headers, content) = value
+        if status == 304:
+            if not cached:
+                results[url] = web.Error("Unexpected 304 Not Modified")
+                continue
+            (metadata, content) = cached
+            # The response to a conditional request may omit these headers
+            response_headers.setdefault("etag", metadata["etag"])
+            response_headers.setdefault(
+                "last-modified", metadata["last_modified"]
+            )
+        cache.store(url, request_headers, response_headers, content)
+        results[url] = content
+    return results
+
+
+@sandbox
+def _parse_host_meta(content):
+    doc = ET.fromstring(content)
+
+    for link in doc.iter(XRD_URI + "Link"):
+        if link.attrib["rel"] == "lrdd":
+            return link.attrib["template"]
+
+
+def _get_webfinger_url(hostname):
+    url = "https://%s/.well-known/host-meta" % hostname
+    content = _get_all([url], signed=False)[url]
+    if isinstance(content, web.Error):
         # Fall back to the default Webfinger URL
         return "https://%s/.well-known/webfinger?resource={uri}" % hostname
+    elif isinstance(content, Exception):
+        raise content
+    return _parse_host_meta(content)
 
 
 def has_webfinger_support(hostname):
@@ -174,13 +632,14 @@ def webfinger(hostname, uri):
 
     return _webfinger_from_template(template, uri)
 
-@sandbox
 def _webfinger_from_template(template, uri):
+    url = template.replace("{uri}", uri)
+    content = _get_all([url], {"Accept": "application/json"}, signed=False)[
+        url
+    ]
     with convert_exceptions(ActorNotFound, f"Could not get actor {uri}: "):
-        content = web.getUrlContent(
-            template.replace("{uri}", uri),
-            headers={"Accept": "application/json"},
-        )
+        if isinstance(content, Exception):
+            raise content
 
     with convert_exceptions(WebfingerError, "Invalid JSON: ", True):
         return json.loads(content.decode())
@@ -201,6 +660,7 @@ def _generate_private_key():
 
 
 def _get_private_key():
+    global _private_key
     path = conf.supybot.directories.data.dirize("Fediverse/instance_key.pem")
     if not os.path.isfile(path):
         os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -213,10 +673,19 @@ def _get_private_key():
         with open(path, "wb") as fd:
             fd.write(pem)
 
-    with open(path, "rb") as fd:
-        return serialization.load_pem_private_key(
-            fd.read(), password=None, backend=default_backend()
-        )
+    stamp = (path, os.stat(path).st_mtime_ns)
+    (cached_stamp, key) = _private_key
+    if cached_stamp != stamp:
+        with open(path, "rb") as fd:
+            key = serialization.load_pem_private_key(
+                fd.read(), password=None, backend=default_backend()
+            )
+        _private_key = (stamp, key)
+    return key
+
+
+# ((path, modification time), key) of the last key read by _get_private_key
+_private_key = (None, None)
 
 
 def get_public_key():
@@ -230,17 +699,34 @@ def get_public_key_pem():
     )
 
 
-@sandbox
-def signed_request(url, headers=None, data=None):
-    method = "get" if data is None else "post"
-    instance_actor_url = get_instance_actor_url()
-    headers = gen.InsensitivePreservingDict(
-        {**web.defaultHeaders, **(headers or {})}
-    )
-
-    if "Date" not in headers:
-        headers["Date"] = email.utils.formatdate(usegmt=True)
+def _sign(method, url, headers):
+    """Adds the Date and Signature headers to the headers of a request.
 
+    The signature of a previous request with the same method, URL, and
+    headers is reused if it is less than :data:`SIGNATURE_LIFETIME` seconds
+    old."""
+    instance_actor_url = get_instance_actor_url()
+    if "Date" in headers:
+        key = None
+    else:
+        key = (
+            instance_actor_url,
+            method,
+            url,
+            tuple(sorted((k.lower(), v) for (k, v) in headers.items())),
+        )
+        now = time.time()
+        with _signatures_lock:
+            cached = _signatures.get(key)
+            if cached and cached[0] > now:
+                (_, date, signature) = cached
+                headers["Date"] = date
+                if signature:
+                    headers["Signature"] = signature
+                return
+        headers["Date"] = email.utils.formatdate(now, usegmt=True)
+
+    signature = None
     if instance_actor_url:
         parsed_url = urllib.parse.urlparse(url)
         signed_headers = [
@@ -252,18 +738,60 @@ def signed_request(url, headers=None, data=None):
         signed_text = "\n".join("%s: %s" % header for header in signed_headers)
 
         private_key = _get_private_key()
-        signature = private_key.sign(
+        signed = private_key.sign(
             signed_text.encode(), padding.PKCS1v15(), hashes.SHA256()
         )
 
-        headers["Signature"] = (
+        signature = (
             'keyId="%s#main-key",' % instance_actor_url
             + 'headers="%s",' % " ".join(k for (k, v) in signed_headers)
-            + 'signature="%s"' % base64.b64encode(signature).decode()
+            + 'signature="%s"' % base64.b64encode(signed).decode()
         )
+        headers["Signature"] = signature
+
+    if key is not None:
+        with _signatures_lock:
+            if len(_signatures) >= _max_signatures:
+                for (old_key, (expiry, _, _)) in list(_signatures.items()):
+                    if expiry <= now:
+                        del _signatures[old_key]
+                if len(_signatures) >= _max_signatures:
+                    _signatures.clear()
+            _signatures[key] = (
+                now + SIGNATURE_LIFETIME,
+                headers["Date"],
+                signature,
+            )
 
+
+# {(actor, method, url, headers): (expiry, date, signature)}
+_signatures = {}
+_signatures_lock = threading.Lock()
+_max_signatures = 1000
+
+
+def signed_request(url, headers=None, data=None):
+    if data is None:
+        content = _get_all([url], headers)[url]
+        with convert_exceptions(
+            ActivityPubProtocolError, f"Could not get {url}: "
+        ):
+            if isinstance(content, Exception):
+                raise content
+        return content
+
+    headers = gen.InsensitivePreservingDict(
+        {**web.defaultHeaders, **(headers or {})}
+    )
+    _sign("post", url, headers)
+    responses = _fetch_all([(url, dict(headers), data)])
     with convert_exceptions(ActivityPubProtocolError, f"Could not get {url}: "):
-        return web.getUrlContent(url, headers=headers, data=data)
+        if responses is None:
+            raise web.Error("The process fetching the page died.")
+        [(raised, value)] = responses
+        if raised:
+            raise value
+        return value[2]
 
 
 def actor_url(localuser, hostname):
@@ -288,3 +816,26 @@ def get_resource_from_url(url):
 
     with convert_exceptions(ActivityPubProtocolError, "Invalid JSON: ", True):
         return json.loads(content.decode())
+
+
+def get_resources_from_urls(urls):
+    """Fetches the resources at the ``urls``, concurrently.
+
+    Returns a dict from each of the ``urls`` to its resource, or to the
+    :exc:`ActivityPubError` raised while fetching it."""
+    resources = {}
+    contents = _get_all(urls, {"Accept": ACTIVITY_MIMETYPE})
+    for (url, content) in contents.items():
+        try:
+            with convert_exceptions(
+                ActivityPubProtocolError, f"Could not get {url}: "
+            ):
+                if isinstance(content, Exception):
+                    raise content
+            with convert_exceptions(
+                ActivityPubProtocolError, "Invalid JSON: ", True
+            ):
+                resources[url] = json.loads(content.decode())
+        except ActivityPubError as e:
+            resources[url] = e
+    return resources
@@ -101,5 +101,21 @@ conf.registerChannelValue(
     ),
 )
 
+conf.registerGroup(Fediverse, "cache")
+conf.registerGlobalValue(
+    Fediverse.cache,
+    "maximumSize",
+    registry.NonNegativeInteger(
+        10 * 1024 * 1024,
+        _(
+            """Determines the maximum size (in bytes) of the on-disk cache
+            of the resources fetched from ActivityPub servers. They are
+            cached as long as their Cache-Control or Expires headers allow,
+            or revalidated with their ETag or Last-Modified headers.
+            0 disables the cache."""
+        ),
+    ),
+)
+
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
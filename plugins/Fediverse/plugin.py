@@ -153,13 +153,13 @@ class Fediverse(callbacks.PluginRegexp):
     def __init__(self, irc):
         super().__init__(irc)
         self._startHttp()
-        self._actor_cache = utils.structures.TimeoutDict(timeout=600)
+        self._actor_cache = utils.structures.ExpiringDict(timeout=600)
 
         # Used when snarfing, to cheaply avoid querying non-ActivityPub
         # servers.
         # Is also written to when using commands that successfully find
         # ActivityPub data.
-        self._webfinger_support_cache = utils.structures.TimeoutDict(
+        self._webfinger_support_cache = utils.structures.ExpiringDict(
             timeout=60 * 60 * 24
         )
 
@@ -170,6 +170,7 @@ class Fediverse(callbacks.PluginRegexp):
 
     def die(self):
         self._stopHttp()
+        ap.stop_workers()
         super().die()
 
     def _stopHttp(self):
@@ -188,7 +189,7 @@ class Fediverse(callbacks.PluginRegexp):
                 return False
         return self._webfinger_support_cache[hostname]
 
-    def _get_actor(self, irc, username):
+    def _get_actor(self, irc, username, resources=None):
         if username in self._actor_cache:
             return self._actor_cache[username]
         match = _username_regexp.match(username)
@@ -204,7 +205,13 @@ class Fediverse(callbacks.PluginRegexp):
             match = utils.web.urlRe.match(username)
             if match:
                 # TODO: error handling
-                actor = ap.get_resource_from_url(match.group(0))
+                url = match.group(0)
+                if resources and url in resources:
+                    actor = resources[url]
+                    if isinstance(actor, Exception):
+                        raise actor
+                else:
+                    actor = ap.get_resource_from_url(url)
                 try:
                     hostname = urllib.parse.urlparse(actor.get("id")).hostname
                     username = "@%s@%s" % (
@@ -233,11 +240,11 @@ class Fediverse(callbacks.PluginRegexp):
         name = actor.get("name", username)
         return "\x02%s\x02 (@%s@%s)" % (name, username, hostname)
 
-    def _format_author(self, irc, author):
+    def _format_author(self, irc, author, resources=None):
         if isinstance(author, str):
             # it's an URL
             try:
-                author = self._get_actor(irc, author)
+                author = self._get_actor(irc, author, resources)
             except ap.ActivityPubError as e:
                 return _("<error: %s>") % str(e)
             else:
@@ -248,24 +255,58 @@ class Fediverse(callbacks.PluginRegexp):
                 # on PeerTube, which we do not want to show.
                 return None
             if author.get("id"):
-                return self._format_author(irc, author["id"])
+                return self._format_author(irc, author["id"], resources)
         elif isinstance(author, list):
             return format(
                 "%L",
                 filter(
-                    bool, [self._format_author(irc, item) for item in author]
+                    bool,
+                    [
+                        self._format_author(irc, item, resources)
+                        for item in author
+                    ],
                 ),
             )
         else:
             return "<unknown>"
 
-    def _format_status(self, irc, msg, status):
+    def _fetch_references(self, statuses):
+        """Fetches the statuses boosted by the ``statuses``, then the authors
+        of all of them which are not cached, concurrently.
+
+        Returns a dict from the URLs of the boosted statuses and authors to
+        the resource or to the exception raised while fetching it."""
+        boosted_urls = [
+            status["object"]
+            for status in statuses
+            if isinstance(status, dict)
+            and status.get("type") == "Announce"
+            and isinstance(status.get("object"), str)
+        ]
+        resources = ap.get_resources_from_urls(boosted_urls)
+
+        author_urls = []
+        for status in statuses + list(resources.values()):
+            if not isinstance(status, dict):
+                continue
+            if status.get("type") == "Create":
+                status = status.get("object")
+                if not isinstance(status, dict):
+                    continue
+            author = status.get("attributedTo")
+            if isinstance(author, str) and author not in self._actor_cache:
+                author_urls.append(author)
+        resources.update(ap.get_resources_from_urls(author_urls))
+
+        return resources
+
+    def _format_status(self, irc, msg, status, resources=None):
         if status["type"] == "Create":
-            return self._format_status(irc, msg, status["object"])
+            return self._format_status(irc, msg, status["object"], resources)
         elif status["type"] == "Note":
             cw = status.get("summary")
             author_fullname = self._format_author(
-                irc, status.get("attributedTo")
+                irc, status.get("attributedTo"), resources
             )
             if cw:
                 if self.registryValue(
@@ -301,16 +342,22 @@ class Fediverse(callbacks.PluginRegexp):
         elif status["type"] == "Announce":
             # aka boost; let's go fetch the original status
             try:
-                content = ap.signed_request(
-                    status["object"], headers={"Accept": ap.ACTIVITY_MIMETYPE}
-                )
-                status = json.loads(content.decode())
-                return self._format_status(irc, msg, status)
+                if resources and status["object"] in resources:
+                    status = resources[status["object"]]
+                    if isinstance(status, Exception):
+                        raise status
+                else:
+                    content = ap.signed_request(
+                        status["object"],
+                        headers={"Accept": ap.ACTIVITY_MIMETYPE},
+                    )
+                    status = json.loads(content.decode())
+                return self._format_status(irc, msg, status, resources)
             except ap.ActivityPubProtocolError as e:
                 return "<Could not fetch status: %s>" % e.args[0]
         elif status["type"] == "Video":
             author_fullname = self._format_author(
-                irc, status.get("attributedTo")
+                irc, status.get("attributedTo"), resources
             )
             return format(
                 _("\x02%s\x02 (%T) by %s: %s"),
@@ -431,10 +478,14 @@ class Fediverse(callbacks.PluginRegexp):
         if not statuses:
             irc.reply(_("No featured statuses."))
             return
+        resources = self._fetch_references(statuses)
         irc.replies(
             filter(
                 bool,
-                (self._format_status(irc, msg, status) for status in statuses),
+                (
+                    self._format_status(irc, msg, status, resources)
+                    for status in statuses
+                ),
             )
         )
 
@@ -454,10 +505,14 @@ class Fediverse(callbacks.PluginRegexp):
         statuses = json.loads(ap.signed_request(outbox["first"]).decode()).get(
             "orderedItems", []
         )
+        resources = self._fetch_references(statuses)
         irc.replies(
             filter(
                 bool,
-                (self._format_status(irc, msg, status) for status in statuses),
+                (
+                    self._format_status(irc, msg, status, resources)
+                    for status in statuses
+                ),
             )
         )
 
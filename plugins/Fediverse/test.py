@@ -28,14 +28,16 @@
 
 ###
 
+import io
 import os
 import copy
 import json
 import functools
 import contextlib
+import urllib.error
 
 from supybot import conf, log, utils, world
-from supybot.test import ChannelPluginTestCase, network
+from supybot.test import ChannelPluginTestCase, network, timeFastForward
 
 from . import activitypub as ap
 from .test_data import (
@@ -66,6 +68,15 @@ from .test_data import (
 )
 
 
+class FakeResponse(io.BytesIO):
+    """Mocks the file object returned by ``utils.web.getUrlFd``."""
+
+    def __init__(self, content, headers=None):
+        super().__init__(content)
+        self.status = 200
+        self.headers = headers or {}
+
+
 class BaseFediverseTestCase(ChannelPluginTestCase):
     config = {
         # Allow snarfing the same URL twice in a row
@@ -81,6 +92,7 @@ class BaseFediverseTestCase(ChannelPluginTestCase):
         os.makedirs(os.path.dirname(path), exist_ok=True)
         with open(path, "wb") as fd:
             fd.write(PRIVATE_KEY)
+        ap.cache.clear()
 
 
 class NetworkedFediverseTestCase(BaseFediverseTestCase):
@@ -126,10 +138,10 @@ class NetworklessFediverseTestCase(BaseFediverseTestCase):
     def mockRequests(self, expected_requests):
         with world.SUPYPROCESS_MULTIPROCESSING_CONTEXT.Manager() as m:
             expected_requests = m.list(list(expected_requests))
-            original_getUrlContent = utils.web.getUrlContent
+            original_getUrlFd = utils.web.getUrlFd
 
-            @functools.wraps(original_getUrlContent)
-            def newf(url, headers={}, data=None):
+            @functools.wraps(original_getUrlFd)
+            def newf(url, headers=None, data=None, timeout=None):
                 self.assertIsNone(data, "Unexpected POST to %s" % url)
                 assert expected_requests, url
                 (expected_url, response) = expected_requests.pop(0)
@@ -137,23 +149,61 @@ class NetworklessFediverseTestCase(BaseFediverseTestCase):
                 log.debug("Got request to %s", url)
 
                 if isinstance(response, bytes):
-                    return response
+                    return FakeResponse(response)
                 elif isinstance(response, Exception):
                     raise response
+                elif isinstance(response, dict):
+                    # {"status": ..., "headers": ..., "content": ...}
+                    # with the request headers it expects as "expected"
+                    for (name, value) in response.get("expected", {}).items():
+                        self.assertEqual(headers.get(name), value, name)
+                    response_headers = response.get("headers", {})
+                    if response.get("status") == 304:
+                        raise utils.web.Error("Not Modified") from (
+                            urllib.error.HTTPError(
+                                url,
+                                304,
+                                "Not Modified",
+                                response_headers,
+                                None,
+                            )
+                        )
+                    return FakeResponse(response["content"], response_headers)
                 else:
                     assert False, response
 
-            utils.web.getUrlContent = newf
+            utils.web.getUrlFd = newf
+            # Sandbox processes must be started again to use the mock
+            ap.stop_workers()
 
             try:
                 yield
             finally:
-                utils.web.getUrlContent = original_getUrlContent
+                utils.web.getUrlFd = original_getUrlFd
+                ap.stop_workers()
 
             self.assertEqual(
                 list(expected_requests), [], "Less requests than expected."
             )
 
+    def testSandboxWorkersRestartedOnConfigChange(self):
+        ap.stop_workers()
+        try:
+            ap._parse_host_meta(HOSTMETA_DATA)
+            if not ap.workers._idle:
+                self.skipTest("Sandbox workers are not used.")
+            [worker] = ap.workers._idle
+            ap._parse_host_meta(HOSTMETA_DATA)
+            self.assertEqual(ap.workers._idle, [worker])
+
+            # The proxy is only set in this process's urllib opener
+            with conf.supybot.protocols.http.proxy.context("localhost:3128"):
+                ap._parse_host_meta(HOSTMETA_DATA)
+            self.assertNotIn(worker, ap.workers._idle)
+            self.assertFalse(worker.is_alive())
+        finally:
+            ap.stop_workers()
+
     def testFeaturedNone(self):
         featured = {
             "@context": "https://www.w3.org/ns/activitystreams",
@@ -449,6 +499,114 @@ class NetworklessFediverseTestCase(BaseFediverseTestCase):
                     + "<https://example.net/system/media_attachments/image.png>",
                 )
 
+    def testStatusCache(self):
+        response = {
+            "headers": {"Cache-Control": "max-age=60", "ETag": '"v1"'},
+            "content": STATUS_DATA,
+        }
+        expected_requests = [(STATUS_URL, response), (ACTOR_URL, ACTOR_DATA)]
+
+        with self.mockRequests(expected_requests):
+            self.assertResponse(
+                "status https://example.org/users/someuser/statuses/1234",
+                "\x02someuser\x02 (@someuser@example.org): "
+                + "@FirstAuthor I am replying to you",
+            )
+
+        # Fresh in the cache, and so is the actor
+        spawned = world.processesSpawned
+        with self.mockRequests([]):
+            self.assertResponse(
+                "status https://example.org/users/someuser/statuses/1234",
+                "\x02someuser\x02 (@someuser@example.org): "
+                + "@FirstAuthor I am replying to you",
+            )
+        self.assertEqual(world.processesSpawned, spawned)
+
+        # Stale, revalidated with its ETag
+        timeFastForward(120)
+        response = {
+            "status": 304,
+            "headers": {"Cache-Control": "max-age=60"},
+            "expected": {"If-None-Match": '"v1"'},
+        }
+        with self.mockRequests([(STATUS_URL, response)]):
+            self.assertResponse(
+                "status https://example.org/users/someuser/statuses/1234",
+                "\x02someuser\x02 (@someuser@example.org): "
+                + "@FirstAuthor I am replying to you",
+            )
+        with self.mockRequests([]):
+            self.assertResponse(
+                "status https://example.org/users/someuser/statuses/1234",
+                "\x02someuser\x02 (@someuser@example.org): "
+                + "@FirstAuthor I am replying to you",
+            )
+
+    def testStatusNoStore(self):
+        response = {
+            "headers": {"Cache-Control": "no-store", "ETag": '"v1"'},
+            "content": STATUS_DATA,
+        }
+        for i in range(2):
+            with self.mockRequests([(STATUS_URL, response)]):
+                self.assertRegexp(
+                    "status https://example.org/users/someuser/statuses/1234",
+                    "I am replying to you",
+                )
+
+    def testCacheMaximumSize(self):
+        headers = {"Accept": ap.ACTIVITY_MIMETYPE}
+        response_headers = {"cache-control": "max-age=60"}
+        with conf.supybot.plugins.Fediverse.cache.maximumSize.context(1500):
+            ap.cache.store(
+                "https://example.org/1", headers, response_headers, b"a" * 400
+            )
+            ap.cache.store(
+                "https://example.org/2", headers, response_headers, b"b" * 400
+            )
+            self.assertIsNotNone(
+                ap.cache.get("https://example.org/1", headers)
+            )
+            ap.cache.store(
+                "https://example.org/3", headers, response_headers, b"c" * 400
+            )
+            # 2 is the least recently used
+            self.assertIsNotNone(
+                ap.cache.get("https://example.org/1", headers)
+            )
+            self.assertIsNone(ap.cache.get("https://example.org/2", headers))
+            (metadata, content) = ap.cache.get("https://example.org/3", headers)
+            self.assertEqual(content, b"c" * 400)
+            # too big
+            ap.cache.store(
+                "https://example.org/4", headers, response_headers, b"d" * 1500
+            )
+            self.assertIsNone(ap.cache.get("https://example.org/4", headers))
+            # not the same Accept header
+            self.assertIsNone(ap.cache.get("https://example.org/1", {}))
+
+    def testSignatureReuse(self):
+        with conf.supybot.servers.http.publicUrl.context(
+            "https://bot.example.org/"
+        ):
+            headers1 = {"Accept": ap.ACTIVITY_MIMETYPE}
+            ap._sign("get", ACTOR_URL, headers1)
+            self.assertIn("Signature", headers1)
+            headers2 = {"Accept": ap.ACTIVITY_MIMETYPE}
+            ap._sign("get", ACTOR_URL, headers2)
+            self.assertEqual(headers1, headers2)
+
+            headers3 = {"Accept": ap.ACTIVITY_MIMETYPE}
+            ap._sign("get", STATUS_URL, headers3)
+            self.assertNotEqual(headers1["Signature"], headers3["Signature"])
+
+            timeFastForward(ap.SIGNATURE_LIFETIME + 1)
+            headers4 = {"Accept": ap.ACTIVITY_MIMETYPE}
+            ap._sign("get", ACTOR_URL, headers4)
+            self.assertNotEqual(headers1["Date"], headers4["Date"])
+            self.assertNotEqual(headers1["Signature"], headers4["Signature"])
+
     def testVideo(self):
         expected_requests = [
             (PEERTUBE_VIDEO_URL, PEERTUBE_VIDEO_DATA),
@@ -47,6 +47,8 @@ _ = PluginInternationalization('Herald')
 filename = conf.supybot.directories.data.dirize('Herald.db')
 
 class HeraldDB(plugins.ChannelUserDB):
+    journaled = True
+
     def serialize(self, v):
         return [v]
 
@@ -37,14 +37,13 @@ import supybot.conf as conf
 import supybot.utils as utils
 from supybot.commands import *
 import supybot.plugins as plugins
+import supybot.sqlitedb as sqlitedb
 import supybot.ircmsgs as ircmsgs
 import supybot.ircutils as ircutils
 import supybot.callbacks as callbacks
 from supybot.i18n import PluginInternationalization, internationalizeDocstring
 _ = PluginInternationalization('Karma')
 
-import sqlite3
-
 def checkAllowShell(irc):
     if not conf.supybot.commands.allowShell():
         irc.error('This command is not available, because '
@@ -52,25 +51,16 @@ def checkAllowShell(irc):
 
 class SqliteKarmaDB(object):
     def __init__(self, filename):
-        self.dbs = ircutils.IrcDict()
+        self.dbs = sqlitedb.ChannelDatabases(filename, self._setupDb)
         self.filename = filename
 
     def close(self):
-        for db in self.dbs.values():
-            db.close()
+        self.dbs.close()
 
-    def _getDb(self, channel):
-        filename = plugins.makeChannelFilename(self.filename, channel)
-        if filename in self.dbs:
-            return self.dbs[filename]
-        if os.path.exists(filename):
-            db = sqlite3.connect(filename, check_same_thread=False)
-            self.dbs[filename] = db
-            return db
-        db = sqlite3.connect(filename, check_same_thread=False)
-        self.dbs[filename] = db
+    @staticmethod
+    def _setupDb(db):
         cursor = db.cursor()
-        cursor.execute("""CREATE TABLE karma (
+        cursor.execute("""CREATE TABLE IF NOT EXISTS karma (
                           id INTEGER PRIMARY KEY,
                           name TEXT,
                           normalized TEXT UNIQUE ON CONFLICT IGNORE,
@@ -81,7 +71,9 @@ class SqliteKarmaDB(object):
         def p(s1, s2):
             return int(ircutils.nickEqual(s1, s2))
         db.create_function('nickeq', 2, p)
-        return db
+
+    def _getDb(self, channel):
+        return self.dbs.connect(channel)
 
     def get(self, channel, thing):
         db = self._getDb(channel)
@@ -145,24 +137,22 @@ class SqliteKarmaDB(object):
         return int(cursor.fetchone()[0])
 
     def increment(self, channel, name):
-        db = self._getDb(channel)
-        cursor = db.cursor()
         normalized = name.lower()
-        cursor.execute("""INSERT INTO karma VALUES (NULL, ?, ?, 0, 0)""",
-                       (name, normalized,))
-        cursor.execute("""UPDATE karma SET added=added+1
-                          WHERE normalized=?""", (normalized,))
-        db.commit()
+        with self.dbs.transaction(channel) as db:
+            cursor = db.cursor()
+            cursor.execute("""INSERT INTO karma VALUES (NULL, ?, ?, 0, 0)""",
+                           (name, normalized,))
+            cursor.execute("""UPDATE karma SET added=added+1
+                              WHERE normalized=?""", (normalized,))
 
     def decrement(self, channel, name):
-        db = self._getDb(channel)
-        cursor = db.cursor()
         normalized = name.lower()
-        cursor.execute("""INSERT INTO karma VALUES (NULL, ?, ?, 0, 0)""",
-                       (name, normalized,))
-        cursor.execute("""UPDATE karma SET subtracted=subtracted+1
-                          WHERE normalized=?""", (normalized,))
-        db.commit()
+        with self.dbs.transaction(channel) as db:
+            cursor = db.cursor()
+            cursor.execute("""INSERT INTO karma VALUES (NULL, ?, ?, 0, 0)""",
+                           (name, normalized,))
+            cursor.execute("""UPDATE karma SET subtracted=subtracted+1
+                              WHERE normalized=?""", (normalized,))
 
     def most(self, channel, kind, limit):
         if kind == 'increased':
@@ -206,15 +196,14 @@ class SqliteKarmaDB(object):
         filename = conf.supybot.directories.data.dirize(filename)
         fd = open(filename, encoding='utf8')
         reader = csv.reader(fd)
-        db = self._getDb(channel)
-        cursor = db.cursor()
-        cursor.execute("""DELETE FROM karma""")
-        for (name, added, subtracted) in reader:
-            normalized = name.lower()
-            cursor.execute("""INSERT INTO karma
-                              VALUES (NULL, ?, ?, ?, ?)""",
-                           (name, normalized, added, subtracted,))
-        db.commit()
+        with self.dbs.transaction(channel) as db:
+            cursor = db.cursor()
+            cursor.execute("""DELETE FROM karma""")
+            for (name, added, subtracted) in reader:
+                normalized = name.lower()
+                cursor.execute("""INSERT INTO karma
+                                  VALUES (NULL, ?, ?, ?, ?)""",
+                               (name, normalized, added, subtracted,))
         fd.close()
 
 KarmaDB = plugins.DB('Karma',
@@ -39,7 +39,6 @@ import supybot.conf as conf
 import supybot.ircdb as ircdb
 
 import re
-import os
 import sys
 import time
 
@@ -60,32 +59,30 @@ except:
                            #'plugin.  Download it at ' \
                            #'<http://code.google.com/p/pysqlite/>'
 
-import sqlite3
-
-# these are needed cuz we are overriding getdb
-import threading
-import supybot.world as world
+import supybot.sqlitedb as sqlitedb
 
 
 import supybot.log as log
 
 
-class MessageParser(callbacks.Plugin, plugins.ChannelDBHandler):
+class MessageParser(callbacks.Plugin):
     """This plugin can set regexp triggers to activate the bot.
     Use 'add' command to add regexp trigger, 'remove' to remove."""
     threaded = True
     def __init__(self, irc):
         callbacks.Plugin.__init__(self, irc)
-        plugins.ChannelDBHandler.__init__(self)
-
-    def makeDb(self, filename):
-        """Create the database and connect to it."""
-        if os.path.exists(filename):
-            db = sqlite3.connect(filename)
-            return db
-        db = sqlite3.connect(filename)
+        self.dbs = sqlitedb.ChannelDatabases('MessageParser.db', self.setupDb)
+
+    def die(self):
+        self.dbs.close()
+        callbacks.Plugin.die(self)
+
+    def setupDb(self, db):
+        """Create the database if needed."""
+        # Each statement is committed on its own.
+        db.isolation_level = None
         cursor = db.cursor()
-        cursor.execute("""CREATE TABLE triggers (
+        cursor.execute("""CREATE TABLE IF NOT EXISTS triggers (
                           id INTEGER PRIMARY KEY,
                           regexp TEXT UNIQUE ON CONFLICT REPLACE,
                           added_by TEXT,
@@ -94,22 +91,10 @@ class MessageParser(callbacks.Plugin, plugins.ChannelDBHandler):
                           action TEXT,
                           locked BOOLEAN
                           )""")
-        db.commit()
-        return db
 
-    # override this because sqlite3 doesn't have autocommit
-    # use isolation_level instead.
     def getDb(self, channel):
         """Use this to get a database for a specific channel."""
-        currentThread = threading.currentThread()
-        if channel not in self.dbCache and currentThread == world.mainThread:
-            self.dbCache[channel] = self.makeDb(self.makeFilename(channel))
-        if currentThread != world.mainThread:
-            db = self.makeDb(self.makeFilename(channel))
-        else:
-            db = self.dbCache[channel]
-        db.isolation_level = None
-        return db
+        return self.dbs.connect(channel)
 
     def _updateRank(self, network, channel, regexp):
         subfolder = None if channel == 'global' else channel
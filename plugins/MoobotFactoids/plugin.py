@@ -29,15 +29,16 @@
 ###
 
 import io
-import os
 import time
 
 import supybot.conf as conf
 import supybot.ircdb as ircdb
 import supybot.utils as utils
+import supybot.world as world
 import supybot.shlex as shlex
 from supybot.commands import *
 import supybot.plugins as plugins
+import supybot.sqlitedb as sqlitedb
 import supybot.ircutils as ircutils
 import supybot.callbacks as callbacks
 from supybot.i18n import PluginInternationalization, internationalizeDocstring
@@ -89,28 +90,37 @@ def pickOptions(s):
 class SqliteMoobotDB(object):
     def __init__(self, filename):
         self.filename = filename
-        self.dbs = ircutils.IrcDict()
+        self.dbs = sqlitedb.ChannelDatabases(filename, self._setupDb)
+        # {channel: {key: [count, last requester, last request time]}}, for
+        # the requests not written to the databases by flush() yet.
+        self.requests = ircutils.IrcDict()
 
     def close(self):
-        for db in self.dbs.values():
-            db.close()
-        self.dbs.clear()
+        self.flush()
+        self.dbs.close()
 
-    def _getDb(self, channel):
-        import sqlite3
-
-        if channel in self.dbs:
-            return self.dbs[channel]
-        filename = plugins.makeChannelFilename(self.filename, channel)
-
-        if os.path.exists(filename):
-            db = sqlite3.connect(filename, check_same_thread=False)
-            self.dbs[channel] = db
-            return db
-        db = sqlite3.connect(filename, check_same_thread=False)
-        self.dbs[channel] = db
+    def flush(self):
+        for channel in list(self.requests):
+            self._flushRequests(channel)
+
+    def _flushRequests(self, channel):
+        requests = self.requests.pop(channel, None)
+        if not requests:
+            return
+        with self.dbs.transaction(channel) as db:
+            db.executemany("""UPDATE factoids SET
+                              last_requested_by = ?,
+                              last_requested_at = ?,
+                              requested_count = requested_count + ?
+                              WHERE key = ?""",
+                           [(hostmask, at, count, key)
+                            for (key, (count, hostmask, at))
+                            in requests.items()])
+
+    @staticmethod
+    def _setupDb(db):
         cursor = db.cursor()
-        cursor.execute("""CREATE TABLE factoids (
+        cursor.execute("""CREATE TABLE IF NOT EXISTS factoids (
                           key TEXT PRIMARY KEY,
                           created_by INTEGER,
                           created_at TIMESTAMP,
@@ -124,7 +134,9 @@ class SqliteMoobotDB(object):
                           requested_count INTEGER
                           )""")
         db.commit()
-        return db
+
+    def _getDb(self, channel):
+        return self.dbs.connect(channel)
 
     def getFactoid(self, channel, key):
         db = self._getDb(channel)
@@ -143,14 +155,20 @@ class SqliteMoobotDB(object):
         cursor.execute("""SELECT created_by, created_at,
                                  modified_by, modified_at,
                                  last_requested_by, last_requested_at,
-                                 requested_count, locked_by, locked_at
+                                 requested_count, locked_by, locked_at, key
                           FROM factoids
                           WHERE key LIKE ?""", (key,))
         results = cursor.fetchall()
         if len(results) == 0:
             return None
         else:
-            return results[0]
+            info = list(results[0])
+            key = info.pop()
+            request = self.requests.get(channel, {}).get(key)
+            if request is not None:
+                (count, info[4], info[5]) = request
+                info[6] += count
+            return tuple(info)
 
     def randomFactoid(self, channel):
         db = self._getDb(channel)
@@ -182,17 +200,16 @@ class SqliteMoobotDB(object):
         db.commit()
 
     def updateRequest(self, channel, key, hostmask):
-        db = self._getDb(channel)
-        cursor = db.cursor()
-        cursor.execute("""UPDATE factoids SET
-                          last_requested_by = ?,
-                          last_requested_at = ?,
-                          requested_count = requested_count + 1
-                          WHERE key = ?""",
-                          (hostmask, int(time.time()), key))
-        db.commit()
+        # Written by flush(), so lookups do not each wait for a commit.
+        requests = self.requests.setdefault(channel, {})
+        request = requests.setdefault(key, [0, None, None])
+        request[0] += 1
+        request[1:] = (hostmask, int(time.time()))
 
     def removeFactoid(self, channel, key):
+        # Or the requests of this factoid would count for the next one with
+        # the same key.
+        self._flushRequests(channel)
         db = self._getDb(channel)
         cursor = db.cursor()
         cursor.execute("""DELETE FROM factoids WHERE key LIKE ?""",
@@ -244,11 +261,25 @@ class SqliteMoobotDB(object):
     def mostPopular(self, channel, limit):
         db = self._getDb(channel)
         cursor = db.cursor()
+        requests = self.requests.get(channel, {})
+        # At most len(requests) of them may be overtaken by factoids with
+        # requests not written to the database yet.
         cursor.execute("""SELECT key, requested_count FROM factoids
                           WHERE requested_count > 0
-                          ORDER BY requested_count DESC LIMIT ?""", (limit,))
-        results = cursor.fetchall()
-        return results
+                          ORDER BY requested_count DESC LIMIT ?""",
+                       (limit + len(requests),))
+        counts = dict(cursor.fetchall())
+        for (key, (count, hostmask, at)) in requests.items():
+            if key not in counts:
+                cursor.execute("""SELECT requested_count FROM factoids
+                                  WHERE key = ?""", (key,))
+                result = cursor.fetchone()
+                if result is None:
+                    continue
+                counts[key] = result[0]
+            counts[key] += count
+        results = sorted(counts.items(), key=lambda t: t[1], reverse=True)
+        return results[:limit]
 
     def getKeysByAuthor(self, channel, authorId):
         db = self._getDb(channel)
@@ -310,8 +341,10 @@ class MoobotFactoids(callbacks.Plugin):
         self.db = MoobotDB()
         self.__parent = super(MoobotFactoids, self)
         self.__parent.__init__(irc)
+        world.flushers.append(self.db.flush)
 
     def die(self):
+        world.flushers.remove(self.db.flush)
         self.__parent.die()
         self.db.close()
 
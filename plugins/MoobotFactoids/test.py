@@ -275,6 +275,34 @@ class FactoidsTestCase(ChannelPluginTestCase):
         self.assertRegexp('most authored',
                           r'Most prolific authors:.*boo.*(2).*moo.*(1)')
 
+    def testRequestsFlush(self):
+        cb = self.irc.getCallback('MoobotFactoids')
+        db = cb.db._getDb(self.channel)
+        def requested_counts():
+            return db.execute("""SELECT key, requested_count FROM factoids
+                                 ORDER BY key""").fetchall()
+        self.assertEqual(db.execute('PRAGMA journal_mode').fetchone(),
+                         ('wal',))
+        self.assertNotError('moogle is <reply>moo')
+        self.assertNotError('mogle is <reply>mo')
+        self.assertResponse('moogle', 'moo')
+        self.assertResponse('mogle', 'mo')
+        self.assertResponse('mogle', 'mo')
+        self.assertEqual(requested_counts(), [('mogle', 0), ('moogle', 0)])
+        self.assertRegexp('most popular',
+                          r"Top 2 requested factoids:.*"
+                          r"mogle.*(2).*moogle.*(1)")
+        self.assertRegexp('factinfo mogle', self.prefix + r'.*2 times')
+        self.assertNotError('flush')
+        self.assertEqual(requested_counts(), [('mogle', 2), ('moogle', 1)])
+        self.assertRegexp('factinfo mogle', self.prefix + r'.*2 times')
+
+        self.assertResponse('moogle', 'moo')
+        self.assertResponse('moogle', 'moo')
+        self.assertRegexp('most popular',
+                          r"Top 2 requested factoids:.*"
+                          r"moogle.*(3).*mogle.*(2)")
+
     def testListkeys(self):
         self.assertResponse('listkeys %', 'No keys matching "%" found.')
         self.assertNotError('moo is <reply>moo')
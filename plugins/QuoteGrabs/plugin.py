@@ -29,7 +29,6 @@
 # POSSIBILITY OF SUCH DAMAGE.
 ###
 
-import os
 import sys
 import time
 import random
@@ -40,13 +39,12 @@ import supybot.utils as utils
 from supybot.commands import *
 import supybot.ircmsgs as ircmsgs
 import supybot.plugins as plugins
+import supybot.sqlitedb as sqlitedb
 import supybot.ircutils as ircutils
 import supybot.callbacks as callbacks
 from supybot.i18n import PluginInternationalization, internationalizeDocstring
 _ = PluginInternationalization('QuoteGrabs')
 
-import sqlite3
-
 import traceback
 
 #sqlite3.register_converter('bool', bool)
@@ -70,31 +68,21 @@ class QuoteGrabsRecord(dbi.Record):
 
 class SqliteQuoteGrabsDB(object):
     def __init__(self, filename):
-        self.dbs = ircutils.IrcDict()
+        self.dbs = sqlitedb.ChannelDatabases(filename, self._setupDb)
         self.filename = filename
 
     def close(self):
-        for db in self.dbs.values():
-            db.close()
+        self.dbs.close()
 
-    def _getDb(self, channel):
-        filename = plugins.makeChannelFilename(self.filename, channel)
+    @staticmethod
+    def _setupDb(db):
         def p(s1, s2):
             # text_factory seems to only apply as an output adapter,
             # so doesn't apply to created functions; so we use str()
             return ircutils.nickEqual(str(s1), str(s2))
-        if filename in self.dbs:
-            return self.dbs[filename]
-        if os.path.exists(filename):
-            db = sqlite3.connect(filename)
-            db.create_function('nickeq', 2, p)
-            self.dbs[filename] = db
-            return db
-        db = sqlite3.connect(filename)
         db.create_function('nickeq', 2, p)
-        self.dbs[filename] = db
         cursor = db.cursor()
-        cursor.execute("""CREATE TABLE quotegrabs (
+        cursor.execute("""CREATE TABLE IF NOT EXISTS quotegrabs (
                           id INTEGER PRIMARY KEY,
                           nick BLOB,
                           hostmask TEXT,
@@ -103,7 +91,9 @@ class SqliteQuoteGrabsDB(object):
                           quote TEXT
                           );""")
         db.commit()
-        return db
+
+    def _getDb(self, channel):
+        return self.dbs.connect(channel)
 
     def get(self, channel, id, quoteonly = 0):
         db = self._getDb(channel)
@@ -233,6 +223,10 @@ class QuoteGrabs(callbacks.Plugin):
         self.__parent.__init__(irc)
         self.db = QuoteGrabsDB()
 
+    def die(self):
+        self.__parent.die()
+        self.db.close()
+
     def doPrivmsg(self, irc, msg):
         if ircmsgs.isCtcp(msg) and not ircmsgs.isAction(msg):
             return
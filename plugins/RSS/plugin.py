@@ -290,11 +290,13 @@ class RSS(callbacks.Plugin):
         if name != url:
             # If name == url, then it's an anonymous feed
             self.feed_names[name] = url
+            self.commandsChanged()
         self.feeds[url] = Feed(name, url, initial,
                 plugin_is_loading, announced)
 
     def remove_feed(self, name_or_url):
-        self.feed_names.pop(name_or_url, None)
+        if self.feed_names.pop(name_or_url, None):
+            self.commandsChanged()
         while True:
             try:
                 conf.supybot.plugins.RSS.feeds().remove(name_or_url)
@@ -308,6 +310,9 @@ class RSS(callbacks.Plugin):
     ##################
     # Methods handling
 
+    # Named feeds are commands, and are listed by listCommands.
+    indexCommands = True
+
     def isCommandMethod(self, name):
         if not self.__parent.isCommandMethod(name):
             return bool(self.get_feed(name))
@@ -112,9 +112,8 @@ class Relay(callbacks.Plugin):
         channel.
         """
         self.registryValue('channels').discard(channel)
-        for otherIrc in world.ircs:
-            if channel in otherIrc.state.channels:
-                otherIrc.queueMsg(ircmsgs.part(channel))
+        for otherIrc in world.getIrcsInChannel(channel):
+            otherIrc.queueMsg(ircmsgs.part(channel))
         irc.replySuccess()
     part = wrap(part, ['channel', 'admin'])
 
@@ -247,10 +246,9 @@ class Relay(callbacks.Plugin):
     def _sendToOthers(self, irc, msg, nick):
 
         assert msg.command in ('PRIVMSG', 'NOTICE', 'TOPIC')
-        for otherIrc in world.ircs:
+        for otherIrc in world.getIrcsInChannel(msg.channel):
             if otherIrc != irc and not otherIrc.zombie:
-                if msg.channel in otherIrc.state.channels:
-                    self._sendToOther(irc, otherIrc, msg, nick)
+                self._sendToOther(irc, otherIrc, msg, nick)
 
     def _sendToOther(self, sourceIrc, destIrc, msg, nick):
         msg = copy.deepcopy(msg)
@@ -281,19 +279,18 @@ class Relay(callbacks.Plugin):
         def notPunishing(irc, s, *args):
             self.log.info('Not punishing %s in %s on %s: %s.',
                           msg.prefix, channel, irc.network, s, *args)
-        for irc in world.ircs:
-            if channel in irc.state.channels:
-                if irc.nick in irc.state.channels[channel].ops:
-                    if who in irc.state.channels[channel].bans:
-                        notPunishing(irc, 'already banned')
-                    else:
-                        self.log.info('Punishing %s in %s on %s for relaying.',
-                                      who, channel, irc.network)
-                        irc.sendMsg(ircmsgs.ban(channel, who))
-                        kmsg = _('You seem to be relaying, punk.')
-                        irc.sendMsg(ircmsgs.kick(channel, msg.nick, kmsg))
+        for irc in world.getIrcsInChannel(channel):
+            if irc.nick in irc.state.channels[channel].ops:
+                if who in irc.state.channels[channel].bans:
+                    notPunishing(irc, 'already banned')
                 else:
-                    notPunishing(irc, 'not opped')
+                    self.log.info('Punishing %s in %s on %s for relaying.',
+                                  who, channel, irc.network)
+                    irc.sendMsg(ircmsgs.ban(channel, who))
+                    kmsg = _('You seem to be relaying, punk.')
+                    irc.sendMsg(ircmsgs.kick(channel, msg.nick, kmsg))
+            else:
+                notPunishing(irc, 'not opped')
 
     def doPrivmsg(self, irc, msg):
         if ircmsgs.isCtcp(msg) and not ircmsgs.isAction(msg):
@@ -54,6 +54,11 @@ conf.registerChannelValue(Seen, 'showLastMessage',
     registry.Boolean(True, _("""Determines whether the last message will
     be displayed with @seen. Useful for keeping messages from a channel
     private.""")))
+conf.registerGlobalValue(Seen, 'entryExpiry',
+    registry.NonNegativeInteger(0, _("""Determines the maximum number of
+    days that the bot will remember when someone was last seen. Older entries
+    are deleted, which keeps the database from growing forever on busy
+    networks. If this value is 0, there is no maximum.""")))
 
 
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -31,6 +31,7 @@
 
 import re
 import sys
+import bisect
 import time
 
 import supybot.log as log
@@ -54,8 +55,94 @@ class IrcStringAndIntDict(utils.InsensitivePreservingDict):
         else:
             return ircutils.toLower(x)
 
+class NickIndex(object):
+    """Index of the (lowercase) nicks seen in a channel, so wildcard
+    searches do not have to test all of them.  Nicks are kept sorted, so
+    patterns starting with a fixed prefix only look at a range of them;
+    other patterns use an index of the trigrams of the nicks, which is
+    only built the first time it is needed."""
+    __slots__ = ('nicks', 'trigrams')
+    def __init__(self, nicks):
+        self.nicks = sorted(nicks)
+        self.trigrams = None
+
+    @staticmethod
+    def _trigrams(s):
+        return {s[i:i+3] for i in range(len(s) - 2)}
+
+    def _buildTrigrams(self):
+        self.trigrams = {}
+        for nick in self.nicks:
+            self._addTrigrams(nick)
+
+    def _addTrigrams(self, nick):
+        for trigram in self._trigrams(nick):
+            nicks = self.trigrams.get(trigram)
+            if nicks is None:
+                nicks = self.trigrams[trigram] = set()
+            nicks.add(nick)
+
+    def add(self, nick):
+        i = bisect.bisect_left(self.nicks, nick)
+        if i < len(self.nicks) and self.nicks[i] == nick:
+            return
+        self.nicks.insert(i, nick)
+        if self.trigrams is not None:
+            self._addTrigrams(nick)
+
+    def remove(self, nick):
+        i = bisect.bisect_left(self.nicks, nick)
+        if i == len(self.nicks) or self.nicks[i] != nick:
+            return
+        del self.nicks[i]
+        if self.trigrams is not None:
+            for trigram in self._trigrams(nick):
+                nicks = self.trigrams[trigram]
+                nicks.discard(nick)
+                if not nicks:
+                    del self.trigrams[trigram]
+
+    def candidates(self, pattern):
+        """Returns nicks that may match the given lowercase pattern, in
+        which '*' matches any string."""
+        parts = pattern.split('*')
+        candidates = None
+        if parts[0]:
+            prefix = parts[0]
+            start = bisect.bisect_left(self.nicks, prefix)
+            # Nicks starting with the prefix sort right after it, so we
+            # only need to find the first one that does not.
+            end = start
+            while end < len(self.nicks) and \
+                    self.nicks[end].startswith(prefix):
+                end += 1
+            candidates = self.nicks[start:end]
+            if len(parts) == 1 or len(candidates) < 100:
+                return candidates
+        trigrams = set()
+        for part in parts[1:]:
+            trigrams.update(self._trigrams(part))
+        if not trigrams:
+            return self.nicks if candidates is None else candidates
+        if self.trigrams is None:
+            self._buildTrigrams()
+        sets = sorted((self.trigrams.get(t, ()) for t in trigrams), key=len)
+        result = set(sets[0])
+        for nicks in sets[1:]:
+            if not result:
+                break
+            result.intersection_update(nicks)
+        if candidates is not None:
+            result.intersection_update(candidates)
+        return result
+
 class SeenDB(plugins.ChannelUserDB):
     IdDict = IrcStringAndIntDict
+    journaled = True
+    def __init__(self, filename):
+        self.indexes = ircutils.IrcDict()
+        plugins.ChannelUserDB.__init__(self, filename)
+
     def serialize(self, v):
         return list(v)
 
@@ -63,25 +150,50 @@ class SeenDB(plugins.ChannelUserDB):
         (seen, saying) = L
         return (float(seen), saying)
 
+    def __setitem__(self, key, v):
+        plugins.ChannelUserDB.__setitem__(self, key, v)
+        (channel, nickOrId) = key
+        index = self.indexes.get(channel)
+        if index is not None and self._isNick(nickOrId):
+            index.add(ircutils.toLower(nickOrId))
+
+    def __delitem__(self, key):
+        plugins.ChannelUserDB.__delitem__(self, key)
+        (channel, nickOrId) = key
+        index = self.indexes.get(channel)
+        if index is not None and self._isNick(nickOrId):
+            index.remove(ircutils.toLower(nickOrId))
+
+    @staticmethod
+    def _isNick(nickOrId):
+        # Entries keyed by id duplicate the ones keyed by nick, and '<last>'
+        # is the last message in the channel.
+        return not isinstance(nickOrId, int) and nickOrId != '<last>'
+
+    def _getIndex(self, channel):
+        index = self.indexes.get(channel)
+        if index is None:
+            ids = self.channels.get(channel, {})
+            index = NickIndex(key for key in ids if self._isNick(key))
+            self.indexes[channel] = index
+        return index
+
     def update(self, channel, nickOrId, saying):
         seen = time.time()
         self[channel, nickOrId] = (seen, saying)
         self[channel, '<last>'] = (seen, saying)
 
     def seenWildcard(self, channel, nick):
-        nicks = ircutils.IrcSet()
-        nickRe = re.compile('^%s$' % '.*'.join(nick.split('*')), re.I)
-        for (searchChan, searchNick) in self.keys():
-            #print 'chan: %s ... nick: %s' % (searchChan, searchNick)
-            if isinstance(searchNick, int):
-                # We need to skip the reponses that are keyed by id as they
-                # apparently duplicate the responses for the same person that
-                # are keyed by nick-string
-                continue
-            if ircutils.strEqual(searchChan, channel):
-                if nickRe.search(searchNick) is not None:
-                    nicks.add(searchNick)
-        L = [[nick, self.seen(channel, nick)] for nick in nicks]
+        ids = self.channels.get(channel)
+        if ids is None:
+            return []
+        pattern = ircutils.toLower(nick)
+        nickRe = re.compile('^%s$' % '.*'.join(map(re.escape,
+                                                  pattern.split('*'))))
+        L = []
+        for candidate in self._getIndex(channel).candidates(pattern):
+            if nickRe.match(candidate) is not None:
+                L.append(list(ids.data[candidate]))
         def negativeTime(x):
             return -x[1][0]
         utils.sortBy(negativeTime, L)
@@ -90,6 +202,26 @@ class SeenDB(plugins.ChannelUserDB):
     def seen(self, channel, nickOrId):
         return self[channel, nickOrId]
 
+    def expire(self, maxAge):
+        """Removes entries older than maxAge seconds."""
+        cutoff = time.time() - maxAge
+        expired = []
+        for (channel, ids) in self.channels.items():
+            for (nickOrId, v) in ids.items():
+                if v[0] < cutoff:
+                    expired.append((channel, nickOrId))
+        for key in expired:
+            del self[key]
+        for (channel, ids) in list(self.channels.items()):
+            if not ids:
+                del self.channels[channel]
+                self.indexes.pop(channel, None)
+        return len(expired)
+
+    def close(self):
+        plugins.ChannelUserDB.close(self)
+        self.indexes.clear()
+
 filename = conf.supybot.directories.data.dirize('Seen.db')
 anyfilename = conf.supybot.directories.data.dirize('Seen.any.db')
 
@@ -103,10 +235,16 @@ class Seen(callbacks.Plugin):
         self.db = SeenDB(filename)
         self.anydb = SeenDB(anyfilename)
         self.lastmsg = {}
+        self.lastExpiry = 0
+        # Before the databases' flushers, so expired entries are removed
+        # from the files right away.
+        world.flushers.append(self.expire)
         world.flushers.append(self.db.flush)
         world.flushers.append(self.anydb.flush)
 
     def die(self):
+        if self.expire in world.flushers:
+            world.flushers.remove(self.expire)
         if self.db.flush in world.flushers:
             world.flushers.remove(self.db.flush)
         else:
@@ -122,6 +260,19 @@ class Seen(callbacks.Plugin):
     def __call__(self, irc, msg):
         self.__parent.__call__(irc, msg)
 
+    def expire(self):
+        """Removes old entries from the databases, at most once an hour."""
+        expiry = self.registryValue('entryExpiry')
+        now = time.time()
+        if not expiry or now - self.lastExpiry < 3600:
+            return
+        self.lastExpiry = now
+        for db in (self.db, self.anydb):
+            count = db.expire(expiry * 86400)
+            if count:
+                self.log.info('Expired %i entries older than %i days.',
+                              count, expiry)
+
     def doPrivmsg(self, irc, msg):
         if ircmsgs.isCtcp(msg) and not ircmsgs.isAction(msg):
             return
@@ -31,8 +31,13 @@
 
 from supybot.test import *
 
+import os
+import time
+
 import supybot.ircdb as ircdb
 
+from .plugin import SeenDB
+
 class ChannelDBTestCase(ChannelPluginTestCase):
     plugins = ('Seen', 'User')
     def setUp(self):
@@ -126,6 +131,76 @@ class ChannelDBTestCase(ChannelPluginTestCase):
                                          prefix=self.prefix))
         self.assertNotRegexp('seen user alsdkfjalsdfkj', 'KeyError')
 
+    def testWildcardSpecialCharacters(self):
+        self.irc.feedMsg(ircmsgs.join(self.channel, self.irc.nick,
+                                         prefix=self.prefix))
+        self.assertNotError('config plugins.Seen.minimumNonWildcard 0')
+        self.irc.feedMsg(ircmsgs.privmsg(self.channel, 'hi',
+                                         prefix='foo|away!bar@baz'))
+        self.assertRegexp('seen foo|*', r'^foo\|away was last seen')
+        self.assertRegexp('seen fo.*', '^I haven\'t seen anyone matching')
+
+
+class SeenDBTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.filename = conf.supybot.directories.data.dirize('SeenTest.db')
+        self.db = SeenDB(self.filename)
+
+    def tearDown(self):
+        self.db.close()
+        for suffix in ('', '.journal'):
+            if os.path.exists(self.filename + suffix):
+                os.remove(self.filename + suffix)
+        SupyTestCase.tearDown(self)
+
+    def assertMatches(self, pattern, nicks, channel='#test'):
+        L = self.db.seenWildcard(channel, pattern)
+        self.assertEqual(sorted(nick for (nick, _) in L), sorted(nicks))
+
+    def testWildcard(self):
+        for nick in ('foo', 'Foobar', 'barfoo', 'baz', 'f[o]o'):
+            self.db.update('#test', nick, 'hi')
+        self.db.update('#test', 42, 'hi')
+        self.db.update('#other', 'fool', 'hi')
+        self.assertMatches('foo*', ['foo', 'Foobar'])
+        self.assertMatches('FOO*', ['foo', 'Foobar'])
+        self.assertMatches('*foo', ['foo', 'barfoo'])
+        self.assertMatches('*oba*', ['Foobar'])
+        self.assertMatches('f*o', ['foo', 'f[o]o'])
+        self.assertMatches('f{O}*', ['f[o]o'])
+        self.assertMatches('*', ['foo', 'Foobar', 'barfoo', 'baz', 'f[o]o'])
+        self.assertMatches('fool', ['fool'], channel='#OTHER')
+        self.assertMatches('foo*', [], channel='#nowhere')
+
+        # The index is kept up to date once built.
+        self.db.update('#test', 'afool', 'hi')
+        self.db.update('#test', 'FOO', 'hello')
+        self.assertMatches('*foo*', ['FOO', 'Foobar', 'barfoo', 'afool'])
+        del self.db['#test', 'barfoo']
+        self.assertMatches('*foo*', ['FOO', 'Foobar', 'afool'])
+
+    def testWildcardSortedByTime(self):
+        for (nick, when) in (('foo1', 1000), ('foo2', 1002), ('foo3', 1001)):
+            self.db['#test', nick] = (when, 'hi')
+        self.assertEqual([nick for (nick, _) in
+                          self.db.seenWildcard('#test', 'foo*')],
+                         ['foo2', 'foo3', 'foo1'])
+
+    def testExpire(self):
+        self.db['#test', 'foo'] = (time.time() - 10000, 'old')
+        self.db['#test', 'bar'] = (time.time(), 'new')
+        self.db['#old', 'baz'] = (time.time() - 10000, 'old')
+        self.assertMatches('*', ['foo', 'bar'])
+        self.assertEqual(self.db.expire(5000), 2)
+        self.assertMatches('*', ['bar'])
+        self.assertRaises(KeyError, self.db.seen, '#test', 'foo')
+        self.assertNotIn('#old', self.db.channels)
+        self.db.flush()
+        self.db.close()
+        self.db = SeenDB(self.filename)
+        self.assertEqual(list(self.db.keys()), [('#test', 'bar')])
+
 
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
 
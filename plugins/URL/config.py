@@ -47,6 +47,14 @@ conf.registerChannelValue(URL, 'nonSnarfingRegexp',
     stored in the database for the channel; URLs matching the given regexp will
     not be snarfed.  Give the empty string if you have no URLs that you'd like
     to exclude from being snarfed.""")))
+conf.registerChannelValue(URL, 'maximumUrls',
+    registry.NonNegativeInteger(0, _("""Determines the maximum number of URLs
+    kept in the database for the channel; when more are snarfed, the oldest
+    ones are removed.  0 means no limit.""")))
+conf.registerChannelValue(URL, 'maximumAge',
+    registry.NonNegativeInteger(0, _("""Determines how long (in seconds) URLs
+    are kept in the database for the channel; older ones are removed when new
+    URLs are snarfed.  0 means they are kept forever.""")))
 
 
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
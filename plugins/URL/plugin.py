@@ -29,7 +29,11 @@
 # POSSIBILITY OF SUCH DAMAGE.
 ###
 
+import re
+import csv
+import time
 import itertools
+import collections
 
 import supybot.dbi as dbi
 import supybot.conf as conf
@@ -50,15 +54,148 @@ class UrlRecord(dbi.Record):
         ('at', eval),
         ]
 
+_netlocRe = re.compile(r'//([^/?#]*)')
+def getDomains(url):
+    """Returns the host of the URL, and the domains it is part of (except
+    top-level domains)."""
+    # Faster than urlparse(), which matters when indexing a whole database.
+    match = _netlocRe.search(url)
+    if match is None:
+        return []
+    host = match.group(1).rpartition('@')[2].lower()
+    if host.startswith('['):
+        # IPv6 address
+        return [host.partition(']')[0] + ']']
+    host = host.partition(':')[0]
+    labels = host.split('.')
+    if labels[-1].isdigit():
+        # IPv4 address
+        return [host]
+    return [host] + ['.'.join(labels[i:]) for i in range(1, len(labels) - 1)]
+
+class UrlIndexes(object):
+    """Indexes of the URLs of a database, built the first time they are
+    needed.  They are kept by DbiUrlDB when the database is closed to keep
+    few of them open, so they are not built again when it is reopened."""
+    def __init__(self):
+        # (id, time) of the URLs, from the oldest to the most recent
+        self.urls = None
+        # {nick: ids}, {domain: ids}; from the oldest to the most recent
+        self.byNick = ircutils.IrcDict()
+        self.byDomain = {}
+
+    def build(self, map):
+        if self.urls is not None:
+            return
+        self.urls = collections.deque()
+        for (id, s) in map:
+            # Only deserializes the fields needed, which is more than
+            # twice as fast as creating records.
+            (url, by, near, at) = csv.split(s)
+            self.index(id, eval(url), eval(by), float(at))
+
+    def index(self, id, url, by, at):
+        self.urls.append((id, at))
+        self.byNick.setdefault(by, collections.deque()).append(id)
+        for domain in getDomains(url):
+            self.byDomain.setdefault(domain, collections.deque()).append(id)
+
+    def unindex(self, record):
+        # Records are usually removed from the oldest one, so this
+        # finds them at the start of the deques.
+        for (i, (id, _)) in enumerate(self.urls):
+            if id == record.id:
+                del self.urls[i]
+                break
+        for (index, key) in [(self.byNick, record.by)] + \
+                [(self.byDomain, d) for d in getDomains(record.url)]:
+            ids = index[key]
+            ids.remove(record.id)
+            if not ids:
+                del index[key]
+
 class DbiUrlDB(plugins.DbiChannelDB):
     class DB(dbi.DB):
         Record = UrlRecord
+        def __init__(self, filename, indexes=None):
+            dbi.DB.__init__(self, filename)
+            self.indexes = UrlIndexes() if indexes is None else indexes
+
         def add(self, url, msg):
             record = self.Record(url=url, by=msg.nick,
                                  near=msg.args[1], at=msg.receivedAt)
             super(self.__class__, self).add(record)
-        def urls(self, p):
-            return self.select(p, reverse=True)
+            if self.indexes.urls is not None:
+                self.indexes.index(record.id, record.url, record.by,
+                                   record.at)
+
+        def remove(self, id):
+            if self.indexes.urls is not None:
+                self.indexes.unindex(self.get(id))
+            super(self.__class__, self).remove(id)
+
+        def prune(self, maximumUrls, maximumAge):
+            """Removes the oldest URLs, so there are at most maximumUrls of
+            them and none older than maximumAge seconds (unless they are 0).
+            """
+            if not maximumUrls and not maximumAge:
+                return
+            minimumTime = time.time() - maximumAge
+            if self.indexes.urls is not None:
+                oldest = self.indexes.urls
+            else:
+                # Only reads the URLs to remove and the one after them,
+                # instead of building the indexes.
+                oldest = ((id, float(csv.split(s)[3])) for (id, s) in self.map)
+            count = self.size()
+            removed = []
+            for (id, at) in oldest:
+                if maximumUrls and count > maximumUrls:
+                    removed.append(id)
+                elif maximumAge and at < minimumTime:
+                    removed.append(id)
+                else:
+                    break
+                count -= 1
+            for id in removed:
+                self.remove(id)
+            # Removed URLs are only marked as such in the file.
+            if self.map.tombstones() > max(count, 1000):
+                self.vacuum()
+
+        def urls(self, p, nick=None, domain=None):
+            """Returns the URLs matching the predicate, from the most recent
+            one.  If nick or domain is given, only the URLs snarfed from the
+            nick or in the domain are read."""
+            if nick is None and domain is None:
+                return self.select(p, reverse=True)
+            self.indexes.build(self.map)
+            candidates = []
+            if nick is not None:
+                candidates.append(self.indexes.byNick.get(nick, ()))
+            if domain is not None:
+                candidates.append(
+                    self.indexes.byDomain.get(domain.lower(), ()))
+            ids = list(min(candidates, key=len))
+            return (record for record in map(self.get, reversed(ids))
+                    if p(record))
+
+    def __init__(self, filename):
+        super(DbiUrlDB, self).__init__(filename)
+        # {filename: UrlIndexes}
+        self._indexes = {}
+
+    def _getDb(self, channel):
+        filename = plugins.makeChannelFilename(self.filename, channel)
+        return plugins.channelDbCache.get(
+            (self, filename),
+            lambda: self.DB(filename,
+                            self._indexes.setdefault(filename, UrlIndexes())),
+            self._closeDb)
+
+    def close(self):
+        super(DbiUrlDB, self).close()
+        self._indexes.clear()
 
 URLDB = plugins.DB('URL', {'flat': DbiUrlDB})
 
@@ -70,6 +207,10 @@ class URL(callbacks.Plugin):
         self.__parent.__init__(irc)
         self.db = URLDB()
 
+    def die(self):
+        self.__parent.die()
+        self.db.close()
+
     def doPrivmsg(self, irc, msg):
         if ircmsgs.isCtcp(msg) and not ircmsgs.isAction(msg):
             return
@@ -78,6 +219,7 @@ class URL(callbacks.Plugin):
                 text = ircmsgs.unAction(msg)
             else:
                 text = msg.args[1]
+            added = False
             for url in utils.web.urlRe.findall(text):
                 r = self.registryValue('nonSnarfingRegexp',
                                        msg.channel, irc.network)
@@ -86,6 +228,13 @@ class URL(callbacks.Plugin):
                     continue
                 self.log.debug('Adding %u to db.', url)
                 self.db.add(msg.channel, url, msg)
+                added = True
+            if added:
+                self.db.prune(msg.channel,
+                    self.registryValue('maximumUrls',
+                                       msg.channel, irc.network),
+                    self.registryValue('maximumAge',
+                                       msg.channel, irc.network))
 
     @internationalizeDocstring
     def stats(self, irc, msg, args, channel):
@@ -94,19 +243,19 @@ class URL(callbacks.Plugin):
         Returns the number of URLs in the URL database.  <channel> is only
         required if the message isn't sent in the channel itself.
         """
-        self.db.vacuum(channel)
         count = self.db.size(channel)
         irc.reply(format(_('I have %n in my database.'), (count, 'URL')))
     stats = wrap(stats, ['channeldb'])
 
     @internationalizeDocstring
     def last(self, irc, msg, args, channel, optlist):
-        """[<channel>] [--{from,with,without,near,proto} <value>] [--nolimit]
+        """[<channel>] [--{from,with,without,near,proto,domain} <value>] [--nolimit]
 
         Gives the last URL matching the given criteria.  --from is from whom
         the URL came; --proto is the protocol the URL used; --with is something
         inside the URL; --without is something that should not be in the URL;
-        --near is something in the same message as the URL.  If --nolimit is
+        --near is something in the same message as the URL; --domain is the
+        domain of the URL (or one of its parent domains).  If --nolimit is
         given, returns all the URLs that are found to just the URL.
         <channel> is only necessary if the message isn't sent in the channel
         itself.
@@ -114,14 +263,21 @@ class URL(callbacks.Plugin):
         predicates = []
         f = None
         nolimit = False
+        nick = None
+        domain = None
         for (option, arg) in optlist:
             if isinstance(arg, str):
                 arg = arg.lower()
             if option == 'nolimit':
                 nolimit = True
             elif option == 'from':
+                nick = arg
                 def f(record, arg=arg):
                     return ircutils.strEqual(record.by, arg)
+            elif option == 'domain':
+                domain = arg
+                def f(record, arg=arg):
+                    return arg in getDomains(record.url)
             elif option == 'with':
                 def f(record, arg=arg):
                     return arg in record.url.lower()
@@ -141,7 +297,9 @@ class URL(callbacks.Plugin):
                 if not predicate(record):
                     return False
             return True
-        urls = (record.url for record in self.db.urls(channel, predicate))
+        urls = (record.url for record in self.db.urls(channel, predicate,
+                                                      nick=nick,
+                                                      domain=domain))
         (urls, urls_copy) = itertools.tee(urls)
         first_url = next(urls_copy, None)
         if first_url is None:
@@ -157,7 +315,8 @@ class URL(callbacks.Plugin):
     last = wrap(last, ['channeldb',
                        getopts({'from': 'something', 'with': 'something',
                                 'near': 'something', 'proto': 'something',
-                                'nolimit': '', 'without': 'something',})])
+                                'nolimit': '', 'without': 'something',
+                                'domain': 'something',})])
 
 Class = URL
 
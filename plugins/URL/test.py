@@ -89,5 +89,63 @@ class URLTestCase(ChannelPluginTestCase):
         self.irc.feedMsg(ircmsgs.action(self.channel, urls[1]))
         self.assertNotRegexp('url last', '\\x01')
 
+    def testIndexes(self):
+        for url in urls:
+            self.feedMsg(url)
+        self.feedMsg(urls[1], frm='foo!bar@baz')
+        self.assertResponse('url last --from foo', urls[1])
+        self.assertResponse('url last --from FOO --with sourcereview',
+                            'No URLs matched that criteria.')
+        self.assertResponse('url last --domain SLASHDOT.org', urls[18])
+        self.assertResponse('url last --domain slashdot.org --nolimit',
+                            ', '.join('<%s>' % urls[i]
+                                      for i in (18, 8, 6, 5, 2)))
+        self.assertResponse('url last --domain columbus.rr.com --with old',
+                            urls[14])
+        self.assertResponse('url last --domain dot.org',
+                            'No URLs matched that criteria.')
+
+    def testIndexesKeptWhenClosed(self):
+        cb = self.irc.getCallback('URL')
+        for url in urls:
+            self.feedMsg(url)
+        self.assertResponse('url last --from foo',
+                            'No URLs matched that criteria.')
+        indexes = cb.db._getDb(self.channel).indexes
+        self.assertIsNotNone(indexes.urls)
+        with conf.supybot.databases.plugins.maximumOpen.context(1):
+            cb.db._getDb('#other')
+            db = cb.db._getDb(self.channel)
+            self.assertIs(db.indexes, indexes)
+        self.feedMsg(urls[1], frm='foo!bar@baz')
+        self.assertResponse('url last --from foo', urls[1])
+
+    def testMaximumUrls(self):
+        cb = self.irc.getCallback('URL')
+        with conf.supybot.plugins.URL.maximumUrls.context(3):
+            for url in urls[:5]:
+                self.feedMsg(url)
+            self.assertRegexp('url stats', ' 3 ')
+            # Pruning only reads the oldest URLs
+            self.assertIsNone(cb.db._getDb(self.channel).indexes.urls)
+            self.assertResponse('url last --nolimit',
+                                ', '.join('<%s>' % url
+                                          for url in reversed(urls[2:5])))
+            self.assertResponse('url last --domain sourceforge.net',
+                                'No URLs matched that criteria.')
+            # With the indexes built
+            self.feedMsg(urls[5])
+            self.assertRegexp('url stats', ' 3 ')
+            self.assertResponse('url last --domain slashdot.org --nolimit',
+                                '<%s>' % urls[5])
+
+    def testMaximumAge(self):
+        with conf.supybot.plugins.URL.maximumAge.context(60):
+            self.feedMsg(urls[0])
+            timeFastForward(61)
+            self.feedMsg(urls[1])
+            self.assertRegexp('url stats', ' 1 ')
+            self.assertResponse('url last --nolimit', '<%s>' % urls[1])
+
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
 
@@ -34,6 +34,7 @@ import csv
 import sys
 import time
 import codecs
+import shutil
 import string
 import fnmatch
 import os.path
@@ -95,6 +96,87 @@ def getChannel(channel):
     channelSpecific = conf.supybot.databases.plugins.channelSpecific
     return channelSpecific.getChannelLink(channel)
 
+class ChannelDBCache(object):
+    """The databases opened by :class:`ChannelDBHandler`,
+    :class:`DbiChannelDB`, and :mod:`supybot.sqlitedb` for all plugins.
+    Only the supybot.databases.plugins.maximumOpen most recently used ones
+    are kept open; the others are closed, and opened again when they are
+    needed."""
+    def __init__(self):
+        self._lock = threading.RLock()
+        # {(owner, filename[, thread]): (db, close, thread)}, from the least
+        # recently used to the most recently used.
+        self._dbs = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._dbs)
+
+    def get(self, key, open, close, thread=None):
+        """Returns the database stored at `key`, whose first item is the
+        object owning the database, opening it with `open()` if it is not
+        open.  `close(db)` is called when the database is evicted.
+
+        If `thread` is given, the database is only used by that thread: it
+        is evicted when the thread is over, and only closed if it is evicted
+        by that thread."""
+        with self._lock:
+            entry = self._dbs.get(key)
+            if entry is not None:
+                self._dbs.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            db = open()
+            self._dbs[key] = (db, close, thread)
+            evicted = [k for (k, (_, _, t)) in self._dbs.items()
+                       if t is not None and not t.is_alive()]
+            evicted = [self._dbs.pop(k) for k in evicted]
+            maximum = conf.supybot.databases.plugins.maximumOpen()
+            while len(self._dbs) > maximum:
+                evicted.append(self._dbs.popitem(last=False)[1])
+            self.evictions += len(evicted)
+        for entry in evicted:
+            self._close(entry)
+        return db
+
+    def getAll(self, owner):
+        """Returns the open databases of `owner`."""
+        with self._lock:
+            return [db for (key, (db, _, _)) in self._dbs.items()
+                    if key[0] is owner]
+
+    def closeAll(self, owner):
+        """Closes the databases of `owner`."""
+        with self._lock:
+            keys = [key for key in self._dbs if key[0] is owner]
+            entries = [self._dbs.pop(key) for key in keys]
+        for entry in entries:
+            self._close(entry)
+
+    def pop(self, key):
+        """Removes the database stored at `key` without closing it, and
+        returns it, or None if it is not open."""
+        with self._lock:
+            entry = self._dbs.pop(key, None)
+        return None if entry is None else entry[0]
+
+    def _close(self, entry):
+        (db, close, thread) = entry
+        if thread is not None and thread is not threading.current_thread():
+            # SQLite connections can only be closed by the thread which
+            # opened them, which may still be using it; it is closed once
+            # garbage collected instead.
+            return
+        try:
+            close(db)
+        except Exception:
+            log.exception('Uncaught exception while closing %r:', db)
+
+channelDbCache = ChannelDBCache()
+
 # XXX This shouldn't be a mixin.  This should be contained by classes that
 #     want such behavior.  But at this point, it wouldn't gain much for us
 #     to refactor it.
@@ -105,7 +187,6 @@ class ChannelDBHandler(object):
     """
     suffix = '.db'
     def __init__(self, suffix='.db'):
-        self.dbCache = ircutils.IrcDict()
         suffix = self.suffix
         if self.suffix and self.suffix[0] != '.':
             suffix = '.' + suffix
@@ -123,27 +204,27 @@ class ChannelDBHandler(object):
 
     def getDb(self, channel):
         """Use this to get a database for a specific channel."""
-        currentThread = threading.currentThread()
-        if channel not in self.dbCache and currentThread == world.mainThread:
-            self.dbCache[channel] = self.makeDb(self.makeFilename(channel))
-        if currentThread != world.mainThread:
-            db = self.makeDb(self.makeFilename(channel))
-        else:
-            db = self.dbCache[channel]
+        filename = self.makeFilename(channel)
+        thread = threading.current_thread()
+        db = channelDbCache.get((self, filename, thread),
+                                lambda: self.makeDb(filename),
+                                self.closeDb, thread)
         db.isolation_level = None
         return db
 
+    def closeDb(self, db):
+        """Override this if your databases need to be closed differently."""
+        try:
+            db.commit()
+        except AttributeError: # In case it's not an SQLite database.
+            pass
+        try:
+            db.close()
+        except AttributeError: # In case it doesn't have a close method.
+            pass
+
     def die(self):
-        for db in self.dbCache.values():
-            try:
-                db.commit()
-            except AttributeError: # In case it's not an SQLite database.
-                pass
-            try:
-                db.close()
-            except AttributeError: # In case it doesn't have a close method.
-                pass
-            del db
+        channelDbCache.closeAll(self)
         gc.collect()
 
 
@@ -152,23 +233,22 @@ class DbiChannelDB(object):
     Check out ChannelIdDatabasePlugin for an example of how to use this."""
     def __init__(self, filename):
         self.filename = filename
-        self.dbs = ircutils.IrcDict()
 
     def _getDb(self, channel):
         filename = makeChannelFilename(self.filename, channel)
-        try:
-            db = self.dbs[channel]
-        except KeyError:
-            db = self.DB(filename)
-            self.dbs[channel] = db
-        return db
+        return channelDbCache.get((self, filename),
+                                  lambda: self.DB(filename), self._closeDb)
+
+    @staticmethod
+    def _closeDb(db):
+        db.flush()
+        db.close()
 
     def close(self):
-        for db in self.dbs.values():
-            db.close()
+        channelDbCache.closeAll(self)
 
     def flush(self):
-        for db in self.dbs.values():
+        for db in channelDbCache.getAll(self):
             db.flush()
 
     def __getattr__(self, attr):
@@ -225,43 +305,143 @@ class ChannelUserDictionary(collections.abc.MutableMapping):
 #     would very much feel like an extension, rather than part of the db
 #     itself.
 class ChannelUserDB(ChannelUserDictionary):
+    journaled = False
+    """If True, flush() only appends the entries changed since the last
+    flush to a journal file, instead of rewriting the whole database; and
+    the journal is merged back into the database by a background thread
+    once it grows large.  Subclasses setting this must call markDirty()
+    when they change a value in place instead of setting it."""
+
+    minCompactionSize = 10000
+    """Number of journal entries below which the journal is never merged
+    back into the database."""
+
     def __init__(self, filename):
         ChannelUserDictionary.__init__(self)
         self.filename = filename
+        self.journalFilename = filename + '.journal'
+        self._dirty = set()
+        self._journalLength = 0
+        self._snapshotLength = 0
+        self._compactionThread = None
+        oldJournalFilename = self._oldJournalFilename()
+        if self.journaled and os.path.exists(oldJournalFilename):
+            # A compaction was interrupted; finish it before loading.
+            self._compact(oldJournalFilename)
+        if not os.path.exists(self.filename) \
+                and not os.path.exists(self.journalFilename) \
+                and not os.path.exists(oldJournalFilename):
+            log.warning('Couldn\'t open %s: file does not exist.',
+                        self.filename)
+            return
+        self._snapshotLength = self._load(self.filename, journal=False)
+        if self.journaled:
+            if os.path.exists(oldJournalFilename):
+                # The compaction failed again.
+                self._journalLength = self._load(oldJournalFilename,
+                                                 journal=True)
+            self._journalLength += self._load(self.journalFilename,
+                                              journal=True)
+
+    def _oldJournalFilename(self):
+        return self.journalFilename + '.old'
+
+    @staticmethod
+    def _parseId(id):
         try:
-            fd = codecs.open(self.filename, encoding='utf8')
+            return int(id)
+        except ValueError:
+            # We'll skip over this so, say, nicks can be kept here.
+            return id
+
+    @staticmethod
+    def _readRows(filename):
+        """Yields (lineno, row) for each row of a CSV file, and nothing if
+        it cannot be opened."""
+        try:
+            fd = open(filename, encoding='utf8', newline='')
         except EnvironmentError as e:
-            log.warning('Couldn\'t open %s: %s.', self.filename, e)
+            if os.path.exists(filename):
+                log.warning('Couldn\'t open %s: %s.', filename, e)
             return
+        with fd:
+            yield from enumerate(csv.reader(fd), 1)
+
+    def _load(self, filename, journal):
+        """Loads the database or its journal, and returns its number of
+        rows."""
+        lineno = 0
+        # Rows are usually grouped by channel, so this saves many IrcDict
+        # lookups.
+        lastChannel = None
+        ids = None
         try:
-            reader = csv.reader(fd)
-            try:
-                lineno = 0
-                for t in reader:
-                    lineno += 1
-                    try:
-                        channel = t.pop(0)
-                        id = t.pop(0)
-                        try:
-                            id = int(id)
-                        except ValueError:
-                            # We'll skip over this so, say, nicks can be kept here.
-                            pass
+            for (lineno, t) in self._readRows(filename):
+                try:
+                    if journal:
+                        op = t.pop(0)
+                    channel = t.pop(0)
+                    id = self._parseId(t.pop(0))
+                    if journal and op == '-':
+                        self.channels.get(channel, {}).pop(id, None)
+                        continue
+                    if channel != lastChannel:
                         channel = sys.intern(channel)
-                        v = self.deserialize(channel, id, t)
-                        self[channel, id] = v
-                    except Exception as e:
-                        log.warning('Invalid line #%s in %s.',
-                                    lineno, self.__class__.__name__)
-                        log.debug('Exception: %s', utils.exnToString(e))
-            except Exception as e: # This catches exceptions from csv.reader.
-                log.warning('Invalid line #%s in %s.',
-                            lineno, self.__class__.__name__)
-                log.debug('Exception: %s', utils.exnToString(e))
-        finally:
-            fd.close()
+                        ids = self.channels.get(channel)
+                        if ids is None:
+                            ids = self.channels[channel] = self.IdDict()
+                        lastChannel = channel
+                    ids[id] = self.deserialize(channel, id, t)
+                except Exception as e:
+                    log.warning('Invalid line #%s in %s.',
+                                lineno, self.__class__.__name__)
+                    log.debug('Exception: %s', utils.exnToString(e))
+        except Exception as e: # This catches exceptions from csv.reader.
+            log.warning('Invalid line #%s in %s.',
+                        lineno, self.__class__.__name__)
+            log.debug('Exception: %s', utils.exnToString(e))
+        return lineno
+
+    def __setitem__(self, key, v):
+        ChannelUserDictionary.__setitem__(self, key, v)
+        self.markDirty(*key)
+
+    def __delitem__(self, key):
+        ChannelUserDictionary.__delitem__(self, key)
+        self.markDirty(*key)
+
+    def markDirty(self, channel, id):
+        """Tells the database the value of (channel, id) was changed in
+        place, so it is written by the next flush."""
+        # Without a journal, flush() writes the whole database.
+        if self.journaled:
+            self._dirty.add((channel, id))
 
     def flush(self):
+        if not self.journaled:
+            self._writeSnapshot()
+            return
+        if self._dirty:
+            dirty = self._dirty
+            self._dirty = set()
+            with open(self.journalFilename, 'a', encoding='utf8',
+                      newline='') as fd:
+                writer = csv.writer(fd)
+                for (channel, id) in dirty:
+                    try:
+                        v = self[channel, id]
+                    except KeyError:
+                        writer.writerow(['-', channel, id])
+                    else:
+                        L = self.serialize(v)
+                        writer.writerow(['+', channel, id] + list(L))
+            self._journalLength += len(dirty)
+        if self._journalLength > max(self.minCompactionSize,
+                                     self._snapshotLength) \
+                and self._compactionThread is None:
+            self._startCompaction()
+
+    def _writeSnapshot(self):
         mode = 'wb' if utils.minisix.PY2 else 'w'
         fd = utils.file.AtomicFile(self.filename, mode, makeBackupIfSmaller=False)
         writer = csv.writer(fd)
@@ -284,9 +464,76 @@ class ChannelUserDB(ChannelUserDictionary):
             writer.writerow(L)
         fd.close()
 
+    def _startCompaction(self):
+        # The journal is moved out of the way, so the main thread can
+        # keep appending to a new one while the old one is merged.
+        oldJournalFilename = self._oldJournalFilename()
+        if os.path.exists(oldJournalFilename):
+            # Left by a compaction that failed; its entries are older
+            # than the new ones.
+            with open(oldJournalFilename, 'a', encoding='utf8',
+                      newline='') as oldFd, \
+                    open(self.journalFilename, encoding='utf8',
+                         newline='') as fd:
+                shutil.copyfileobj(fd, oldFd)
+            os.remove(self.journalFilename)
+        else:
+            os.replace(self.journalFilename, oldJournalFilename)
+        self._journalLength = 0
+        self._compactionThread = threading.Thread(
+            target=self._compact, args=(oldJournalFilename,),
+            name='Compaction of %s' % self.filename, daemon=True)
+        self._compactionThread.start()
+
+    def _compact(self, journalFilename):
+        """Merges a journal into the database file.  Only works on files,
+        so it can run in a thread while the database is used.  If it
+        fails, the journal is kept, and merged by the next compaction."""
+        try:
+            self._merge(journalFilename)
+        except Exception:
+            log.exception('Could not compact %s:', self.filename)
+        finally:
+            self._compactionThread = None
+
+    def _merge(self, journalFilename):
+        channels = ircutils.IrcDict()
+        for (_, t) in self._readRows(self.filename):
+            if len(t) >= 2:
+                ids = channels.setdefault(t[0], self.IdDict())
+                ids[self._parseId(t[1])] = t
+        for (_, t) in self._readRows(journalFilename):
+            if len(t) < 3:
+                continue
+            (op, channel, id) = t[0:3]
+            if op == '-':
+                channels.get(channel, {}).pop(self._parseId(id), None)
+            else:
+                ids = channels.setdefault(channel, self.IdDict())
+                ids[self._parseId(id)] = t[1:]
+        length = 0
+        fd = utils.file.AtomicFile(self.filename, makeBackupIfSmaller=False)
+        try:
+            writer = csv.writer(fd)
+            for ids in channels.values():
+                for t in ids.values():
+                    writer.writerow(t)
+                    length += 1
+        except Exception:
+            fd.rollback()
+            raise
+        fd.close()
+        os.remove(journalFilename)
+        self._snapshotLength = length
+
     def close(self):
         self.flush()
-        self.clear()
+        thread = self._compactionThread
+        if thread is not None:
+            thread.join()
+        # Not self.clear(), which would mark all entries as deleted.
+        self.channels.clear()
+        self._dirty.clear()
 
     def deserialize(self, channel, id, L):
         """Should take a list of strings and return an object to be accessed
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+"""Benchmarks callbacks._addressed on channel messages, with the
+configuration cached by callbacks.addressingConfigs, and when it is read
+from the registry for every message.
+
+Usage: bench_addressed.py [<messages>]"""
+
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.test as test
+    import supybot.ircmsgs as ircmsgs
+    import supybot.registry as registry
+    import supybot.callbacks as callbacks
+
+    conf.supybot.reply.whenAddressedBy.nicks.setValue(['bot1', 'bot2'])
+    conf.supybot.reply.whenAddressedBy.nick.atEnd.setValue(True)
+    conf.registerNetwork('test')
+    irc = test.getTestIrc()
+    payloads = ['hello there, how is everyone doing?', '@echo foo',
+                'test: echo foo', 'what do you think, test']
+    msgs = []
+    for i in range(count):
+        msg = ircmsgs.privmsg('#chan%i' % (i % 20),
+                              payloads[i % len(payloads)])
+        irc._tagMsg(msg)
+        msgs.append(msg)
+
+    start = time.perf_counter()
+    for msg in msgs:
+        registry._generation += 1
+        callbacks._addressed(irc, msg)
+    uncachedTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for msg in msgs:
+        callbacks._addressed(irc, msg)
+    cachedTime = time.perf_counter() - start
+
+    print('%i messages: %.1f us/message reading the registry, '
+          '%.1f us/message with the cache' % (
+          count, uncachedTime / count * 10**6, cachedTime / count * 10**6))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
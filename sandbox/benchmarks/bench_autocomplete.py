@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+
+
+"""Benchmarks finding the commands starting with what a user typed, with
+many plugins loaded, using the prefix tree of the Autocomplete plugin and by
+listing the commands of each plugin like it was done before the tree.
+
+Usage: bench_autocomplete.py [<plugins> [<commands per plugin>]]"""
+
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+
+def main():
+    pluginCount = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    commandCount = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    requests = 1000
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.plugin as plugin
+    import supybot.callbacks as callbacks
+    Autocomplete = plugin.loadPluginModule('Autocomplete').plugin
+
+    def command(self, irc, msg, args):
+        pass
+    plugins = []
+    for i in range(pluginCount):
+        attrs = dict(('command%ix%i' % (i, j), command)
+                     for j in range(commandCount))
+        plugins.append(type('Plugin%i' % i, (callbacks.Plugin,), attrs)(None))
+
+    def scan(cbs, payload):
+        candidates = set()
+        for cb in cbs:
+            commands = cb.listCommands()
+            name = cb.canonicalName()
+            commands += [name + ' ' + command for command in commands]
+            candidates |= {command for command in commands
+                           if command.startswith(payload)}
+        return candidates
+
+    # What a user typing a command sends, one keystroke at a time
+    payloads = []
+    for i in range(requests // 10):
+        name = 'plugin%i command%ix%i' % (i % pluginCount, i % pluginCount,
+                                          i % commandCount)
+        payloads.extend(name[:n] for n in range(1, 11))
+
+    start = time.perf_counter()
+    for payload in payloads:
+        scan(plugins, payload)
+    scanTime = time.perf_counter() - start
+
+    trie = Autocomplete.CommandTrie()
+    start = time.perf_counter()
+    trie.refresh(plugins)
+    buildTime = time.perf_counter() - start
+    start = time.perf_counter()
+    for payload in payloads:
+        trie.refresh(plugins)
+        trie.complete(payload)
+    trieTime = time.perf_counter() - start
+
+    print('%i plugins, %i requests: listing commands %.1f us/request, '
+          'prefix tree %.1f us/request (built in %.1f ms)' % (
+          pluginCount, len(payloads), scanTime / len(payloads) * 10**6,
+          trieTime / len(payloads) * 10**6, buildTime * 1000))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+
+"""Benchmarks BadWords' matcher with <patterns> words and phrases against
+chat-like messages, compared to the alternation regexp it replaced; both
+to check messages (as when kicking) and to censor them (as in
+selfCensor), with and without word boundaries.
+
+Usage: bench_badwords.py [<patterns> [<messages>]]"""
+
+import os
+import re
+import sys
+import time
+import random
+import atexit
+import shutil
+import tempfile
+
+COMMON = '''the be to of and a in that have I it for not on with he as you do at
+this but his by from they we say her she or an will my one all would there
+their what so up out if about who get which go me when make can like time no
+just him know take people into year your good some could them see other than
+then now look only come its over think also back after use two how our work
+first well way even new want because any these give day most us lol brb afk
+thanks :) ok yeah hi hello bot python irc channel server kick ban op'''.split()
+
+SYLLABLES = ['ba', 'ko', 'ri', 'zu', 'ne', 'fla', 'gor', 'shi', 'mp', 'tch',
+             'ark', 'ull', 'ox', 'ee', 'qu', 'wy', 'dre', 'sn']
+
+def main():
+    patternCount = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    messageCount = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.plugin as plugin
+    BadWords = plugin.loadPluginModule('BadWords')
+
+    random.seed(42)
+    patterns = set()
+    while len(patterns) < patternCount:
+        word = ''.join(random.choice(SYLLABLES)
+                       for i in range(random.randint(2, 4)))
+        if random.random() < 0.1:
+            word += ' ' + random.choice(COMMON)
+        patterns.add(word)
+    patterns = list(patterns)
+    messages = []
+    for i in range(messageCount):
+        words = [random.choice(COMMON) for j in range(random.randint(3, 25))]
+        if random.random() < 0.05:
+            words.insert(random.randrange(len(words)),
+                         random.choice(patterns))
+        messages.append(' '.join(words))
+
+    def replace(word):
+        return '!' * len(word)
+
+    start = time.perf_counter()
+    matcher = BadWords.plugin.AhoCorasick(patterns)
+    buildTime = time.perf_counter() - start
+    start = time.perf_counter()
+    regexps = {}
+    for boundaries in (False, True):
+        s = '(%s)' % '|'.join(map(re.escape, patterns))
+        if boundaries:
+            s = r'\b%s\b' % s
+        regexps[boundaries] = re.compile(s, re.I)
+    compileTime = time.perf_counter() - start
+    print('%i patterns: automaton built in %.0f ms, regexps compiled in '
+          '%.0f ms' % (patternCount, buildTime * 1000, compileTime * 1000))
+
+    for boundaries in (False, True):
+        regexp = regexps[boundaries]
+        results = {}
+        for (name, search, sub) in (
+                ('regexp', regexp.search, lambda s: regexp.sub(
+                    lambda m: replace(m.group(1)), s)),
+                ('automaton', lambda s: matcher.search(s, boundaries),
+                 lambda s: matcher.sub(replace, s, boundaries))):
+            start = time.perf_counter()
+            found = sum(1 for s in messages if search(s))
+            searchTime = time.perf_counter() - start
+            start = time.perf_counter()
+            censored = [sub(s) for s in messages]
+            subTime = time.perf_counter() - start
+            results[name] = (found, censored)
+            print('%-9s word boundaries=%-5s: %6.1f us per search, '
+                  '%6.1f us per sub (%i messages censored)' % (
+                  name, boundaries, searchTime / len(messages) * 10**6,
+                  subTime / len(messages) * 10**6, found))
+        if results['regexp'][0] != results['automaton'][0]:
+            print('Warning: different number of matches.')
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
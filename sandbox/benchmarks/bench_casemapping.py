@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+
+"""Benchmarks nick lookups in the state of a big channel: a NAMES reply
+with <users> nicks is parsed, then each nick is looked up in the channel's
+sets and in the hostmask dictionary, in various cases.
+
+Usage: bench_casemapping.py [<users> [<rounds>]]"""
+
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+
+def main():
+    userCount = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.irclib as irclib
+    import supybot.ircutils as ircutils
+
+    nicks = ['User[%i]' % i for i in range(userCount)]
+    variants = [nicks, [n.lower() for n in nicks], [n.upper() for n in nicks]]
+
+    start = time.perf_counter()
+    chan = irclib.ChannelState()
+    hostmasks = ircutils.IrcDict()
+    for (i, nick) in enumerate(nicks):
+        chan.addUser('@' + nick if i % 10 == 0 else nick)
+        hostmasks[nick] = '%s!user@host' % nick
+    fill = time.perf_counter() - start
+
+    lookups = 0
+    start = time.perf_counter()
+    for i in range(rounds):
+        for names in variants:
+            for nick in names:
+                assert nick in chan.users
+                chan.isOp(nick)
+                chan.isVoicePlus(nick)
+                hostmasks[nick]
+                ircutils.strEqual(nick, names[0])
+                lookups += 1
+    elapsed = time.perf_counter() - start
+
+    print('%i users: %.1f ms to fill the channel, %.2f us per nick '
+          '(5 lookups)' % (userCount, fill * 1000,
+                           elapsed / lookups * 10**6))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
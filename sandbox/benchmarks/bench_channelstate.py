@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+
+"""Benchmarks the memory used by IrcState for a bot in <channels>
+channels with <memberships> memberships of <users> distinct users, built
+from synthetic NAMES bursts (with userhost-in-names, so hostmasks are
+known too); as well as the number of objects tracked by the garbage
+collector.
+
+Usage: bench_channelstate.py [<channels> [<memberships> [<users>]]]"""
+
+import os
+import gc
+import sys
+import time
+import random
+import atexit
+import shutil
+import tempfile
+import tracemalloc
+
+class FakeIrc:
+    nick = 'bot'
+    prefix = 'bot!bot@bot.example.org'
+
+def main():
+    channelCount = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    membershipCount = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    userCount = int(sys.argv[3]) if len(sys.argv) > 3 else 50000
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.irclib as irclib
+    import supybot.ircmsgs as ircmsgs
+
+    random.seed(42)
+    hostmasks = ['User%i!~user%i@host-%i.example.org' % (i, i, i % 1000)
+                 for i in range(userCount)]
+    prefixes = ['', '', '', '', '', '', '', '+', '@', '%']
+    members = [[] for i in range(channelCount)]
+    for i in range(membershipCount):
+        members[random.randrange(channelCount)].append(
+            random.choice(prefixes) + random.choice(hostmasks))
+
+    def burst(state):
+        irc = FakeIrc()
+        for (i, items) in enumerate(members):
+            channel = '#channel%i' % i
+            state.addMsg(irc, ircmsgs.join(channel, prefix=irc.prefix))
+            # Servers split NAMES replies in lines of about 400 bytes.
+            for j in range(0, len(items), 8):
+                state.addMsg(irc, ircmsgs.IrcMsg(command='353', args=(
+                    'bot', '=', channel, ' '.join(items[j:j+8]))))
+            state.addMsg(irc, ircmsgs.IrcMsg(command='366', args=(
+                'bot', channel, 'End of /NAMES list.')))
+
+    with conf.supybot.protocols.irc.maxHistoryLength.context(1):
+        gc.collect()
+        objects = len(gc.get_objects())
+        tracemalloc.start()
+        start = time.perf_counter()
+        state = irclib.IrcState()
+        burst(state)
+        elapsed = time.perf_counter() - start
+        gc.collect()
+        (current, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        objects = len(gc.get_objects()) - objects
+
+    print('%i channels, %i memberships, %i users: %.1f MB used, '
+          '%i more objects tracked by the GC, %.1f s' % (
+          channelCount, membershipCount, len(state.nicksToHostmasks),
+          current / 2**20, objects, elapsed))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
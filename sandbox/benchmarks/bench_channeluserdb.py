@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+"""Benchmarks supybot.plugins.ChannelUserDB with Seen-like entries: loading,
+and flushing after a batch of updates, with and without journaling.
+
+Usage: bench_channeluserdb.py [<entries> [<updates per flush>]]"""
+
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 10**6
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.plugins as plugins
+    conf.supybot.log.stdout.setValue(False)
+
+    class SeenDB(plugins.ChannelUserDB):
+        def serialize(self, v):
+            return list(v)
+
+        def deserialize(self, channel, id, L):
+            (seen, saying) = L
+            return (float(seen), saying)
+
+    filename = os.path.join(tmpdir, 'Seen.db')
+    with open(filename, 'w') as fd:
+        for i in range(entries):
+            fd.write('#channel%i,nick%i,%f,<nick%i> hello world\r\n'
+                     % (i % 1000, i, time.time(), i))
+
+    for journaled in (False, True):
+        SeenDB.journaled = journaled
+        start = time.perf_counter()
+        db = SeenDB(filename)
+        print('journaled=%s: load: %.2f s' %
+              (journaled, time.perf_counter() - start))
+        for i in range(updates):
+            db['#channel%i' % (i % 1000), 'nick%i' % i] = (time.time(), 'hi')
+        start = time.perf_counter()
+        db.flush()
+        print('journaled=%s: flush of %i updates: %.2f ms' % (
+            journaled, updates, (time.perf_counter() - start) * 1000))
+        start = time.perf_counter()
+        db.close()
+        print('journaled=%s: close: %.2f s' % (
+            journaled, time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+"""Benchmarks supybot.dbi.DB on top of a FlatfileMapping, with the same
+record type as ChannelIdDatabasePlugin (Lart, Praise, Dunno, ...).
+
+Usage: bench_dbi.py [<number of records>]  (defaults to one million)"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+import supybot.dbi as dbi
+
+class Record(dbi.Record):
+    __fields__ = [
+        'at',
+        'by',
+        'text',
+        ]
+
+def timeit(name, f, n=1):
+    start = time.perf_counter()
+    for _ in range(n):
+        f()
+    elapsed = time.perf_counter() - start
+    print('%-30s %10.2f µs/op' % (name, elapsed / n * 10**6))
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10**6
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'bench.db')
+        # Build the file directly; adding a million records through the API
+        # would mostly measure open()/close().
+        with open(filename, 'w', encoding='utf8') as fd:
+            maxSize = max(6, len(str(size + 1)))
+            fd.write('%s\n' % str(size + 1).zfill(maxSize))
+            for i in range(1, size + 1):
+                record = Record(at=time.time(), by=i % 1000,
+                                text='record number %s' % i)
+                fd.write('%s:%s\n' % (str(i).zfill(maxSize),
+                                      record.serialize()))
+
+        start = time.perf_counter()
+        db = dbi.DB(filename, Mapping='flat', Record=Record)
+        print('%-30s %10.2f s' % ('open (%s records)' % size,
+                                  time.perf_counter() - start))
+
+        ids = [random.randint(1, size) for _ in range(1000)]
+        it = iter(ids * 10)
+        timeit('get', lambda: db.get(next(it)), 1000)
+        it = iter(ids * 10)
+        timeit('set', lambda: db.set(next(it), Record(at=0, by=0, text='x')),
+               1000)
+        timeit('add', lambda: db.add(Record(at=0, by=0, text='y')), 1000)
+        removed = iter(set(ids))
+        timeit('remove', lambda: db.remove(next(removed)), 100)
+        timeit('size', db.size, 1000)
+        timeit('random', db.random, 1000)
+
+        start = time.perf_counter()
+        db.vacuum()
+        print('%-30s %10.2f s' % ('vacuum', time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+
+"""Benchmarks finding the plugins having a command, with many plugins
+loaded, using supybot.callbacks.commandIndex and by asking each plugin
+like it was done before the index.
+
+Usage: bench_dispatch.py [<plugins> [<commands per plugin>]]"""
+
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+
+def main():
+    pluginCount = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    commandCount = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    lookups = 10000
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.callbacks as callbacks
+
+    def command(self, irc, msg, args):
+        pass
+    plugins = []
+    for i in range(pluginCount):
+        attrs = dict(('command%ix%i' % (i, j), command)
+                     for j in range(commandCount))
+        plugins.append(type('Plugin%i' % i, (callbacks.Plugin,), attrs)(None))
+
+    argsList = [['command%ix%i' % (i % pluginCount, i % commandCount), 'arg']
+                for i in range(lookups)]
+    argsList += [['plugin%i' % (i % pluginCount), 'command%ix0' % i]
+                 for i in range(lookups)]
+
+    start = time.perf_counter()
+    for args in argsList:
+        for cb in plugins:
+            cb.getCommand(args)
+    scanTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    callbacks.commandIndex.find(plugins, argsList[0])
+    buildTime = time.perf_counter() - start
+    start = time.perf_counter()
+    for args in argsList:
+        callbacks.commandIndex.find(plugins, args)
+    indexTime = time.perf_counter() - start
+
+    print('%i plugins, %i lookups: asking each plugin %.1f us/lookup, '
+          'index %.1f us/lookup (built in %.1f ms)' % (
+          pluginCount, len(argsList), scanTime / len(argsList) * 10**6,
+          indexTime / len(argsList) * 10**6, buildTime * 1000))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+
+
+
+"""Benchmarks looking up factoids, suggesting keys close to mistyped ones,
+and searching keys and values, in a channel with many factoids, with the
+queries the Factoids plugin used to run and with its current indexes.
+
+Usage: bench_factoids.py [<factoids> [<queries>]]"""
+
+import os
+import sys
+import time
+import atexit
+import random
+import shutil
+import sqlite3
+import tempfile
+
+SYLLABLES = ['ba', 'ko', 'ri', 'tu', 'zen', 'mo', 'la', 'pi', 'ster', 'qu',
+             'an', 'el', 'or', 'ix', 'us', 'py', 'th', 'on', 'ch', 'ne']
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+def main():
+    factoidCount = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    queryCount = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.plugin as plugin
+    from supybot.utils.seq import dameraulevenshtein
+    Factoids = plugin.loadPluginModule('Factoids').plugin
+
+    rng = random.Random(42)
+    keys = set()
+    while len(keys) < factoidCount:
+        keys.add(' '.join(word(rng) for _ in range(rng.randint(1, 2))))
+    keys = sorted(keys)
+    rng.shuffle(keys)
+
+    def fill(db):
+        db.execute('BEGIN')
+        db.executemany('INSERT INTO keys VALUES (?, ?)', enumerate(keys, 1))
+        db.executemany('INSERT INTO factoids VALUES (?, ?, ?, ?, ?)',
+                       ((i, 'bench', 0, 'the value of %s' % key, 0)
+                        for (i, key) in enumerate(keys, 1)))
+        db.executemany('INSERT INTO relations VALUES (?, ?, ?, ?)',
+                       ((i, i, i, 0) for i in range(1, len(keys) + 1)))
+        db.execute('COMMIT')
+
+    # Database without the indexes, as created by older versions
+    oldDb = sqlite3.connect('old.db', isolation_level=None)
+    oldDb.executescript("""
+        CREATE TABLE keys (id INTEGER PRIMARY KEY,
+                           key TEXT UNIQUE ON CONFLICT REPLACE);
+        CREATE TABLE factoids (id INTEGER PRIMARY KEY, added_by TEXT,
+                               added_at TIMESTAMP,
+                               fact TEXT UNIQUE ON CONFLICT REPLACE,
+                               locked BOOLEAN);
+        CREATE TABLE relations (id INTEGER PRIMARY KEY, key_id INTEGER,
+                                fact_id INTEGER, usage_count INTEGER);
+        """)
+    start = time.perf_counter()
+    fill(oldDb)
+    print('%i factoids inserted without indexes in %.1f s' % (
+          len(keys), time.perf_counter() - start))
+    cb = Factoids.Class(None)
+    db = cb.getDb('#test')
+    start = time.perf_counter()
+    fill(db)
+    print('%i factoids inserted with indexes in %.1f s' % (
+          len(keys), time.perf_counter() - start))
+
+    def mistype(key):
+        i = rng.randrange(1, len(key))
+        return key[:i] + 'x' + key[i+1:]
+    exact = [key.upper() for key in rng.sample(keys, queryCount)]
+    typos = [mistype(key) for key in rng.sample(keys, queryCount)]
+    values = ['%%%s%%' % key for key in rng.sample(keys, queryCount)]
+    oldCursor = oldDb.cursor()
+    cursor = db.cursor()
+
+    def oldLookup(key):
+        oldCursor.execute("""SELECT factoids.fact, factoids.id, relations.id
+                          FROM factoids, keys, relations
+                          WHERE keys.key LIKE ? AND relations.key_id=keys.id
+                          AND relations.fact_id=factoids.id
+                          ORDER BY factoids.id LIMIT 20""", (key,))
+        return oldCursor.fetchall()
+
+    def oldSuggest(key):
+        oldCursor.execute("SELECT key FROM keys WHERE key LIKE ?",
+                       ('%' + key + '%',))
+        wildcardkeys = oldCursor.fetchall()
+        if wildcardkeys:
+            return [line[0] for line in wildcardkeys]
+        oldCursor.execute("SELECT key FROM keys WHERE key LIKE ?",
+                       (key[0] + '%',))
+        flkeys = [line[0] for line in oldCursor.fetchall()]
+        metrics = {k: dameraulevenshtein(key, k) for k in flkeys}
+        for maxdistance in (2, 3):
+            L = [k for (k, d) in metrics.items() if d <= maxdistance]
+            if L:
+                return L
+        return []
+
+    def oldSearchValues(pattern):
+        oldCursor.execute("""SELECT DISTINCT keys.key
+                          FROM keys, factoids, relations
+                          WHERE factoids.fact LIKE ?
+                          AND factoids.id=relations.fact_id
+                          AND keys.id=relations.key_id
+                          ORDER BY keys.key""", (pattern,))
+        return oldCursor.fetchall()
+
+    def newSearchValues(pattern):
+        cursor.execute(cb._expandTarget(db, """SELECT DISTINCT keys.key
+                          FROM keys, factoids, relations
+                          WHERE TARGET_LIKE
+                          AND factoids.id=relations.fact_id
+                          AND keys.id=relations.key_id
+                          ORDER BY keys.key""", 'factoids.fact'), (pattern,))
+        return cursor.fetchall()
+
+    def bench(name, old, new, queries):
+        start = time.perf_counter()
+        oldResults = [sorted(old(query)) for query in queries]
+        oldTime = (time.perf_counter() - start) / len(queries)
+        start = time.perf_counter()
+        newResults = [sorted(new(query)) for query in queries]
+        newTime = (time.perf_counter() - start) / len(queries)
+        assert oldResults == newResults, name
+        print('%s: before %.2f ms/query, after %.2f ms/query' % (
+              name, oldTime * 1000, newTime * 1000))
+
+    bench('whatis', oldLookup, lambda key: cb._lookupFactoid('#test', key),
+          exact)
+
+    # Suggestions compare all the keys until the trees, built in threads,
+    # are ready.
+    bench('typo suggestions (no tree yet)', oldSuggest,
+          lambda key: cb._searchFactoid('#test', key), typos[:5])
+    start = time.perf_counter()
+    for key in typos:
+        while cb._getKeyTree(db, key) is None:
+            time.sleep(0.01)
+    print('typo suggestions: BK-trees of %i letters built in %.1f s' % (
+          len({key[0] for key in typos}), time.perf_counter() - start))
+    bench('typo suggestions', oldSuggest,
+          lambda key: cb._searchFactoid('#test', key), typos)
+
+    bench('search --values', oldSearchValues, newSearchValues, values)
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+
+
+"""Benchmarks the overhead of the sandbox and of HTTP Signatures of the
+Fediverse plugin: running a sandboxed function in a new process for each
+call (as it was done before) and in a reused worker; and signing every
+request or reusing signatures.
+
+Usage: bench_fediverse.py [<calls>]"""
+
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.world as world
+    import supybot.plugin as plugin
+    import supybot.commands as commands
+    # Set by the command line of the bot
+    world.disableMultiprocessing = False
+    ap = plugin.loadPluginModule('Fediverse').activitypub
+
+    content = b'<?xml version="1.0"?><XRD xmlns="%s"><Link rel="lrdd" ' \
+              b'template="https://example.org/.well-known/webfinger?' \
+              b'resource={uri}"/></XRD>' % ap.XRD_URI[1:-1].encode()
+    parse = ap._parse_host_meta.__wrapped__
+
+    start = time.perf_counter()
+    for i in range(calls):
+        commands.process(parse, content, timeout=20, pn='Fediverse',
+                         cn='_parse_host_meta')
+    forkTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(calls):
+        ap._parse_host_meta(content)
+    workerTime = time.perf_counter() - start
+    ap.stop_workers()
+
+    conf.supybot.servers.http.publicUrl.setValue('https://bot.example.org/')
+    url = 'https://example.org/users/someuser'
+    start = time.perf_counter()
+    for i in range(calls):
+        ap._sign('get', url, {'Accept': ap.ACTIVITY_MIMETYPE,
+                              'Date': 'Thu, 01 Jan 2026 00:00:00 GMT'})
+    signTime = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(calls):
+        ap._sign('get', url, {'Accept': ap.ACTIVITY_MIMETYPE})
+    reuseTime = time.perf_counter() - start
+
+    print('%i calls: new process %.2f ms/call, worker %.2f ms/call; '
+          'signing %.2f ms/request, reusing signatures %.2f ms/request' % (
+          calls, forkTime / calls * 1000, workerTime / calls * 1000,
+          signTime / calls * 1000, reuseTime / calls * 1000))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+"""Benchmarks the memory used by ircutils.FloodQueue when a million
+distinct hosts send a message, a thousand per second, with the default
+flood interval of 60 seconds; and the time taken by enqueue, len and has.
+
+Usage: bench_floodqueue.py [<hosts> [<hosts per second>]]"""
+
+import os
+import gc
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+import tracemalloc
+
+def main():
+    hostCount = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rate = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    timeout = 60
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.ircmsgs as ircmsgs
+    import supybot.ircutils as ircutils
+
+    msgs = [ircmsgs.privmsg('#chan', 'hello',
+                            prefix='nick%i!user@host%i.example.org' % (i, i))
+            for i in range(hostCount)]
+    for msg in msgs:
+        hash(msg) # It's cached in the message, don't count it.
+    now = [1000000.0]
+    realTime = time.time
+    time.time = lambda: now[0]
+
+    def run():
+        q = ircutils.FloodQueue(timeout)
+        for msg in msgs:
+            now[0] += 1 / rate
+            q.enqueue(msg)
+            q.len(msg)
+            q.has(msg)
+        return q
+
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    q = run()
+    gc.collect()
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    time.time = realTime
+
+    print('%i hosts: %.1f us/message, %i hosts tracked, '
+          '%.1f MB used (peak: %.1f MB)' % (
+          hostCount, elapsed / hostCount * 10**6, len(q.queues),
+          current / 2**20, peak / 2**20))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
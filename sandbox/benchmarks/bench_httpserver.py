@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+"""Load-tests the embedded HTTP server (supybot.httpserver) with local
+clients, while other clients request a slow page.
+
+Usage: bench_httpserver.py [<workers> [<clients> [<requests per client>]]]
+
+<workers> is the value of supybot.servers.http.workers; 0 is the
+single-threaded mode."""
+
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+import http.client
+
+class Timer:
+    def __init__(self):
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def add(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def percentile(self, p):
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    conf.supybot.servers.http.workers.setValue(workers)
+    import supybot.httpserver as httpserver
+
+    class FastCallback(httpserver.SupyHTTPServerCallback):
+        name = 'fast'
+        def doGet(self, handler, path):
+            response = b'x' * 1024
+            self.send_response(200)
+            self.send_header('Content-Length', len(response))
+            self.end_headers()
+            self.wfile.write(response)
+
+    class SlowCallback(httpserver.SupyHTTPServerCallback):
+        name = 'slow'
+        def doGet(self, handler, path):
+            # A page that takes long to build, streamed in small pieces
+            def chunks():
+                for i in range(10):
+                    time.sleep(0.01)
+                    yield 'row %i\n' % i * 100
+            self.writeStream(handler, 200, {}, chunks())
+
+    class RequestHandler(httpserver.SupyHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass # Don't benchmark the logger
+
+    server = httpserver.RealSupyHTTPServer(
+        ('127.0.0.1', 0), 4, RequestHandler)
+    server.hook('fast', FastCallback())
+    server.hook('slow', SlowCallback())
+    serverThread = threading.Thread(target=server.serve_forever)
+    serverThread.start()
+
+    stop = threading.Event()
+    fast = Timer()
+    slow = Timer()
+
+    def client(path, timer, n=None):
+        conn = http.client.HTTPConnection(*server.server_address)
+        i = 0
+        while not stop.is_set() and (n is None or i < n):
+            start = time.perf_counter()
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.will_close:
+                conn.close()
+                conn = http.client.HTTPConnection(*server.server_address)
+            timer.add(time.perf_counter() - start)
+            i += 1
+        conn.close()
+
+    slowThreads = [threading.Thread(target=client, args=('/slow/', slow))
+                   for _ in range(2)]
+    fastThreads = [threading.Thread(target=client,
+                                    args=('/fast/', fast, requests))
+                   for _ in range(clients)]
+    for t in slowThreads:
+        t.start()
+    start = time.perf_counter()
+    for t in fastThreads:
+        t.start()
+    for t in fastThreads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for t in slowThreads:
+        t.join()
+    server.shutdown()
+    server.server_close()
+    serverThread.join()
+
+    print('workers=%i clients=%i' % (workers, clients))
+    print('fast page: %.0f requests/s, p50 %.2f ms, p99 %.2f ms' % (
+        len(fast.latencies) / elapsed,
+        fast.percentile(0.5) * 1000, fast.percentile(0.99) * 1000))
+    print('slow page: %i requests, p50 %.2f ms' % (
+        len(slow.latencies), slow.percentile(0.5) * 1000))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+
+"""Benchmarks enqueuing and then draining messages from each of the queues
+of supybot.irclib.schedulers, with duplicate detection enabled.
+
+Usage: bench_ircmsgqueue.py [<messages>]"""
+
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10**5
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.irclib as irclib
+    import supybot.ircmsgs as ircmsgs
+
+    conf.supybot.protocols.irc.queuing.duplicates.setValue(True)
+    msgs = []
+    for i in range(count):
+        if i % 10 == 0:
+            msgs.append(ircmsgs.mode('#channel%i' % (i % 100),
+                                     ('+v', 'nick%i' % i)))
+        else:
+            msgs.append(ircmsgs.privmsg('#channel%i' % (i % 100),
+                                        'line %i' % i))
+
+    for (name, scheduler) in sorted(irclib.schedulers.items()):
+        q = scheduler()
+        start = time.perf_counter()
+        for msg in msgs:
+            q.enqueue(msg)
+        enqueueTime = time.perf_counter() - start
+        start = time.perf_counter()
+        while q:
+            q.dequeue()
+        dequeueTime = time.perf_counter() - start
+        print('%s: %i messages: enqueue %.3f s, drain %.3f s' %
+              (name, count, enqueueTime, dequeueTime))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+"""Measures how long logging takes in the thread that logs (ie. the main
+loop, for most of the bot's logs), with and without
+supybot.log.asynchronous.
+
+Usage: bench_log.py [<records> [<write delay in µs>]]
+
+The write delay is added to each write to the log file, to simulate a slow
+disk."""
+
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    delay = float(sys.argv[2]) / 10**6 if len(sys.argv) > 2 else 0
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log as log
+
+    conf.supybot.log.stdout.setValue(False)
+    if delay:
+        emit = log.BetterFileHandler.emit
+        def slowEmit(self, record):
+            time.sleep(delay)
+            emit(self, record)
+        log.BetterFileHandler.emit = slowEmit
+
+    for asynchronous in (False, True):
+        conf.supybot.log.asynchronous.setValue(asynchronous)
+        start = time.perf_counter()
+        for i in range(records):
+            log.info('Message number %s from %s.', i, 'benchmark')
+        elapsed = time.perf_counter() - start
+        if asynchronous:
+            # Drains the queue
+            conf.supybot.log.asynchronous.setValue(False)
+            total = time.perf_counter() - start
+        else:
+            total = elapsed
+        print('asynchronous=%s: %8.2f µs/record in the logging thread, '
+              '%.2f s until written' % (asynchronous,
+                                        elapsed / records * 10**6, total))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+
+"""Benchmarks the handling of a netsplit by IrcState: the bot is in
+<channels> channels, with <users> other users who are each in 1 to 5 of
+them; then half of the users QUIT, the other half change their nick.
+
+Usage: bench_netsplit.py [<channels> [<users>]]"""
+
+import os
+import sys
+import time
+import random
+import atexit
+import shutil
+import tempfile
+
+class FakeIrc:
+    nick = 'bot'
+    prefix = 'bot!bot@bot.example.org'
+
+def main():
+    channelCount = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    userCount = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.irclib as irclib
+    import supybot.ircmsgs as ircmsgs
+
+    random.seed(42)
+    channels = ['#channel%i' % i for i in range(channelCount)]
+    members = dict((channel, ['bot']) for channel in channels)
+    nicks = ['user%i' % i for i in range(userCount)]
+    for nick in nicks:
+        for channel in random.sample(channels, random.randint(1, 5)):
+            members[channel].append(nick)
+
+    irc = FakeIrc()
+    state = irclib.IrcState()
+    for channel in channels:
+        state.addMsg(irc, ircmsgs.join(channel, prefix=irc.prefix))
+        state.addMsg(irc, ircmsgs.IrcMsg(command='353', args=(
+            'bot', '=', channel, ' '.join(members[channel]))))
+
+    quits = [ircmsgs.IrcMsg(prefix='%s!u@h' % nick, command='QUIT',
+                            args=('*.net *.split',))
+             for nick in nicks[::2]]
+    renames = [ircmsgs.IrcMsg(prefix='%s!u@h' % nick, command='NICK',
+                              args=(nick + '_',))
+               for nick in nicks[1::2]]
+
+    start = time.perf_counter()
+    for msg in quits:
+        state.addMsg(irc, msg)
+    quitTime = time.perf_counter() - start
+    start = time.perf_counter()
+    for msg in renames:
+        state.addMsg(irc, msg)
+    nickTime = time.perf_counter() - start
+
+    print('%i channels, %i users: %.1f us per QUIT, %.1f us per NICK' % (
+        channelCount, userCount, quitTime / len(quits) * 10**6,
+        nickTime / len(renames) * 10**6))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
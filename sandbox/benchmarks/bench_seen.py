@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+
+"""Benchmarks wildcard searches of the Seen plugin, compared to testing the
+pattern against every entry of the database.
+
+Usage: bench_seen.py [<entries> [<channels>]]"""
+
+import os
+import re
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 5 * 10**6
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.ircutils as ircutils
+    from supybot.plugins.Seen.plugin import SeenDB
+
+    db = SeenDB(os.path.join(tmpdir, 'Seen.db'))
+    now = time.time()
+    for i in range(entries):
+        db['#channel%i' % (i % channels), 'nick%i' % i] = (now - i, 'hi')
+    db._dirty.clear()
+
+    def scan(channel, nick):
+        # What seenWildcard did before it used an index.
+        nickRe = re.compile('^%s$' % '.*'.join(nick.split('*')), re.I)
+        return [k for (c, k) in db.keys()
+                if ircutils.strEqual(c, channel) and nickRe.search(k)]
+
+    for pattern in ('nick12345*', 'nick1*5', '*23455', '*12345*'):
+        start = time.perf_counter()
+        expected = scan('#channel5', pattern)
+        scanTime = time.perf_counter() - start
+        start = time.perf_counter()
+        results = db.seenWildcard('#channel5', pattern)
+        firstTime = time.perf_counter() - start
+        start = time.perf_counter()
+        db.seenWildcard('#channel5', pattern)
+        indexedTime = time.perf_counter() - start
+        assert len(results) == len(expected), (pattern, results, expected)
+        print('%-10s %7i matches: scan %8.1f ms, indexed %8.3f ms '
+              '(first query %8.1f ms)' % (
+              pattern, len(results), scanTime * 1000, indexedTime * 1000,
+              firstTime * 1000))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
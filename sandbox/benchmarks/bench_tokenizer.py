@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+
+"""Benchmarks tokenizing commands with supybot.shlex (like it was done
+before Tokenizer got its own lexer), with the lexer, and with
+supybot.callbacks.tokenize, which caches parse results.
+
+Usage: bench_tokenizer.py [<iterations>]"""
+
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+
+COMMANDS = [
+    'echo foo bar baz',
+    'echo [reverse [echo "foo bar"]] | echo "\\x02bold\\x02" baz',
+    'aka add greet "echo Hello $1, welcome to $channel"',
+    'config supybot.reply.whenAddressedBy.chars "!@"',
+    'later tell someone "don\'t forget [echo \\"the thing\\"]"',
+]
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.shlex as shlex
+    import supybot.callbacks as callbacks
+    import supybot.utils.minisix as minisix
+
+    class ShlexTokenizer(callbacks.Tokenizer):
+        def _getTokenFunction(self, s):
+            lexer = shlex.shlex(minisix.io.StringIO(s))
+            lexer.commenters = ''
+            lexer.quotes = self.quotes
+            lexer.separators = self.separators
+            return lexer.get_token
+
+    commands = [COMMANDS[i % len(COMMANDS)] for i in range(iterations)]
+    for (name, f) in (
+            ('shlex', lambda s: ShlexTokenizer('[]', True).tokenize(s)),
+            ('lexer', lambda s: callbacks.Tokenizer('[]', True).tokenize(s)),
+            ('cached', callbacks.tokenize)):
+        start = time.perf_counter()
+        for s in commands:
+            f(s)
+        elapsed = time.perf_counter() - start
+        print('%s: %.1f us/command' % (name, elapsed / iterations * 10**6))
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
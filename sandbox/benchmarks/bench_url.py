@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+"""Benchmarks the queries of the URL plugin in a channel with many URLs:
+the last URL, the last ones from a nick or in a domain, and the count.
+
+Usage: bench_url.py [<URLs> [<queries>]]"""
+
+import os
+import sys
+import time
+import atexit
+import random
+import shutil
+import tempfile
+
+def main():
+    urlCount = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    queryCount = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    # Importing supybot creates its directories (logs, conf, ...) in the
+    # current directory.
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    # Registered before supybot's own exit handlers, so it runs after them.
+    atexit.register(shutil.rmtree, tmpdir)
+    import supybot.conf as conf
+    import supybot.log
+    conf.supybot.log.stdout.setValue(False)
+    import supybot.plugin as plugin
+    URL = plugin.loadPluginModule('URL').plugin
+
+    rng = random.Random(42)
+    nicks = ['nick%s' % i for i in range(500)]
+    domains = ['site%s.example.org' % i for i in range(2000)]
+    filename = os.path.join(tmpdir, 'URL.flat.db')
+    # Build the file directly; adding the URLs through the API would mostly
+    # measure open()/close().
+    with open(filename, 'w', encoding='utf8') as fd:
+        maxSize = max(6, len(str(urlCount + 1)))
+        fd.write('%s\n' % str(urlCount + 1).zfill(maxSize))
+        for i in range(1, urlCount + 1):
+            url = 'https://%s/page/%s' % (rng.choice(domains), i)
+            record = URL.UrlRecord(url=url, by=rng.choice(nicks),
+                                   near='look at %s' % url, at=time.time())
+            fd.write('%s:%s\n' % (str(i).zfill(maxSize),
+                                  record.serialize()))
+
+    db = URL.DbiUrlDB.DB(filename)
+    def p(record):
+        return True
+
+    def timeit(name, f):
+        start = time.perf_counter()
+        for _ in range(queryCount):
+            f()
+        elapsed = time.perf_counter() - start
+        print('%-40s %10.3f ms' % (name, elapsed / queryCount * 1000))
+
+    print('%s URLs, %s nicks, %s domains' %
+          (urlCount, len(nicks), len(domains)))
+    # dbi.DB used to read the whole file to iterate over it backward.
+    def scan(p):
+        return (record for record in map(db._newRecord, *zip(*reversed(
+                    list(db.map)))) if p(record))
+    timeit('last, scan (old)', lambda: next(scan(p)))
+    timeit('last', lambda: next(db.urls(p)))
+    nick = rng.choice(nicks)
+    def fromNick(record):
+        return record.by == nick
+    timeit('last --from --nolimit, scan (old)',
+           lambda: list(scan(fromNick)))
+    timeit('last --from --nolimit, backward scan',
+           lambda: list(db.urls(fromNick)))
+    start = time.perf_counter()
+    db.indexes.build(db.map)
+    print('%-40s %10.3f ms' % ('build indexes (once)',
+                               (time.perf_counter() - start) * 1000))
+    timeit('last --from --nolimit, index',
+           lambda: list(db.urls(fromNick, nick=nick)))
+    domain = rng.choice(domains)
+    def inDomain(record):
+        return domain in URL.getDomains(record.url)
+    timeit('last --domain --nolimit, backward scan',
+           lambda: list(db.urls(inDomain)))
+    timeit('last --domain --nolimit, index',
+           lambda: list(db.urls(inDomain, domain=domain)))
+    timeit('stats (old, with vacuum)', lambda: db.vacuum() or db.size())
+    timeit('stats', db.size)
+
+if __name__ == '__main__':
+    main()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -37,7 +37,7 @@ This module contains the basic callbacks for handling PRIVMSGs.
 import re
 import copy
 import time
-from . import shlex
+import functools
 import codecs
 import getopt
 import inspect
@@ -51,6 +51,48 @@ from .utils.iter import any, all
 from .i18n import PluginInternationalization
 _ = PluginInternationalization()
 
+class AddressingConfig(object):
+    """The configuration used by :py:func:`_addressed` to tell whether a
+    message is addressed to the bot in a given channel: prefix strings and
+    chars, and (lowered) nicks the bot answers to."""
+    __slots__ = ('prefixChars', 'prefixStrings', 'nicks',
+                 'whenAddressedByNick', 'whenAddressedByNickAtEnd',
+                 'whenNotAddressed')
+
+    def __init__(self, network, channel):
+        def get(group):
+            # Applies the value loaded by the last reload, if any, to the
+            # specific values inheriting it.
+            group()
+            return group.getSpecific(network=network, channel=channel)()
+        whenAddressedBy = conf.supybot.reply.whenAddressedBy
+        self.prefixChars = get(whenAddressedBy.chars)
+        self.prefixStrings = tuple(get(whenAddressedBy.strings))
+        self.nicks = list(map(ircutils.toLower, get(whenAddressedBy.nicks)))
+        self.whenAddressedByNick = get(whenAddressedBy.nick)
+        self.whenAddressedByNickAtEnd = get(whenAddressedBy.nick.atEnd)
+        self.whenNotAddressed = get(conf.supybot.reply.whenNotAddressed)
+
+class AddressingConfigCache(object):
+    """Caches :py:class:`AddressingConfig` objects per network and channel,
+    until a registry value is set."""
+    def __init__(self, size=1000):
+        self.generation = None
+        self.configs = utils.structures.CacheDict(size)
+
+    def get(self, network, channel):
+        if self.generation != registry._generation:
+            self.configs.clear()
+            self.generation = registry._generation
+        key = (network, channel)
+        config = self.configs.get(key)
+        if config is None:
+            config = AddressingConfig(network, channel)
+            self.configs[key] = config
+        return config
+
+addressingConfigs = AddressingConfigCache()
+
 def _addressed(irc, msg, prefixChars=None, nicks=None,
               prefixStrings=None, whenAddressedByNick=None,
               whenAddressedByNickAtEnd=None, payload=None):
@@ -72,9 +114,6 @@ def _addressed(irc, msg, prefixChars=None, nicks=None,
     else:
         network = irc.network
         nick = irc.nick
-    def get(group):
-        v = group.getSpecific(network=network, channel=msg.channel)
-        return v()
     def stripPrefixStrings(payload):
         for prefixString in prefixStrings:
             if payload.startswith(prefixString):
@@ -89,27 +128,23 @@ def _addressed(irc, msg, prefixChars=None, nicks=None,
         payload = msg.args[1]
     if not payload:
         return ''
+    config = addressingConfigs.get(network, msg.channel)
     if prefixChars is None:
-        prefixChars = get(conf.supybot.reply.whenAddressedBy.chars)
+        prefixChars = config.prefixChars
     if whenAddressedByNick is None:
-        whenAddressedByNick = get(conf.supybot.reply.whenAddressedBy.nick)
+        whenAddressedByNick = config.whenAddressedByNick
     if whenAddressedByNickAtEnd is None:
-        r = conf.supybot.reply.whenAddressedBy.nick.atEnd
-        whenAddressedByNickAtEnd = get(r)
+        whenAddressedByNickAtEnd = config.whenAddressedByNickAtEnd
     if prefixStrings is None:
-        prefixStrings = get(conf.supybot.reply.whenAddressedBy.strings)
+        prefixStrings = config.prefixStrings
+    else:
+        prefixStrings = tuple(prefixStrings)
     # We have to check this before nicks -- try "@google supybot" with supybot
     # and whenAddressedBy.nick.atEnd on to see why.
-    if any(payload.startswith, prefixStrings):
+    if payload.startswith(prefixStrings):
         return stripPrefixStrings(payload)
     elif payload[0] in prefixChars:
         return payload[1:].strip()
-    if nicks is None:
-        nicks = get(conf.supybot.reply.whenAddressedBy.nicks)
-        nicks = list(map(ircutils.toLower, nicks))
-    else:
-        nicks = list(nicks) # Just in case.
-    nicks.insert(0, ircutils.toLower(nick))
     # Ok, let's see if it's a private message.
     if ircutils.nickEqual(target, nick):
         payload = stripPrefixStrings(payload)
@@ -118,8 +153,13 @@ def _addressed(irc, msg, prefixChars=None, nicks=None,
         return payload
     # Ok, not private.  Does it start with our nick?
     elif whenAddressedByNick:
+        if nicks is None:
+            nicks = config.nicks
+        nicks = [ircutils.toLower(nick)] + list(nicks)
+        lowered = ircutils.toLower(payload)
+        if whenAddressedByNickAtEnd:
+            loweredEnd = lowered.rstrip()
         for nick in nicks:
-            lowered = ircutils.toLower(payload)
             if lowered.startswith(nick):
                 try:
                     (maybeNick, rest) = payload.split(None, 1)
@@ -137,14 +177,14 @@ def _addressed(irc, msg, prefixChars=None, nicks=None,
                         continue
                 except ValueError: # split didn't work.
                     continue
-            elif whenAddressedByNickAtEnd and lowered.rstrip().endswith(nick):
+            elif whenAddressedByNickAtEnd and loweredEnd.endswith(nick):
                 rest = payload.rstrip()[:-len(nick)]
                 possiblePayload = rest.rstrip(' \t,;')
                 if possiblePayload != rest:
                     # There should be some separator between the nick and the
                     # previous alphanumeric character.
                     return possiblePayload
-    if get(conf.supybot.reply.whenNotAddressed):
+    if config.whenNotAddressed:
         return payload
     else:
         return ''
@@ -337,6 +377,12 @@ class Tokenizer(object):
     def _handleToken(self, token):
         if token[0] == token[-1] and token[0] in self.quotes:
             token = token[1:-1]
+            if '\\' not in token:
+                # Shortcut for the common case, where the codecs below
+                # return the token unchanged (but still fail on lone
+                # surrogates).
+                token.encode('utf8')
+                return token
             # FIXME: No need to tell you this is a hack.
             # It has to handle both IRC commands and serialized configuration.
             #
@@ -358,10 +404,55 @@ class Tokenizer(object):
                     pass
         return token
 
-    def _insideBrackets(self, lexer):
+    def _lex(self, s):
+        """Yields the raw tokens of ``s``: words, quoted strings (with their
+        quotes), and separators other than whitespace (brackets, pipes).
+
+        This is what supybot.shlex does with our separators and quotes,
+        but in a single pass over the string."""
+        separators = self.separators
+        quotes = self.quotes
+        whitespace = ' \t\r\n'
+        length = len(s)
+        i = 0
+        while i < length:
+            c = s[i]
+            if c in whitespace:
+                i += 1
+            elif c not in separators:
+                start = i
+                i += 1
+                while i < length:
+                    c = s[i]
+                    if c in whitespace or (c in separators and
+                                           c not in quotes):
+                        break
+                    i += 1
+                yield s[start:i]
+            elif c in quotes:
+                start = i
+                i += 1
+                backslash = False
+                while True:
+                    if i == length:
+                        raise ValueError('No closing quotation')
+                    char = s[i]
+                    i += 1
+                    if char == '\\':
+                        backslash = not backslash
+                    elif not backslash and char == c:
+                        break
+                    else:
+                        backslash = False
+                yield s[start:i]
+            else:
+                i += 1
+                yield c
+
+    def _insideBrackets(self, get_token):
         ret = []
         while True:
-            token = lexer.get_token()
+            token = get_token()
             if not token:
                 raise SyntaxError(_('Missing "%s".  You may want to '
                                    'quote your arguments with double '
@@ -371,20 +462,23 @@ class Tokenizer(object):
             elif token == self.right:
                 return ret
             elif token == self.left:
-                ret.append(self._insideBrackets(lexer))
+                ret.append(self._insideBrackets(get_token))
             else:
                 ret.append(self._handleToken(token))
         return ret
 
+    def _getTokenFunction(self, s):
+        """Returns a function returning the next raw token of ``s`` each
+        time it is called, or an empty string at the end."""
+        tokens = self._lex(s)
+        return lambda: next(tokens, '')
+
     def tokenize(self, s):
-        lexer = shlex.shlex(minisix.io.StringIO(s))
-        lexer.commenters = ''
-        lexer.quotes = self.quotes
-        lexer.separators = self.separators
+        get_token = self._getTokenFunction(s)
         args = []
         ends = []
         while True:
-            token = lexer.get_token()
+            token = get_token()
             if not token:
                 break
             elif token == '|' and self.pipe:
@@ -398,7 +492,7 @@ class Tokenizer(object):
                 ends.append(args)
                 args = []
             elif token == self.left:
-                args.append(self._insideBrackets(lexer))
+                args.append(self._insideBrackets(get_token))
             elif token == self.right:
                 raise SyntaxError(_('Spurious "%s".  You may want to '
                                    'quote your arguments with double '
@@ -417,8 +511,25 @@ class Tokenizer(object):
                 args[-1].append(ends.pop())
         return args
 
+def copyTokens(tokens):
+    """Returns a copy of a list returned by :py:func:`tokenize`, so it can
+    be modified."""
+    return [copyTokens(token) if isinstance(token, list) else token
+            for token in tokens]
+
+@functools.lru_cache(maxsize=1024)
+def _tokenize(s, brackets, pipe, quotes):
+    try:
+        return Tokenizer(brackets=brackets, pipe=pipe, quotes=quotes) \
+            .tokenize(s)
+    except ValueError as e:
+        raise SyntaxError(str(e))
+
 def tokenize(s, channel=None, network=None):
-    """A utility function to create a Tokenizer and tokenize a string."""
+    """A utility function to create a Tokenizer and tokenize a string.
+
+    Results are cached, so tokenizing the same string again with the same
+    configuration is cheap."""
     pipe = False
     brackets = ''
     nested = conf.supybot.commands.nested
@@ -428,11 +539,7 @@ def tokenize(s, channel=None, network=None):
                 channel=channel, network=network): # No nesting, no pipe.
             pipe = True
     quotes = conf.supybot.commands.quotes.getSpecific(network, channel)()
-    try:
-        ret = Tokenizer(brackets=brackets,pipe=pipe,quotes=quotes).tokenize(s)
-        return ret
-    except ValueError as e:
-        raise SyntaxError(str(e))
+    return copyTokens(_tokenize(s, brackets, pipe, quotes))
 
 def formatCommand(command):
     return ' '.join(command)
@@ -1113,11 +1220,8 @@ class NestedCommandsIrcProxy(ReplyIrcProxy):
         # possible such that maxL is a command.
         cbs = []
         maxL = []
-        for cb in self.irc.callbacks:
-            if not hasattr(cb, 'getCommand'):
-                continue
-            L = cb.getCommand(args)
-            if L and L >= maxL:
+        for (cb, L) in commandIndex.find(self.irc.callbacks, args):
+            if L >= maxL:
                 # equivalent to "L and len(L) >= len(maxL)", because L and maxL
                 # are both "prefixes" of the same list.
                 maxL = L
@@ -1412,6 +1516,7 @@ class DisabledCommands(object):
                     self.d[command].add(plugin)
             else:
                 self.d[command] = CanonicalNameSet([plugin])
+        commandIndex.invalidate()
 
     def remove(self, command, plugin=None):
         if plugin is None:
@@ -1419,6 +1524,105 @@ class DisabledCommands(object):
         else:
             if self.d[command] is not None:
                 self.d[command].remove(plugin)
+        commandIndex.invalidate()
+
+class CommandIndex(object):
+    """Index of the commands of a list of callbacks, so finding the
+    plugins that have a command does not require asking every plugin.
+
+    Commands of plugins are read from their ``listCommands()`` method, so
+    plugins whose set of commands changes must call
+    :py:meth:`Commands.commandsChanged` when it does.  Plugins that
+    override ``getCommand`` or ``isCommandMethod`` are not indexed, and
+    are asked about every command, unless they set ``indexCommands`` to
+    True.
+
+    The index is rebuilt on the first lookup after the list of callbacks
+    changes (eg. a plugin is loaded, unloaded, or reloaded), a command is
+    disabled or enabled, or :py:meth:`invalidate` is called."""
+    def __init__(self):
+        self.generation = 0
+        # (generation, callbacks, trie, non-indexed callbacks)
+        self._state = None
+
+    def invalidate(self):
+        """Marks the index as outdated."""
+        self.generation += 1
+
+    @staticmethod
+    def _isIndexable(cb):
+        if not isinstance(cb, Commands):
+            return False
+        if cb.indexCommands:
+            return True
+        cls = type(cb)
+        return cls.getCommand is Commands.getCommand and \
+            cls.isCommandMethod is Commands.isCommandMethod
+
+    def _build(self, callbacks):
+        generation = self.generation
+        # Each node of the trie is a dictionary from words to child nodes;
+        # and the None key maps positions in the list of callbacks to the
+        # ones having the command whose words lead to this node.
+        trie = {}
+        dynamic = []
+        def add(words, position, cb):
+            node = trie
+            for word in words:
+                node = node.setdefault(word, {})
+            node.setdefault(None, {})[position] = cb
+        for (position, cb) in enumerate(callbacks):
+            if not hasattr(cb, 'getCommand'):
+                continue
+            if not self._isIndexable(cb):
+                dynamic.append((position, cb))
+                continue
+            try:
+                commands = cb.listCommands()
+            except Exception:
+                log.exception('Uncaught exception in %s.listCommands:',
+                              cb.name())
+                dynamic.append((position, cb))
+                continue
+            name = cb.canonicalName()
+            for command in commands:
+                # Lookups are made with canonical names, but plugins with
+                # dynamic commands may list them as they were named (eg.
+                # RSS feeds).
+                words = list(map(canonicalName, command.split()))
+                add(words, position, cb)
+                # Commands can also be called with the plugin name first.
+                add([name] + words, position, cb)
+        state = (generation, list(callbacks), trie, dynamic)
+        self._state = state
+        return state
+
+    def find(self, callbacks, args):
+        """Returns a list of (callback, command) for all callbacks in
+        ``callbacks`` having a command whose name is a prefix of ``args``
+        (a list of canonical names), in the order of ``callbacks``.
+        ``command`` is the longest such prefix."""
+        state = self._state
+        if state is None or state[0] != self.generation or \
+                state[1] != callbacks:
+            state = self._build(callbacks)
+        trie = state[2]
+        dynamic = state[3]
+        found = {}
+        node = trie
+        for (i, word) in enumerate(args):
+            node = node.get(word)
+            if node is None:
+                break
+            for (position, cb) in node.get(None, {}).items():
+                found[position] = (cb, args[0:i+1])
+        for (position, cb) in dynamic:
+            L = cb.getCommand(args)
+            if L:
+                found[position] = (cb, L)
+        return [found[position] for position in sorted(found)]
+
+commandIndex = CommandIndex()
 
 class BasePlugin(object):
     def __init__(self, *args, **kwargs):
@@ -1452,6 +1656,8 @@ class Commands(BasePlugin, SynchronizedAndFirewalled):
     __firewalled__ = {'isCommand': None,
                       '_callCommand': None}
     commandArgs = ['self', 'irc', 'msg', 'args']
+    # See CommandIndex.
+    indexCommands = False
     # These must be class-scope, so all plugins use the same one.
     _disabled = DisabledCommands()
     pre_command_callbacks = []
@@ -1468,6 +1674,12 @@ class Commands(BasePlugin, SynchronizedAndFirewalled):
         """Returns whether the given ``command`` is disabled."""
         return self._disabled.disabled(command, self.name())
 
+    def commandsChanged(self):
+        """Plugins with a dynamic set of commands, and setting
+        ``indexCommands`` to True, must call this when a command is added or
+        removed."""
+        commandIndex.invalidate()
+
     def isCommandMethod(self, name):
         """Returns whether a given method name is a command in this plugin.
         Plugins only need to implement this if they have a dynamic set of
@@ -418,11 +418,11 @@ def getBoolean(irc, msg, args, state):
 
 def getNetworkIrc(irc, msg, args, state, errorIfNoMatch=False):
     if args:
-        for otherIrc in world.ircs:
-            if otherIrc.network.lower() == args[0].lower():
-                state.args.append(otherIrc)
-                del args[0]
-                return
+        otherIrc = world.getIrc(args[0])
+        if otherIrc is not None:
+            state.args.append(otherIrc)
+            del args[0]
+            return
     if errorIfNoMatch:
         raise callbacks.ArgumentError
     else:
@@ -1170,6 +1170,46 @@ registerChannelValue(supybot.databases.plugins.channelSpecific.link, 'allow',
     databases.  Do note that the bot needs to be restarted immediately after
     changing this variable or your db plugins may not work for your channel.
     """)))
+registerGlobalValue(supybot.databases.plugins, 'maximumOpen',
+    registry.PositiveInteger(100, _("""Determines the maximum number of
+    databases of plugins (channel databases and SQLite databases) that are
+    kept open.  When more are used, the least recently used ones are closed,
+    and reopened when needed again.""")))
+
+registerGroup(supybot.databases, 'sqlite')
+class SqliteJournalMode(registry.OnlySomeStrings):
+    __slots__ = ()
+    validStrings = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+
+class SqliteSynchronous(registry.OnlySomeStrings):
+    __slots__ = ()
+    validStrings = ('off', 'normal', 'full', 'extra')
+
+registerGlobalValue(supybot.databases.sqlite, 'journalMode',
+    SqliteJournalMode('wal', _("""Determines the journal mode of the SQLite
+    databases of plugins.  With 'wal', readers and the writer do not block
+    each other.""")))
+registerGlobalValue(supybot.databases.sqlite, 'synchronous',
+    SqliteSynchronous('normal', _("""Determines how often SQLite waits for
+    the data of plugins' databases to be written to the disk.  With the 'wal'
+    journal mode, 'normal' does not risk corrupting databases, but the last
+    transactions may be lost if the system crashes.""")))
+registerGlobalValue(supybot.databases.sqlite, 'cacheSize',
+    registry.NonNegativeInteger(2048, _("""Determines the size (in KiB) of
+    the page cache of each connection to the SQLite databases of
+    plugins.""")))
+registerGlobalValue(supybot.databases.sqlite, 'mmapSize',
+    registry.NonNegativeInteger(0, _("""Determines the number of bytes of
+    each SQLite database of plugins that are accessed by mapping the file in
+    memory, instead of reading it.  0 disables memory mapping.""")))
+registerGlobalValue(supybot.databases.sqlite, 'timeout',
+    registry.PositiveFloat(5.0, _("""Determines how long (in seconds) a thread
+    waits for another one to release the lock on an SQLite database before
+    giving up.""")))
+registerGlobalValue(supybot.databases.sqlite, 'cachedStatements',
+    registry.NonNegativeInteger(128, _("""Determines the number of prepared
+    statements each connection to an SQLite database keeps, so they are not
+    parsed again when reused.""")))
 
 
 class CDB(registry.Boolean):
@@ -1421,6 +1461,29 @@ registerGlobalValue(supybot.protocols.irc.queuing, 'duplicates',
     message multiple times; most of the time it doesn't matter, unless you're
     doing certain kinds of plugin hacking.""")))
 
+class ValidQueueScheduler(registry.OnlySomeStrings):
+    __slots__ = ()
+    validStrings = ('fifo', 'fair')
+
+registerGlobalValue(supybot.protocols.irc.queuing, 'scheduler',
+    ValidQueueScheduler('fifo', _("""Determines the order in which
+    queued messages with the same priority are sent to the server: 'fifo'
+    sends them in the order they were queued; 'fair' takes turns between
+    their targets (channels and nicks), so a long reply in a channel does not
+    delay replies elsewhere.  Changing this variable will not take effect on
+    a network until it is reconnected.""")))
+registerChannelValue(supybot.protocols.irc.queuing, 'weight',
+    registry.PositiveInteger(1, _("""Determines how many queued messages to
+    a channel (or, as a global value, to a nick) are sent in a row before
+    letting other targets send theirs, when
+    supybot.protocols.irc.queuing.scheduler is 'fair'.""")))
+registerGlobalValue(supybot.protocols.irc.queuing, 'burst',
+    registry.PositiveInteger(1, _("""Determines how many queued messages
+    the bot can send at once after being idle, before it has to wait
+    supybot.protocols.irc.throttleTime seconds between messages.  Most IRC
+    servers allow a burst of a few messages before throttling or
+    disconnecting clients, so values around 4 are usually safe.""")))
+
 registerGroup(supybot.protocols.irc.queuing, 'rateLimit')
 registerGlobalValue(supybot.protocols.irc.queuing.rateLimit, 'join',
     registry.Float(0, _("""Determines how many seconds must elapse between
@@ -1552,6 +1615,17 @@ registerGlobalValue(supybot.servers.http, 'keepAlive',
     registry.Boolean(False, _("""Determines whether the server will stay
     alive if no plugin is using it. This also means that the server will
     start even if it is not used.""")))
+registerGlobalValue(supybot.servers.http, 'workers',
+    registry.NonNegativeInteger(0, _("""Determines how many requests the HTTP
+    server can handle at the same time.  If this is 0, requests are handled
+    one after the other, by the thread accepting connections, so a slow
+    client or a large page delays all other requests.  Otherwise, requests
+    are handled by a pool of this many threads, and connections are kept
+    alive between requests (HTTP/1.1).""")))
+registerGlobalValue(supybot.servers.http, 'timeout',
+    registry.PositiveFloat(10.0, _("""Determines how many seconds the HTTP
+    server waits for a client to send data before closing the connection.
+    This also applies to idle kept-alive connections.""")))
 registerGlobalValue(supybot.servers.http, 'favicon',
     registry.String('', _("""Determines the path of the file served as
     favicon to browsers.""")))
@@ -35,6 +35,7 @@ Module for some slight database-independence for simple databases.
 import os
 import csv
 import math
+import random
 
 from . import cdb, utils
 from .utils import minisix
@@ -76,6 +77,17 @@ class MappingInterface(object):
         "Return an iterator over (id, s) pairs.  Not required to be ordered."
         raise NotImplementedError
 
+    def __len__(self):
+        """Returns the number of records.  Mappings that can count their
+        records without iterating over them should override this."""
+        return ilen(self)
+
+    def random(self):
+        """Returns a random (id, s) pair.  Raises IndexError if there are no
+        records.  Mappings that can do better than iterating over all their
+        records should override this."""
+        return utils.iter.choice(self)
+
     def flush(self):
         """Flushes current state to disk."""
         raise NotImplementedError
@@ -147,42 +159,102 @@ class DirMapping(MappingInterface):
             raise NoRecordError(id)
 
 class FlatfileMapping(MappingInterface):
+    """Maps integer ids to strings, stored in a text file with one record
+    per line.  The first line of the file holds the next id; deleted records
+    are kept in place, with their id overwritten by dashes, until the file
+    is vacuumed.
+
+    The byte offset of each live record is kept in memory, so records can
+    be read, overwritten, and removed without scanning the whole file; and
+    iterated over from the end of the file, without reading it all."""
     def __init__(self, filename, maxSize=10**6):
         self.filename = filename
         try:
-            fd = open(self.filename, encoding='utf8')
-            strId = fd.readline().rstrip()
+            fd = open(self.filename, 'rb')
+            strId = fd.readline().rstrip().decode('utf8')
             self.maxSize = len(strId)
             try:
                 self.currentId = int(strId)
             except ValueError:
                 raise Error('Invalid file for FlatfileMapping: %s' % filename)
+            self._buildIndex(fd)
         except EnvironmentError as e:
             # File couldn't be opened.
             self.maxSize = int(math.log10(maxSize))
             self.currentId = 0
+            self._resetIndex()
             self._incrementCurrentId()
         finally:
             if 'fd' in locals():
                 fd.close()
 
+    def _resetIndex(self):
+        # id -> byte offset of its line in the file
+        self._offsets = {}
+        # Offsets of lines that duplicate an already-indexed id.  They can
+        # only come from files written by hand or by a crashed process, but
+        # they must be tombstoned along with the original when it is
+        # removed, like the old full-scan implementation did.
+        self._duplicates = {}
+        # Live ids, in no particular order, and the position of each of
+        # them in that list; so random() and __len__ are O(1).
+        self._ids = []
+        self._idPositions = {}
+        # (offset, id) of every line indexed, live or not, in the order of
+        # the file; so the file can be read backward.
+        self._lines = []
+
+    def _buildIndex(self, fd):
+        """Reads the whole file once, from the current position of fd (which
+        must be just after the first line), and indexes its records."""
+        self._resetIndex()
+        pos = fd.tell()
+        for line in fd:
+            (lineId, _) = line.split(b':', 1)
+            if not lineId.startswith(b'-'):
+                self._indexRecord(int(lineId), pos)
+            pos += len(line)
+
+    def _indexRecord(self, id, pos):
+        self._lines.append((pos, id))
+        if id in self._offsets:
+            self._duplicates.setdefault(id, []).append(pos)
+            return
+        self._offsets[id] = pos
+        self._idPositions[id] = len(self._ids)
+        self._ids.append(id)
+
+    def _unindexRecord(self, id):
+        """Removes id from the index, and returns the offsets of all the lines
+        holding it."""
+        offsets = [self._offsets.pop(id)]
+        offsets.extend(self._duplicates.pop(id, []))
+        # Move the last id to the position of the removed one, so the
+        # removal does not shift the whole list.
+        position = self._idPositions.pop(id)
+        lastId = self._ids.pop()
+        if lastId != id:
+            self._ids[position] = lastId
+            self._idPositions[lastId] = position
+        return offsets
+
     def _canonicalId(self, id):
         if id is not None:
             return str(id).zfill(self.maxSize)
         else:
             return '-'*self.maxSize
-    
+
     def _incrementCurrentId(self, fd=None):
         fdWasNone = fd is None
         if fdWasNone:
-            fd = open(self.filename, 'a', encoding='utf8')
+            fd = open(self.filename, 'ab')
         fd.seek(0)
         self.currentId += 1
-        fd.write(self._canonicalId(self.currentId))
-        fd.write('\n')
+        fd.write(self._canonicalId(self.currentId).encode('utf8'))
+        fd.write(b'\n')
         if fdWasNone:
             fd.close()
-        
+
     def _splitLine(self, line):
         line = line.rstrip('\r\n')
         (id, s) = line.split(':', 1)
@@ -191,66 +263,52 @@ class FlatfileMapping(MappingInterface):
     def _joinLine(self, id, s):
         return '%s:%s\n' % (self._canonicalId(id), s)
 
+    def _append(self, fd, id, s):
+        """Writes a record at the end of the file, and indexes it."""
+        pos = fd.seek(0, 2) # End.
+        fd.write(self._joinLine(id, s).encode('utf8'))
+        self._indexRecord(id, pos)
+
+    def _tombstone(self, fd, id):
+        """Marks all the lines of the record as deleted, if it exists."""
+        if id not in self._offsets:
+            return
+        tombstone = self._canonicalId(None).encode('utf8')
+        for pos in self._unindexRecord(id):
+            fd.seek(pos)
+            fd.write(tombstone)
+
     def add(self, s):
-        line = self._joinLine(self.currentId, s)
-        fd = open(self.filename, 'r+', encoding='utf8')
+        fd = open(self.filename, 'r+b')
         try:
-            fd.seek(0, 2) # End.
-            fd.write(line)
+            self._append(fd, self.currentId, s)
             return self.currentId
         finally:
             self._incrementCurrentId(fd)
             fd.close()
 
     def get(self, id):
-        strId = self._canonicalId(id)
         try:
-            fd = open(self.filename, encoding='utf8')
-            fd.readline() # First line, nextId.
-            for line in fd:
-                (lineId, s) = self._splitLine(line)
-                if lineId == strId:
-                    return s
+            pos = self._offsets[id]
+        except KeyError:
             raise NoRecordError(id)
-        finally:
-            fd.close()
+        with open(self.filename, 'rb') as fd:
+            fd.seek(pos)
+            line = fd.readline().decode('utf8')
+        (_, s) = self._splitLine(line)
+        return s
 
     # XXX This assumes it's not been given out.  We should make sure that our
     #     maximum id remains accurate if this is some value we've never given
     #     out -- i.e., self.maxid = max(self.maxid, id) or something.
     def set(self, id, s):
-        strLine = self._joinLine(id, s)
-        try:
-            fd = open(self.filename, 'r+', encoding='utf8')
-            self.remove(id, fd)
-            fd.seek(0, 2) # End.
-            fd.write(strLine)
-        finally:
-            fd.close()
+        with open(self.filename, 'r+b') as fd:
+            self._tombstone(fd, id)
+            self._append(fd, id, s)
 
-    def remove(self, id, fd=None):
-        fdWasNone = fd is None
-        strId = self._canonicalId(id)
-        try:
-            if fdWasNone:
-                fd = open(self.filename, 'r+', encoding='utf8')
-            fd.seek(0)
-            fd.readline() # First line, nextId
-            pos = fd.tell()
-            line = fd.readline()
-            while line:
-                (lineId, _) = self._splitLine(line)
-                if lineId == strId:
-                    fd.seek(pos)
-                    fd.write(self._canonicalId(None))
-                    fd.seek(pos)
-                    fd.readline() # Same line we just rewrote the id for.
-                pos = fd.tell()
-                line = fd.readline()
-            # We should be at the end.
-        finally:
-            if fdWasNone:
-                fd.close()
+    def remove(self, id):
+        with open(self.filename, 'r+b') as fd:
+            self._tombstone(fd, id)
 
     def __iter__(self):
         fd = open(self.filename, encoding='utf8')
@@ -261,6 +319,37 @@ class FlatfileMapping(MappingInterface):
                 yield (int(id), s)
         fd.close()
 
+    def __reversed__(self):
+        lines = self._lines
+        with open(self.filename, 'rb') as fd:
+            for i in range(len(lines) - 1, -1, -1):
+                if self._lines is not lines:
+                    # Vacuumed, the offsets are not valid anymore.
+                    return
+                (pos, id) = lines[i]
+                if self._offsets.get(id) != pos \
+                        and pos not in self._duplicates.get(id, ()):
+                    # Removed or overwritten since.
+                    continue
+                fd.seek(pos)
+                (_, s) = self._splitLine(fd.readline().decode('utf8'))
+                yield (id, s)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def tombstones(self):
+        """Returns the number of lines of removed or overwritten records,
+        which vacuum() would remove from the file."""
+        return len(self._lines) - len(self._offsets) \
+            - sum(map(len, self._duplicates.values()))
+
+    def random(self):
+        if not self._ids:
+            raise IndexError('random() on an empty FlatfileMapping')
+        id = random.choice(self._ids)
+        return (id, self.get(id))
+
     def vacuum(self):
         infd = open(self.filename, encoding='utf8')
         outfd = utils.file.AtomicFile(self.filename,makeBackupIfSmaller=False)
@@ -270,6 +359,10 @@ class FlatfileMapping(MappingInterface):
                 outfd.write(line)
         infd.close()
         outfd.close()
+        # Offsets changed, index the new file.
+        with open(self.filename, 'rb') as fd:
+            fd.readline() # First line, nextId.
+            self._buildIndex(fd)
 
     def flush(self):
         pass # No-op, we maintain no open files.
@@ -363,10 +456,8 @@ class DB(object):
     def _iter(self, *, reverse=False):
         if reverse:
             if hasattr(self.map, "__reversed__"):
-                # neither FlatfileMapping nor CdbMapping support __reversed__
-                # and DirMapping does not support iteration at all, but
-                # there is no harm in allowing this short-path in case
-                # plugins use their own mapping.
+                # Only FlatfileMapping supports it; CdbMapping does not, and
+                # DirMapping does not support iteration at all.
                 it = reversed(self.map)
             else:
                 # This does load the whole database in memory instead of
@@ -387,12 +478,12 @@ class DB(object):
 
     def random(self):
         try:
-            return self._newRecord(*utils.iter.choice(self.map))
+            return self._newRecord(*self.map.random())
         except IndexError:
             return None
 
     def size(self):
-        return ilen(self.map)
+        return len(self.map)
 
     def flush(self):
         self.map.flush()
@@ -33,7 +33,9 @@ An embedded and centralized HTTP server for Supybot's plugins.
 
 import os
 import socket
+import threading
 import urllib.parse
+import concurrent.futures
 from threading import Thread
 
 import supybot.log as log
@@ -272,8 +274,48 @@ class HttpHeaders:
         return bool(self.list)
 
 
+# The request handler currently used by each thread; so callbacks, which are
+# shared by all threads, can access the one of the request they are
+# handling through their shortcut attributes (wfile, send_header, ...).
+_currentHandler = threading.local()
+
 class SupyHTTPRequestHandler(BaseHTTPRequestHandler):
+    # Whether the response being sent has a Content-Length or
+    # Transfer-Encoding header, ie. whether the client can find where its
+    # body ends without us closing the connection.
+    _response_framed = False
+
+    # Headers and bodies are written separately, which Nagle's algorithm
+    # delays on kept-alive connections.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.timeout = configGroup.timeout()
+        if getattr(self.server, 'workers', 0):
+            # Kept-alive connections keep a worker busy until they are
+            # closed or time out, so this is only sensible when other
+            # requests are not waiting on that worker.
+            self.protocol_version = 'HTTP/1.1'
+        BaseHTTPRequestHandler.setup(self)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() in ('content-length', 'transfer-encoding'):
+            self._response_framed = True
+        BaseHTTPRequestHandler.send_header(self, keyword, value)
+
+    def end_headers(self):
+        if self.protocol_version >= 'HTTP/1.1' \
+                and self.request_version >= 'HTTP/1.1' \
+                and not self._response_framed \
+                and not self.close_connection:
+            # Many callbacks do not send Content-Length, so the only way
+            # for the client to know the response is over is to close the
+            # connection after it.
+            BaseHTTPRequestHandler.send_header(self, 'Connection', 'close')
+        BaseHTTPRequestHandler.end_headers(self)
+
     def do_X(self, callbackMethod, *args, **kwargs):
+        self._response_framed = False
         if self.path == '/':
             callback = SupyIndex()
         elif self.path in ('/robots.txt',):
@@ -289,16 +331,18 @@ class SupyHTTPRequestHandler(BaseHTTPRequestHandler):
             except KeyError:
                 callback = Supy404()
 
-        # Some shortcuts
-        for name in ('send_response', 'send_header', 'end_headers', 'rfile',
-                'wfile', 'headers'):
-            setattr(callback, name, getattr(self, name))
+        # Makes the shortcuts (see SupyHTTPServerCallback) point to this
+        # request.
+        _currentHandler.handler = self
         # We call doX, because this is more supybotic than do_X.
         path = self.path
         if not callback.fullpath:
             path = '/' + path.split('/', 2)[-1]
-        getattr(callback, callbackMethod)(self, path,
-                *args, **kwargs)
+        try:
+            getattr(callback, callbackMethod)(self, path,
+                    *args, **kwargs)
+        finally:
+            _currentHandler.handler = None
 
     def do_GET(self):
         self.do_X('doGet')
@@ -334,6 +378,16 @@ class SupyHTTPRequestHandler(BaseHTTPRequestHandler):
         log.info('HTTP request: %s - %s' %
                 (self.address_string(), format % args))
 
+def _handlerShortcut(name):
+    def getter(self):
+        handler = getattr(_currentHandler, 'handler', None)
+        if handler is None:
+            raise AttributeError(name)
+        return getattr(handler, name)
+    return property(getter, doc='Shortcut to the %s attribute of the '
+                                'request handler of the current request.'
+                                % name)
+
 class SupyHTTPServerCallback(log.Firewalled):
     """This is a base class that should be overriden by any plugin that want
     to have a Web interface."""
@@ -354,6 +408,19 @@ class SupyHTTPServerCallback(log.Firewalled):
     message, it probably means you are developing a plugin, and you have
     neither overriden this message or defined an handler for this query.""")
 
+    # Some shortcuts.  The same callback object may be handling requests
+    # from several threads at once, so they refer to the request being
+    # handled by the current thread.
+    send_response = _handlerShortcut('send_response')
+    send_header = _handlerShortcut('send_header')
+    end_headers = _handlerShortcut('end_headers')
+    rfile = _handlerShortcut('rfile')
+    wfile = _handlerShortcut('wfile')
+    headers = _handlerShortcut('headers')
+
+    streamBufferSize = 16*1024
+    """Minimum size of the pieces of bodies sent by writeStream()."""
+
     if minisix.PY3:
         def write(self, b):
             if isinstance(b, str):
@@ -363,6 +430,46 @@ class SupyHTTPServerCallback(log.Firewalled):
         def write(self, s):
             self.wfile.write(s)
 
+    def writeStream(self, handler, status, headers, chunks,
+                    write_content=True):
+        """Sends a response whose body is made of the str/bytes objects
+        produced by the `chunks` iterable, as they are produced; so large
+        pages do not need to be built in memory before being sent.
+
+        Uses chunked transfer-encoding when the client supports it, and
+        closes the connection at the end of the body otherwise."""
+        chunked = handler.protocol_version >= 'HTTP/1.1' \
+            and handler.request_version >= 'HTTP/1.1'
+        handler.send_response(status)
+        for (name, value) in headers.items():
+            self.send_header(name, value)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        if not write_content:
+            return
+
+        def send(data):
+            if chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            else:
+                self.wfile.write(data)
+        buf = []
+        bufSize = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            buf.append(chunk)
+            bufSize += len(chunk)
+            if bufSize >= self.streamBufferSize:
+                send(b''.join(buf))
+                buf = []
+                bufSize = 0
+        if bufSize:
+            send(b''.join(buf))
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
     def doGetOrHead(self, handler, path, write_content):
         response = self.defaultResponse.encode()
         handler.send_response(405)
@@ -524,6 +631,10 @@ class RealSupyHTTPServer(HTTPServer):
     timeout = 0.5
     running = False
 
+    maxPendingPerWorker = 8
+    """How many connections may be waiting for a worker, per worker, before
+    new ones are rejected."""
+
     def __init__(self, address, protocol, callback):
         self.protocol = protocol
         if protocol == 4:
@@ -534,6 +645,53 @@ class RealSupyHTTPServer(HTTPServer):
             raise AssertionError(protocol)
         HTTPServer.__init__(self, address, callback)
         self.callbacks = DEFAULT_CALLBACKS.copy()
+        self.workers = configGroup.workers()
+        if self.workers:
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='HTTP Server worker')
+            # Connections being handled or waiting for a worker
+            self._pending = threading.BoundedSemaphore(
+                self.workers * (self.maxPendingPerWorker + 1))
+        else:
+            self._pool = None
+
+    def process_request(self, request, client_address):
+        if self._pool is None:
+            HTTPServer.process_request(self, request, client_address)
+            return
+        if not self._pending.acquire(blocking=False):
+            log.warning('HTTP server: too many pending connections, '
+                        'rejecting connection from %s.', client_address[0])
+            try:
+                request.settimeout(1)
+                request.sendall(b'HTTP/1.0 503 Service Unavailable\r\n'
+                                b'Content-Length: 0\r\n\r\n')
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            self._pool.submit(self._process_request_worker,
+                              request, client_address)
+        except RuntimeError:
+            # The pool was shut down.
+            self._pending.release()
+            self.shutdown_request(request)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._pending.release()
+
+    def shutdown(self):
+        HTTPServer.shutdown(self)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
 
     def server_bind(self):
         if self.protocol == 6:
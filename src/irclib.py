@@ -36,7 +36,7 @@ import random
 import base64
 import textwrap
 import warnings
-import collections
+import collections.abc
 
 try:
     class crypto:
@@ -228,8 +228,13 @@ class IrcMsgQueue(object):
     'low priority' messages, and normal messages, and just make sure to return
     the 'high priority' ones before the normal ones before the 'low priority'
     ones.
+
+    A count of each message in the queue is kept alongside it, so checking
+    whether a message is already queued does not need to look through
+    every queued message.
     """
-    __slots__ = ('msgs', 'highpriority', 'normal', 'lowpriority', 'lastJoin')
+    __slots__ = ('msgs', 'highpriority', 'normal', 'lowpriority', 'lastJoin',
+                 'counts')
     def __init__(self, iterable=()):
         self.reset()
         for msg in iterable:
@@ -238,9 +243,10 @@ class IrcMsgQueue(object):
     def reset(self):
         """Clears the queue."""
         self.lastJoin = 0
-        self.highpriority = smallqueue()
-        self.normal = smallqueue()
-        self.lowpriority = smallqueue()
+        self.highpriority = collections.deque()
+        self.normal = collections.deque()
+        self.lowpriority = collections.deque()
+        self.counts = collections.Counter()
 
     def enqueue(self, msg):
         """Enqueues a given message."""
@@ -251,36 +257,41 @@ class IrcMsgQueue(object):
             return False
         else:
             if msg.command in _high:
-                self.highpriority.enqueue(msg)
+                self.highpriority.append(msg)
             elif msg.command in _low:
-                self.lowpriority.enqueue(msg)
+                self.lowpriority.append(msg)
             else:
-                self.normal.enqueue(msg)
+                self.normal.append(msg)
+            self.counts[msg] += 1
             return True
 
     def dequeue(self):
         """Dequeues a given message."""
         msg = None
         if self.highpriority:
-            msg = self.highpriority.dequeue()
+            msg = self.highpriority.popleft()
         elif self.normal:
-            msg = self.normal.dequeue()
+            msg = self.normal.popleft()
         elif self.lowpriority:
-            msg = self.lowpriority.dequeue()
+            msg = self.lowpriority.popleft()
             if msg.command == 'JOIN':
                 limit = conf.supybot.protocols.irc.queuing.rateLimit.join()
                 now = time.time()
                 if self.lastJoin + limit <= now:
                     self.lastJoin = now
                 else:
-                    self.lowpriority.enqueue(msg)
-                    msg = None
+                    self.lowpriority.append(msg)
+                    return None
+        if msg is not None:
+            count = self.counts[msg] - 1
+            if count:
+                self.counts[msg] = count
+            else:
+                del self.counts[msg]
         return msg
 
     def __contains__(self, msg):
-        return msg in self.normal or \
-               msg in self.lowpriority or \
-               msg in self.highpriority
+        return msg in self.counts
 
     def __bool__(self):
         return bool(self.highpriority or self.normal or self.lowpriority)
@@ -297,10 +308,341 @@ class IrcMsgQueue(object):
     __str__ = __repr__
 
 
+class _TargetQueues(object):
+    """Queue of messages split by target (the first argument of messages,
+    usually a channel or a nick), which are served in turn, each target
+    sending up to its weight of messages before the next one.  It is a
+    drop-in replacement for the deques of :class:`IrcMsgQueue`.
+
+    It also keeps, for each target, the number of messages sent and the
+    total and maximum time they spent in the queue."""
+    __slots__ = ('queue', 'queues', 'order', 'sent', 'length')
+    def __init__(self, queue):
+        self.queue = queue
+        self.queues = ircutils.IrcDict()
+        # Targets with queued messages, in the order they will be served,
+        # with the number of messages they can still send this turn and
+        # their weight (looked up when they get queued messages, as it is
+        # too slow to look it up on every turn).
+        self.order = collections.deque()
+        self.sent = ircutils.IrcDict()
+        self.length = 0
+
+    @staticmethod
+    def target(msg):
+        return msg.args[0] if msg.args else ''
+
+    def append(self, msg):
+        target = self.target(msg)
+        messages = self.queues.get(target)
+        if messages is None:
+            messages = self.queues[target] = collections.deque()
+            weight = self.queue.weight(target)
+            self.order.append([target, weight, weight])
+        messages.append((time.time(), msg))
+        self.length += 1
+
+    def popleft(self):
+        entry = self.order[0]
+        (target, credit, weight) = entry
+        messages = self.queues[target]
+        (enqueuedAt, msg) = messages.popleft()
+        self.length -= 1
+        if not messages:
+            del self.queues[target]
+            self.order.popleft()
+        elif credit > 1:
+            entry[1] = credit - 1
+        else:
+            # This target used its turn, let the others send.
+            entry[1] = weight
+            self.order.rotate(-1)
+        latency = time.time() - enqueuedAt
+        (count, total, maximum) = self.sent.get(target, (0, 0, 0))
+        self.sent[target] = (count + 1, total + latency,
+                             max(maximum, latency))
+        return msg
+
+    def __iter__(self):
+        for (target, credit, weight) in self.order:
+            for (enqueuedAt, msg) in self.queues[target]:
+                yield msg
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+    __nonzero__ = __bool__
+
+
+class FairMsgQueue(IrcMsgQueue):
+    """An :class:`IrcMsgQueue` that does not send messages with the same
+    priority in the order they were queued, but alternates between their
+    targets (weighted by
+    ``supybot.protocols.irc.queuing.weight``), so a long reply in a
+    channel does not delay the replies in other channels and in private.
+
+    Use :meth:`stats` to get metrics about the queue."""
+    __slots__ = ('network',)
+    def __init__(self, iterable=(), network=None):
+        self.network = network
+        IrcMsgQueue.__init__(self, iterable)
+
+    def reset(self):
+        IrcMsgQueue.reset(self)
+        self.normal = _TargetQueues(self)
+        self.lowpriority = _TargetQueues(self)
+
+    def weight(self, target):
+        weight = conf.supybot.protocols.irc.queuing.weight
+        if ircutils.isChannel(target):
+            return weight.getSpecific(self.network, target)()
+        else:
+            return weight.getSpecific(self.network)()
+
+    def stats(self):
+        """Returns a dictionary whose keys are targets, and values are
+        tuples (queued messages, sent messages, average time sent messages
+        spent in the queue, maximum time they spent in the queue)."""
+        stats = ircutils.IrcDict()
+        for queue in (self.normal, self.lowpriority):
+            for target in set(queue.queues) | set(queue.sent):
+                (depth, count, total, maximum) = \
+                    stats.get(target, (0, 0, 0, 0))
+                (sent, latency, latencyMax) = \
+                    queue.sent.get(target, (0, 0, 0))
+                messages = queue.queues.get(target, ())
+                stats[target] = (depth + len(messages), count + sent,
+                                 total + latency, max(maximum, latencyMax))
+        return ircutils.IrcDict(
+            (target, (depth, count, total / count if count else 0, maximum))
+            for (target, (depth, count, total, maximum)) in stats.items())
+
+
+schedulers = {
+    'fifo': IrcMsgQueue,
+    'fair': FairMsgQueue,
+}
+"""Maps the possible values of ``supybot.protocols.irc.queuing.scheduler``
+to the class of :py:attr:`Irc.queue`."""
+
+
 ###
 # Maintains the state of IRC connection -- the most recent messages, the
 # status of various modes (especially ops/halfops/voices) in channels, etc.
 ###
+_missing = object()
+
+class NickRecord(object):
+    """What is known about a nick on a network: its hostmask, its
+    services account, and the channels it is in.  There is a single record
+    per nick and network, shared by all the channels the nick is in."""
+    __slots__ = ('nick', 'hostmask', 'account', 'channels')
+    def __init__(self, nick):
+        self.nick = nick
+        self.hostmask = _missing
+        self.account = _missing
+        self.channels = ()
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, str(self.nick))
+
+
+class NickRecordView(collections.abc.MutableMapping):
+    """Dictionary-like view of one of the attributes (hostmask or account)
+    of the records of a :class:`NickTable`, with IRC-case insensitive
+    keys, like :class:`ircutils.IrcDict`."""
+    __slots__ = ('table', 'attribute')
+    def __init__(self, table, attribute):
+        self.table = table
+        self.attribute = attribute
+
+    @property
+    def casemapping(self):
+        return self.table.casemapping
+
+    def setCasemapping(self, casemapping):
+        self.table.setCasemapping(casemapping)
+
+    def __getitem__(self, nick):
+        record = self.table.get(nick)
+        if record is not None:
+            value = getattr(record, self.attribute)
+            if value is not _missing:
+                return value
+        raise KeyError(nick)
+
+    def __setitem__(self, nick, value):
+        setattr(self.table.setdefault(nick), self.attribute, value)
+
+    def __delitem__(self, nick):
+        record = self.table.get(nick)
+        if record is None or getattr(record, self.attribute) is _missing:
+            raise KeyError(nick)
+        setattr(record, self.attribute, _missing)
+        self.table._release(record)
+
+    def __iter__(self):
+        attribute = self.attribute
+        for record in list(self.table.records.values()):
+            if getattr(record, attribute) is not _missing:
+                yield record.nick
+
+    def __len__(self):
+        attribute = self.attribute
+        return sum(1 for record in self.table.records.values()
+                   if getattr(record, attribute) is not _missing)
+
+    def keys(self):
+        return list(self)
+
+    def clear(self):
+        attribute = self.attribute
+        for record in list(self.table.records.values()):
+            setattr(record, attribute, _missing)
+            self.table._release(record)
+
+    def _lowered(self, mapping):
+        return dict((ircutils.toLower(k, self.casemapping), v)
+                    for (k, v) in mapping.items())
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.abc.Mapping):
+            return NotImplemented
+        return self._lowered(self) == self._lowered(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(self.items()))
+
+    def __reduce__(self):
+        # Copies and pickles are plain dictionaries, not views.
+        return (ircutils.IrcDict, (dict(self.items()), None,
+                                   self.casemapping))
+
+
+class NickTable(object):
+    """Maps the nicks of a network to their :class:`NickRecord`.
+
+    A record is dropped as soon as it is in no channel and its hostmask and
+    account are both unknown.
+
+    .. attribute:: hostmasks
+
+        View of the hostmasks of the nicks.
+
+        :type: NickRecordView[str, str]
+
+    .. attribute:: accounts
+
+        View of the services accounts of the nicks (:const:`None` for
+        un-identified nicks).
+
+        :type: NickRecordView[str, Optional[str]]
+    """
+    __slots__ = ('casemapping', 'records', 'hostmasks', 'accounts')
+    def __init__(self, casemapping=None):
+        self.casemapping = casemapping
+        self.records = {} # lowered nick -> NickRecord
+        self.hostmasks = NickRecordView(self, 'hostmask')
+        self.accounts = NickRecordView(self, 'account')
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, nick):
+        """Returns the record of the nick, or None if it is unknown."""
+        return self.records.get(ircutils.toLower(nick, self.casemapping))
+
+    def setdefault(self, nick):
+        """Returns the record of the nick, creating it if needed."""
+        nick = ircutils.ircString(nick, self.casemapping)
+        record = self.records.get(nick.lowered)
+        if record is None:
+            record = self.records[nick.lowered] = NickRecord(nick)
+        return record
+
+    def _release(self, record):
+        if not record.channels and record.hostmask is _missing and \
+                record.account is _missing:
+            self.records.pop(record.nick.lowered, None)
+
+    def addChannel(self, nick, channel):
+        record = self.setdefault(nick)
+        if channel not in record.channels:
+            record.channels += (channel,)
+        return record
+
+    def removeChannel(self, nick, channel):
+        record = self.get(nick)
+        if record is not None and channel in record.channels:
+            record.channels = tuple(c for c in record.channels
+                                    if c != channel)
+            self._release(record)
+
+    def setCasemapping(self, casemapping):
+        """Changes the casemapping of the nicks, and re-keys the table."""
+        if casemapping == self.casemapping:
+            return
+        records = list(self.records.values())
+        self.casemapping = casemapping
+        self.records.clear()
+        for record in records:
+            nick = ircutils.ircString(str(record.nick), casemapping)
+            other = self.records.get(nick.lowered)
+            if other is None:
+                record.nick = nick
+                self.records[nick.lowered] = record
+            else:
+                # Two nicks that were different are now the same.
+                for channel in record.channels:
+                    if channel not in other.channels:
+                        other.channels += (channel,)
+                if record.hostmask is not _missing:
+                    other.hostmask = record.hostmask
+                if record.account is not _missing:
+                    other.account = record.account
+
+
+class ChannelMemberSet(collections.abc.MutableSet):
+    """Set-like view of the members of a :class:`ChannelState` that have
+    the given mode bit (user, op, halfop, or voice)."""
+    __slots__ = ('chan', 'bit')
+    def __init__(self, chan, bit):
+        self.chan = chan
+        self.bit = bit
+
+    def _from_iterable(self, iterable):
+        return ircutils.IrcSet(iterable, casemapping=self.chan.casemapping)
+
+    def __contains__(self, nick):
+        return bool(self.chan._getModes(nick) & self.bit)
+
+    def __iter__(self):
+        bit = self.bit
+        for (nick, modes) in list(self.chan.members.items()):
+            if modes & bit:
+                yield nick
+
+    def __len__(self):
+        return self.chan._counts[self.bit]
+
+    def add(self, nick):
+        self.chan._setModes(nick, self.bit)
+
+    def discard(self, nick):
+        self.chan._unsetModes(nick, self.bit)
+
+    def copy(self):
+        return self._from_iterable(self)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, list(self))
+
+
 class ChannelState(utils.python.Object):
     """Represents the known state of an IRC channel.
 
@@ -316,29 +658,39 @@ class ChannelState(utils.python.Object):
 
         :type: int
 
+    .. attribute:: members
+
+        Dict of the nicks of the channel (including ops, halfops, and
+        voices that are not known to be in it, if any) to a bitmask of
+        :const:`USER`, :const:`OP`, :const:`HALFOP`, and :const:`VOICE`.
+        It must be changed through the methods of this class or of the
+        sets below, which keep count of the members having each bit.
+
+        :type: Dict[ircutils.IrcString, int]
+
     .. attribute:: ops
 
         Set of the nicks of all the operators of the channel.
 
-        :type: ircutils.IrcSet[str]
+        :type: ChannelMemberSet[str]
 
     .. attribute:: halfops
 
         Set of the nicks of all the half-operators of the channel.
 
-        :type: ircutils.IrcSet[str]
+        :type: ChannelMemberSet[str]
 
     .. attribute:: voices
 
         Set of the nicks of all the voiced users of the channel.
 
-        :type: ircutils.IrcSet[str]
+        :type: ChannelMemberSet[str]
 
     .. attribute:: users
 
         Set of the nicks of all the users in the channel.
 
-        :type: ircutils.IrcSet[str]
+        :type: ChannelMemberSet[str]
 
     .. attribute:: bans
 
@@ -353,48 +705,128 @@ class ChannelState(utils.python.Object):
 
         :type: Dict[str, Optional[str]]
     """
-
-    __slots__ = ('users', 'ops', 'halfops', 'bans',
-                 'voices', 'topic', 'modes', 'created')
-    def __init__(self):
+    USER = 1
+    OP = 2
+    HALFOP = 4
+    VOICE = 8
+    _bits = (USER, OP, HALFOP, VOICE)
+
+    _stateSlots = ('members', 'bans', 'topic', 'modes', 'created',
+                   'casemapping')
+    # _index is (NickTable, name) when the channel is in a ChannelsDict.
+    # _counts is {bit: number of members with it}, so the length of the
+    # member sets is known without going through all the members.
+    __slots__ = _stateSlots + ('_index', '_counts')
+    def __init__(self, casemapping=None):
+        self._index = None
+        self._counts = dict.fromkeys(self._bits, 0)
+        self.casemapping = casemapping
         self.topic = ''
         self.created = 0
-        self.ops = ircutils.IrcSet()
-        self.bans = ircutils.IrcSet()
-        self.users = ircutils.IrcSet()
-        self.voices = ircutils.IrcSet()
-        self.halfops = ircutils.IrcSet()
+        self.members = {}
+        self.bans = ircutils.IrcSet(casemapping=casemapping)
         self.modes = {}
 
+    @property
+    def users(self):
+        return ChannelMemberSet(self, self.USER)
+
+    @property
+    def ops(self):
+        return ChannelMemberSet(self, self.OP)
+
+    @property
+    def halfops(self):
+        return ChannelMemberSet(self, self.HALFOP)
+
+    @property
+    def voices(self):
+        return ChannelMemberSet(self, self.VOICE)
+
+    def setCasemapping(self, casemapping):
+        """Changes the casemapping used to compare nicks."""
+        members = list(self.members.items())
+        self.casemapping = casemapping
+        self.members = {}
+        for (nick, modes) in members:
+            nick = ircutils.ircString(str(nick), casemapping)
+            self.members[nick] = self.members.get(nick, 0) | modes
+        # Nicks equal with the new casemapping were merged.
+        self._countModes()
+        self.bans.setCasemapping(casemapping)
+
+    def _countModes(self):
+        counts = dict.fromkeys(self._bits, 0)
+        for modes in self.members.values():
+            for bit in self._bits:
+                if modes & bit:
+                    counts[bit] += 1
+        self._counts = counts
+
+    def _addCounts(self, bits, delta):
+        for bit in self._bits:
+            if bits & bit:
+                self._counts[bit] += delta
+
+    def _getModes(self, nick):
+        return self.members.get(ircutils.ircString(nick, self.casemapping), 0)
+
+    def _setModes(self, nick, bits):
+        if self._index is not None and bits & self.USER:
+            (table, name) = self._index
+            if not self._getModes(nick) & self.USER:
+                # Share the nick with the other channels.
+                nick = table.addChannel(nick, name).nick
+        nick = ircutils.ircString(nick, self.casemapping)
+        modes = self.members.get(nick, 0)
+        self.members[nick] = modes | bits
+        self._addCounts(bits & ~modes, 1)
+
+    def _unsetModes(self, nick, bits):
+        nick = ircutils.ircString(nick, self.casemapping)
+        modes = self.members.get(nick, 0)
+        if not modes & bits:
+            return
+        if modes & ~bits:
+            self.members[nick] = modes & ~bits
+        else:
+            del self.members[nick]
+        self._addCounts(modes & bits, -1)
+        if self._index is not None and modes & bits & self.USER:
+            (table, name) = self._index
+            table.removeChannel(nick, name)
+
     def isOp(self, nick):
         """Returns whether the given nick is an op."""
-        return nick in self.ops
+        return bool(self._getModes(nick) & self.OP)
 
     def isOpPlus(self, nick):
         """Returns whether the given nick is an op."""
-        return nick in self.ops
+        return bool(self._getModes(nick) & self.OP)
 
     def isVoice(self, nick):
         """Returns whether the given nick is voiced."""
-        return nick in self.voices
+        return bool(self._getModes(nick) & self.VOICE)
 
     def isVoicePlus(self, nick):
         """Returns whether the given nick is voiced, an halfop, or an op."""
-        return nick in self.voices or nick in self.halfops or nick in self.ops
+        return bool(self._getModes(nick) &
+                    (self.VOICE | self.HALFOP | self.OP))
 
     def isHalfop(self, nick):
         """Returns whether the given nick is an halfop."""
-        return nick in self.halfops
+        return bool(self._getModes(nick) & self.HALFOP)
 
     def isHalfopPlus(self, nick):
         """Returns whether the given nick is an halfop, or an op."""
-        return nick in self.halfops or nick in self.ops
+        return bool(self._getModes(nick) & (self.HALFOP | self.OP))
 
     def addUser(self, user, prefix_chars='@%+&~!'):
         "Adds a given user to the ChannelState.  Power prefixes are handled."
         nick = user.lstrip(prefix_chars)
         if not nick:
             return
+        bits = self.USER
         # & is used to denote protected users in UnrealIRCd
         # ~ is used to denote channel owner in UnrealIRCd
         # ! is used to denote protected users in UltimateIRCd
@@ -402,29 +834,26 @@ class ChannelState(utils.python.Object):
             (marker, user) = (user[0], user[1:])
             assert user, 'Looks like my caller is passing chars, not nicks.'
             if marker in '@&~!':
-                self.ops.add(nick)
+                bits |= self.OP
             elif marker == '%':
-                self.halfops.add(nick)
+                bits |= self.HALFOP
             elif marker == '+':
-                self.voices.add(nick)
-        self.users.add(nick)
+                bits |= self.VOICE
+        self._setModes(nick, bits)
 
     def replaceUser(self, oldNick, newNick):
         """Changes the user oldNick to newNick; used for NICK changes."""
         # Note that this doesn't have to have the sigil (@%+) that users
         # have to have for addUser; it just changes the name of the user
         # without changing any of their categories.
-        for s in (self.users, self.ops, self.halfops, self.voices):
-            if oldNick in s:
-                s.remove(oldNick)
-                s.add(newNick)
+        modes = self._getModes(oldNick)
+        if modes:
+            self._unsetModes(oldNick, modes)
+            self._setModes(newNick, modes)
 
     def removeUser(self, user):
         """Removes a given user from the channel."""
-        self.users.discard(user)
-        self.ops.discard(user)
-        self.halfops.discard(user)
-        self.voices.discard(user)
+        self._unsetModes(user, self.USER | self.OP | self.HALFOP | self.VOICE)
 
     def setMode(self, mode, value=None):
         assert mode not in 'ovhbeq'
@@ -464,19 +893,91 @@ class ChannelState(utils.python.Object):
                     self.unsetMode(modeChar)
 
     def __getstate__(self):
-        return [getattr(self, name) for name in self.__slots__]
+        return [getattr(self, name) for name in self._stateSlots]
 
     def __setstate__(self, t):
-        for (name, value) in zip(self.__slots__, t):
+        self._index = None
+        self.casemapping = None
+        for (name, value) in zip(self._stateSlots, t):
             setattr(self, name, value)
+        self._countModes()
 
     def __eq__(self, other):
         ret = True
-        for name in self.__slots__:
+        for name in self._stateSlots:
             ret = ret and getattr(self, name) == getattr(other, name)
         return ret
 
 
+class ChannelsDict(ircutils.IrcDict):
+    """Dictionary of :class:`ChannelState` objects, which also keeps the
+    records of the nicks of the network.
+
+    .. attribute:: nicks
+
+        The records of the nicks, including the channels each nick is in.
+        Channels are kept up to date by :meth:`ChannelState.addUser`,
+        :meth:`ChannelState.removeUser`, and
+        :meth:`ChannelState.replaceUser`.
+
+        :type: NickTable
+    """
+    __slots__ = ('nicks',)
+    def __init__(self, dict=None, key=None, casemapping=None):
+        self.nicks = NickTable(casemapping)
+        super(ChannelsDict, self).__init__(dict, key, casemapping)
+
+    def __setitem__(self, channel, chan):
+        if channel in self:
+            self._unbind(self[channel])
+        super(ChannelsDict, self).__setitem__(channel, chan)
+        if isinstance(chan, ChannelState):
+            self._bind(channel, chan)
+
+    def __delitem__(self, channel):
+        chan = self[channel]
+        super(ChannelsDict, self).__delitem__(channel)
+        self._unbind(chan)
+
+    def _bind(self, channel, chan):
+        chan._index = (self.nicks, channel)
+        members = chan.members
+        for (nick, modes) in list(members.items()):
+            if modes & chan.USER:
+                record = self.nicks.addChannel(nick, channel)
+                if record.nick is not nick:
+                    del members[nick]
+                    members[record.nick] = modes
+
+    def _unbind(self, chan):
+        if isinstance(chan, ChannelState) and chan._index is not None:
+            (__, channel) = chan._index
+            for nick in chan.users:
+                self.nicks.removeChannel(nick, channel)
+            chan._index = None
+
+    def clear(self):
+        for (channel, chan) in self.items():
+            self._unbind(chan)
+        self.data.clear()
+
+    def setCasemapping(self, casemapping):
+        channels = list(self.items())
+        self.clear()
+        self.casemapping = casemapping
+        self.nicks.setCasemapping(casemapping)
+        for (channel, chan) in channels:
+            if isinstance(chan, ChannelState):
+                chan.setCasemapping(casemapping)
+            self[channel] = chan
+
+    def getNickChannels(self, nick):
+        """Returns a new set of the names of the channels the nick is in."""
+        record = self.nicks.get(nick)
+        return ircutils.IrcSet(record.channels if record else (),
+                               casemapping=self.casemapping)
+
+
 Batch = collections.namedtuple('Batch', 'name type arguments messages parent_batch')
 """Represents a batch of messages, see
 <https://ircv3.net/specs/extensions/batch-3.2>
@@ -672,22 +1173,24 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
 
     .. attribute:: channels
 
-        Store channel states.
+        Store channel states, and which channels each nick is in.
 
-        :type: ircutils.IrcDict[str, ChannelState]
+        :type: ChannelsDict[str, ChannelState]
 
     .. attribute:: nicksToHostmasks
 
-        Stores the last hostmask of a seen nick.
+        Stores the last hostmask of a seen nick.  This is a view of
+        ``channels.nicks``.
 
-        :type: ircutils.IrcDict[str, str]
+        :type: NickRecordView[str, str]
 
     .. attribute:: nicksToAccounts
 
         Stores the current services account name of a seen nick (or
-        :const:`None` for un-identified nicks)
+        :const:`None` for un-identified nicks).  This is a view of
+        ``channels.nicks``.
 
-        :type: ircutils.IrcDict[str, Optional[str]]
+        :type: NickRecordView[str, Optional[str]]
     """
     __firewalled__ = {'addMsg': None}
 
@@ -703,12 +1206,8 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
             history = RingBuffer(conf.supybot.protocols.irc.maxHistoryLength())
         if supported is None:
             supported = utils.InsensitivePreservingDict()
-        if nicksToHostmasks is None:
-            nicksToHostmasks = ircutils.IrcDict()
-        if nicksToAccounts is None:
-            nicksToAccounts = ircutils.IrcDict()
         if channels is None:
-            channels = ircutils.IrcDict()
+            channels = ChannelsDict()
         self.capabilities_req = capabilities_req or set()
         self.capabilities_ack = capabilities_ack or set()
         self.capabilities_nak = capabilities_nak or set()
@@ -717,8 +1216,10 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
         self.supported = supported
         self.history = history
         self.channels = channels
-        self.nicksToHostmasks = nicksToHostmasks
-        self.nicksToAccounts = nicksToAccounts
+        if nicksToHostmasks is not None:
+            self.nicksToHostmasks = nicksToHostmasks
+        if nicksToAccounts is not None:
+            self.nicksToAccounts = nicksToAccounts
 
         # Batches usually finish and are way shorter than 3600s, but
         # we need to:
@@ -737,6 +1238,7 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
         self.supported.clear()
         self.nicksToHostmasks.clear()
         self.nicksToAccounts.clear()
+        self._setCasemapping(None)
         self.capabilities_req = set()
         self.capabilities_ack = set()
         self.capabilities_nak = set()
@@ -758,8 +1260,9 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
     def __reduce__(self):
         return (self.__class__, (self.history, self.supported,
                                  self.nicksToHostmasks,
-                                 self.nicksToAccounts,
-                                 self.channels))
+                                 self.channels,
+                                 None, None, None, None,
+                                 self.nicksToAccounts))
 
     def __eq__(self, other):
         return self.history == other.history and \
@@ -775,12 +1278,39 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
     def copy(self):
         ret = self.__class__()
         ret.history = copy.deepcopy(self.history)
+        # Must be copied first, as it holds the nick records.
+        ret.channels = copy.deepcopy(self.channels)
         ret.nicksToHostmasks = copy.deepcopy(self.nicksToHostmasks)
         ret.nicksToAccounts = copy.deepcopy(self.nicksToAccounts)
-        ret.channels = copy.deepcopy(self.channels)
         ret.batches = copy.deepcopy(self.batches)
         return ret
 
+    @property
+    def nicksToHostmasks(self):
+        return self.channels.nicks.hostmasks
+
+    @nicksToHostmasks.setter
+    def nicksToHostmasks(self, nicksToHostmasks):
+        self._replaceView(self.channels.nicks.hostmasks, nicksToHostmasks)
+
+    @property
+    def nicksToAccounts(self):
+        return self.channels.nicks.accounts
+
+    @nicksToAccounts.setter
+    def nicksToAccounts(self, nicksToAccounts):
+        self._replaceView(self.channels.nicks.accounts, nicksToAccounts)
+
+    @staticmethod
+    def _replaceView(view, d):
+        if d is view:
+            return
+        # IrcDict.items() returns the original keys, unlike iterating it.
+        items = list(d.items())
+        view.clear()
+        for (nick, value) in items:
+            view[nick] = value
+
     def addMsg(self, irc, msg):
         """Updates the state based on the irc object and the message."""
         self.history.append(msg)
@@ -798,6 +1328,31 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
         if method is not None:
             method(irc, msg)
 
+    def _addChannel(self, irc, channel):
+        """Creates the state of a channel, and adds it to the channels of
+        this network in world.ircsByChannel."""
+        chan = ChannelState(self.channels.casemapping)
+        self.channels[channel] = chan
+        if getattr(irc, 'state', None) is self:
+            world._addIrcToChannel(irc, channel)
+        return chan
+
+    def _setCasemapping(self, casemapping):
+        """Makes the nick and channel dictionaries of this state use the
+        casemapping advertised by the server.  Unknown casemappings fall
+        back to rfc1459."""
+        if casemapping == 'rfc1459' or \
+                not ircutils.isCasemapping(casemapping):
+            casemapping = None
+        if casemapping == self.channels.casemapping:
+            return
+        self.channels.setCasemapping(casemapping)
+
+    def _removeChannel(self, irc, channel):
+        del self.channels[channel]
+        if getattr(irc, 'state', None) is self:
+            world._removeIrcFromChannel(irc, channel)
+
     def getTopic(self, channel):
         """Returns the topic for a given channel."""
         return self.channels[channel].topic
@@ -964,6 +1519,8 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
                     log.error('Name: %s, Converter: %s', name, converter)
             else:
                 self.supported[arg] = None
+        if any(arg.startswith('CASEMAPPING=') for arg in msg.args[1:-1]):
+            self._setCasemapping(self.supported.get('CASEMAPPING'))
 
     def do352(self, irc, msg):
         # WHO reply.
@@ -991,7 +1548,7 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
         # NAMES reply.
         (__, type, channel, items) = msg.args
         if channel not in self.channels:
-            self.channels[channel] = ChannelState()
+            self._addChannel(irc, channel)
         c = self.channels[channel]
 
         # Set of prefixes servers may append before a NAMES reply when
@@ -1038,9 +1595,8 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
             if channel in self.channels:
                 self.channels[channel].addUser(msg.nick)
             elif msg.nick: # It must be us.
-                chan = ChannelState()
+                chan = self._addChannel(irc, channel)
                 chan.addUser(msg.nick)
-                self.channels[channel] = chan
                 # I don't know why this assert was here.
                 #assert msg.nick == irc.nick, msg
         if 'extended-join' in self.capabilities_ack:
@@ -1068,8 +1624,7 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
             try:
                 chan = self.channels[channel]
             except KeyError:
-                chan = ChannelState()
-                self.channels[channel] = chan
+                chan = self._addChannel(irc, channel)
             chan.doMode(msg)
 
     def do324(self, irc, msg):
@@ -1077,8 +1632,7 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
         try:
             chan = self.channels[channel]
         except KeyError:
-            chan = ChannelState()
-            self.channels[channel] = chan
+            chan = self._addChannel(irc, channel)
         for (mode, value) in ircutils.separateModes(msg.args[2:]):
             modeChar = mode[1]
             if mode[0] == '+' and mode[1] not in 'ovh':
@@ -1092,8 +1646,7 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
         try:
             chan = self.channels[channel]
         except KeyError:
-            chan = ChannelState()
-            self.channels[channel] = chan
+            chan = self._addChannel(irc, channel)
         chan.created = int(msg.args[2])
 
     def doPart(self, irc, msg):
@@ -1103,7 +1656,7 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
             except KeyError:
                 continue
             if ircutils.strEqual(msg.nick, irc.nick):
-                del self.channels[channel]
+                self._removeChannel(irc, channel)
             else:
                 chan.removeUser(msg.nick)
 
@@ -1112,17 +1665,15 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
         chan = self.channels[channel]
         for user in users.split(','):
             if ircutils.strEqual(user, irc.nick):
-                del self.channels[channel]
+                self._removeChannel(irc, channel)
                 return
             else:
                 chan.removeUser(user)
 
     def doQuit(self, irc, msg):
-        channel_names = ircutils.IrcSet()
-        for (name, channel) in self.channels.items():
-            if msg.nick in channel.users:
-                channel_names.add(name)
-                channel.removeUser(msg.nick)
+        channel_names = self.channels.getNickChannels(msg.nick)
+        for name in channel_names:
+            self.channels[name].removeUser(msg.nick)
         # Remember which channels the user was on
         msg.tag('channels', channel_names)
         if msg.nick in self.nicksToHostmasks:
@@ -1164,11 +1715,9 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
         except KeyError:
             pass
 
-        channel_names = ircutils.IrcSet()
-        for (name, channel) in self.channels.items():
-            if msg.nick in channel.users:
-                channel_names.add(name)
-            channel.replaceUser(oldNick, newNick)
+        channel_names = self.channels.getNickChannels(oldNick)
+        for name in channel_names:
+            self.channels[name].replaceUser(oldNick, newNick)
         msg.tag('channels', channel_names)
 
     def doBatch(self, irc, msg):
@@ -1198,11 +1747,7 @@ class IrcState(IrcCommandDispatcher, log.Firewalled):
             assert False, msg.args[0]
 
     def doAway(self, irc, msg):
-        channel_names = ircutils.IrcSet()
-        for (name, channel) in self.channels.items():
-            if msg.nick in channel.users:
-                channel_names.add(name)
-        msg.tag('channels', channel_names)
+        msg.tag('channels', self.channels.getNickChannels(msg.nick))
 
 
 ###
@@ -1296,12 +1841,12 @@ class Irc(IrcCommandDispatcher, log.Firewalled):
     # that's why we don't do the normal None default with a check.
     def __init__(self, network, callbacks=_callbacks):
         self.zombie = False
-        world.ircs.append(self)
         self.network = network
+        world.ircs.append(self)
         self.startedAt = time.time()
         self.callbacks = callbacks
         self.state = IrcState()
-        self.queue = IrcMsgQueue()
+        self.queue = self._makeQueue()
         self.fastqueue = smallqueue()
 
         # Messages of batches that are currently in one self.queue (not
@@ -1398,6 +1943,13 @@ class Irc(IrcCommandDispatcher, log.Firewalled):
         self.callbacks[:] = good
         return bad
 
+    def _makeQueue(self):
+        scheduler = schedulers[conf.supybot.protocols.irc.queuing.scheduler()]
+        if scheduler is IrcMsgQueue:
+            return IrcMsgQueue()
+        else:
+            return scheduler(network=self.network)
+
     def queueMsg(self, msg):
         """Queues a message to be sent to the server."""
         if msg.command.upper() == 'BATCH':
@@ -1506,6 +2058,25 @@ class Irc(IrcCommandDispatcher, log.Firewalled):
             msg._len = len(str(msg))
         # TODO: truncate tags
 
+    def _takeThrottleToken(self, now):
+        """Token bucket limiting how fast queued messages are sent: up to
+        supybot.protocols.irc.queuing.burst messages can be sent at once,
+        then one every supybot.protocols.irc.throttleTime seconds."""
+        throttleTime = conf.supybot.protocols.irc.throttleTime()
+        burst = conf.supybot.protocols.irc.queuing.burst()
+        if throttleTime > 0:
+            elapsed = max(0, now - self.lastTake)
+            self.throttleTokens = min(burst,
+                self.throttleTokens + elapsed / throttleTime)
+        else:
+            self.throttleTokens = burst
+        self.lastTake = now
+        if self.throttleTokens >= 1:
+            self.throttleTokens -= 1
+            return True
+        else:
+            return False
+
     def takeMsg(self):
         """Called by the IrcDriver; takes a message to be sent."""
         if not self.callbacks:
@@ -1515,11 +2086,10 @@ class Irc(IrcCommandDispatcher, log.Firewalled):
         if self.fastqueue:
             msg = self.fastqueue.dequeue()
         elif self.queue:
-            if now-self.lastTake < conf.supybot.protocols.irc.throttleTime():
-                log.debug('Irc.takeMsg throttling.')
-            else:
-                self.lastTake = now
+            if self._takeThrottleToken(now):
                 msg = self.queue.dequeue()
+            else:
+                log.debug('Irc.takeMsg throttling.')
         elif self.afterConnect and \
              conf.supybot.protocols.irc.ping() and \
              now > self.lastping + conf.supybot.protocols.irc.ping.interval():
@@ -1729,8 +2299,13 @@ class Irc(IrcCommandDispatcher, log.Firewalled):
     def reset(self):
         """Resets the Irc object.  Called when the driver reconnects."""
         self._setNonResettingVariables()
+        world._removeIrcFromChannels(self)
         self.state.reset()
-        self.queue.reset()
+        scheduler = schedulers[conf.supybot.protocols.irc.queuing.scheduler()]
+        if type(self.queue) is scheduler:
+            self.queue.reset()
+        else:
+            self.queue = self._makeQueue()
         self.fastqueue.reset()
         self.startedSync.clear()
         for callback in self.callbacks:
@@ -1756,6 +2331,7 @@ class Irc(IrcCommandDispatcher, log.Firewalled):
         self.prefix = '%s!%s@%s' % (self.nick, self.ident, 'unset.domain')
         # The rest.
         self.lastTake = 0
+        self.throttleTokens = 0
         self.server = 'unset'
         self.afterConnect = False
         self.startedAt = time.time()
@@ -2513,6 +3089,7 @@ class Irc(IrcCommandDispatcher, log.Firewalled):
         #     and fix whatever AttributeErrors arise in the drivers themselves.
         if self.driver is not None and hasattr(self.driver, 'die'):
             self.driver.die()
+        world._removeIrcFromChannels(self)
         if self in world.ircs:
             world.ircs.remove(self)
             # Only kill the callbacks if we're the last Irc.
@@ -43,11 +43,13 @@ import re
 import sys
 import time
 import uuid
+import heapq
 import base64
 import random
 import string
 import textwrap
 import functools
+import threading
 import collections.abc
 
 from . import utils
@@ -115,18 +117,60 @@ def joinHostmask(nick, ident, host):
     assert nick and ident and host
     return minisix.intern('%s!%s@%s' % (nick, ident, host))
 
-_rfc1459trans = utils.str.MultipleReplacer(dict(list(zip(
-                                 string.ascii_uppercase + r'\[]~',
-                                 string.ascii_lowercase + r'|{}^'))))
+_casemappings = {
+    'rfc1459': (string.ascii_uppercase + '\\[]~',
+                string.ascii_lowercase + '|{}^'),
+    'strict-rfc1459': (string.ascii_uppercase + '\\[]',
+                       string.ascii_lowercase + '|{}'),
+    'ascii': (string.ascii_uppercase, string.ascii_lowercase),
+}
+_strTables = dict((name, str.maketrans(upper, lower))
+                  for (name, (upper, lower)) in _casemappings.items())
+_bytesTables = dict((name, bytes.maketrans(upper.encode(), lower.encode()))
+                    for (name, (upper, lower)) in _casemappings.items())
+
+# Nicks and channels are looked up over and over, so the lowered form of
+# short strings is cached, per casemapping.  The caches are simply emptied
+# when they grow too large.
+_maxCachedLength = 128
+_maxCacheSize = 50000
+_loweredCache = dict((name, {}) for name in _casemappings)
+_ircStringCache = dict((name, {}) for name in _casemappings)
+_ircStringCache[None] = {}
+
+def isCasemapping(casemapping):
+    """Returns whether the given casemapping (as advertised in the
+    CASEMAPPING token of RPL_ISUPPORT) is supported by toLower."""
+    return casemapping in _casemappings
+
+def _lower(s, casemapping):
+    if s.isascii():
+        # bytes.translate is a lot faster than str.translate
+        return s.encode().translate(_bytesTables[casemapping]).decode()
+    else:
+        return s.translate(_strTables[casemapping])
+
 def toLower(s, casemapping=None):
     """s => s
     Returns the string s lowered according to IRC case rules."""
-    if casemapping is None or casemapping == 'rfc1459':
-        return _rfc1459trans(s)
-    elif casemapping == 'ascii': # freenode
-        return s.lower()
-    else:
+    if type(s) is IrcString:
+        if s.casemapping == casemapping:
+            return s.lowered
+        s = str(s)
+    if casemapping is None:
+        casemapping = 'rfc1459'
+    try:
+        cache = _loweredCache[casemapping]
+    except KeyError:
         raise ValueError('Invalid casemapping: %r' % casemapping)
+    lowered = cache.get(s)
+    if lowered is None:
+        lowered = _lower(s, casemapping)
+        if len(s) <= _maxCachedLength:
+            if len(cache) >= _maxCacheSize:
+                cache.clear()
+            cache[s] = lowered
+    return lowered
 
 def strEqual(nick1, nick2):
     """s1, s2 => bool
@@ -682,77 +726,63 @@ class FormatContext(object):
         else:
             return 0
 
+# A color number is read digit by digit, as long as it stays lower than 16.
+_colorNumber = r'(0*(?:1[0-5]?|[2-9])?)'
+_formatRe = re.compile(r'[\x02\x16\x1f\x0f]|\x03%s(?:(,)%s)?' %
+                       (_colorNumber, _colorNumber))
+
 class FormatParser(object):
     def __init__(self, s):
-        self.fd = minisix.io.StringIO(s)
-        self.last = None
+        self.s = s
         self.max_context_size = 0
 
-    def getChar(self):
-        if self.last is not None:
-            c = self.last
-            self.last = None
-            return c
+    def parse(self, context=None):
+        """Returns the context at the end of the string, given the one at
+        its beginning (if any), eg. the context at the end of the previous
+        chunk of a wrapped string."""
+        # Work on local variables, this is called for every chunk of every
+        # long reply.
+        if context is None:
+            (fg, bg, bold, reverse, underline) = \
+                (None, None, False, False, False)
         else:
-            return self.fd.read(1)
-
-    def ungetChar(self, c):
-        self.last = c
-
-    def parse(self):
+            (fg, bg, bold, reverse, underline) = (context.fg, context.bg,
+                context.bold, context.reverse, context.underline)
         context = FormatContext()
-        c = self.getChar()
-        while c:
+        max_context_size = self.max_context_size
+        for m in _formatRe.finditer(self.s):
+            c = m.group(0)[0]
             if c == '\x02':
-                context.bold = not context.bold
-                self.max_context_size = max(
-                        self.max_context_size, context.size())
+                bold = not bold
             elif c == '\x16':
-                context.reverse = not context.reverse
-                self.max_context_size = max(
-                        self.max_context_size, context.size())
+                reverse = not reverse
             elif c == '\x1f':
-                context.underline = not context.underline
-                self.max_context_size = max(
-                        self.max_context_size, context.size())
+                underline = not underline
             elif c == '\x0f':
-                context.reset()
-            elif c == '\x03':
-                self.getColor(context)
-                self.max_context_size = max(
-                        self.max_context_size, context.size())
-            c = self.getChar()
-        return context
-
-    def getInt(self):
-        i = 0
-        setI = False
-        c = self.getChar()
-        while c.isdigit():
-            j = i * 10
-            j += int(c)
-            if j >= 16:
-                self.ungetChar(c)
-                break
+                (fg, bg, bold, reverse, underline) = \
+                    (None, None, False, False, False)
+                continue
             else:
-                setI = True
-                i = j
-                c = self.getChar()
-        self.ungetChar(c)
-        if setI:
-            return i
-        else:
-            return None
-
-    def getColor(self, context):
-        context.fg = self.getInt()
-        c = self.getChar()
-        if c == ',':
-            context.bg = self.getInt()
-        else:
-            self.ungetChar(c)
+                (fgDigits, comma, bgDigits) = m.groups()
+                fg = int(fgDigits) if fgDigits else None
+                if comma:
+                    bg = int(bgDigits) if bgDigits else None
+            # Same as FormatContext.size()
+            size = bold + reverse + underline + bool(fg) + bool(bg)
+            if fg and bg:
+                size += 6
+            elif fg or bg:
+                size += 3
+            if size and size + 1 > max_context_size: # + 1 for '\x0f'
+                max_context_size = size + 1
+        self.max_context_size = max_context_size
+        (context.fg, context.bg, context.bold, context.reverse,
+         context.underline) = (fg, bg, bold, reverse, underline)
+        return context
 
-def wrap(s, length, break_on_hyphens = False):
+def iterWrap(s, length, break_on_hyphens = False):
+    """Like wrap(), but returns an iterator of the chunks, which wraps the
+    string as chunks are needed."""
     # Get the maximum number of bytes needed to format a chunk of the string
     # at any point.
     # This is an overapproximation of what each chunk will need, but it's
@@ -762,15 +792,19 @@ def wrap(s, length, break_on_hyphens = False):
     parser.parse()
     format_overhead = parser.max_context_size
 
-    processed = []
-    chunks = utils.str.byteTextWrap(s, length - format_overhead)
+    chunks = utils.str.iterByteTextWrap(s, length - format_overhead)
     context = None
     for chunk in chunks:
+        # Only the chunk itself is parsed, not the codes restoring the
+        # context it starts in.
+        nextContext = FormatParser(chunk).parse(context)
         if context is not None:
             chunk = context.start(chunk)
-        context = FormatParser(chunk).parse()
-        processed.append(context.end(chunk))
-    return processed
+        context = nextContext
+        yield context.end(chunk)
+
+def wrap(s, length, break_on_hyphens = False):
+    return list(iterWrap(s, length, break_on_hyphens))
 
 def isValidArgument(s):
     """Returns whether s is strictly a valid argument for an IRC message."""
@@ -823,15 +857,18 @@ def unDccIP(i):
 
 class IrcString(str):
     """This class does case-insensitive comparison and hashing of nicks."""
-    __slots__ = ('lowered',)
-    def __new__(cls, s=''):
+    __slots__ = ('lowered', 'casemapping')
+    def __new__(cls, s='', casemapping=None):
         x = super(IrcString, cls).__new__(cls, s)
-        x.lowered = str(toLower(x))
+        x.lowered = toLower(str(x), casemapping)
+        x.casemapping = casemapping
         return x
 
     def __eq__(self, s):
+        if isinstance(s, IrcString) and s.casemapping == self.casemapping:
+            return s.lowered == self.lowered
         try:
-            return toLower(s) == self.lowered
+            return toLower(s, self.casemapping) == self.lowered
         except:
             return False
 
@@ -841,15 +878,59 @@ class IrcString(str):
     def __hash__(self):
         return hash(self.lowered)
 
+def ircString(s, casemapping=None):
+    """Returns an :class:`IrcString` for the string s and the given
+    casemapping.  IrcStrings of short strings are interned, so this is
+    faster than creating a new IrcString, and a single object is shared by
+    all the sets a nick is in."""
+    if type(s) is IrcString:
+        if s.casemapping == casemapping:
+            return s
+        s = str(s)
+    elif type(s) is not str:
+        return IrcString(s, casemapping)
+    try:
+        cache = _ircStringCache[casemapping]
+    except KeyError:
+        raise ValueError('Invalid casemapping: %r' % casemapping)
+    x = cache.get(s)
+    if x is None:
+        x = IrcString(s, casemapping)
+        if len(s) <= _maxCachedLength:
+            if len(cache) >= _maxCacheSize:
+                cache.clear()
+            cache[s] = x
+    return x
+
 
 class IrcDict(utils.InsensitivePreservingDict):
-    """Subclass of dict to make key comparison IRC-case insensitive."""
-    __slots__ = ()
+    """Subclass of dict to make key comparison IRC-case insensitive.
+
+    The casemapping of the keys defaults to rfc1459, and can be changed
+    with :meth:`setCasemapping`."""
+    __slots__ = ('casemapping',)
+    def __init__(self, dict=None, key=None, casemapping=None):
+        self.casemapping = casemapping
+        super(IrcDict, self).__init__(dict, key)
+
     def key(self, s):
         if s is not None:
-            s = toLower(s)
+            s = toLower(s, self.casemapping)
         return s
 
+    def setCasemapping(self, casemapping):
+        """Changes the casemapping used to compare keys, and re-keys the
+        dictionary."""
+        items = list(self.data.values())
+        self.casemapping = casemapping
+        self.data.clear()
+        for (k, v) in items:
+            self[k] = v
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self.data.values()), None,
+                                 self.casemapping))
+
 class CallableValueIrcDict(IrcDict):
     __slots__ = ()
     def __getitem__(self, k):
@@ -860,22 +941,47 @@ class CallableValueIrcDict(IrcDict):
 
 class IrcSet(utils.NormalizingSet):
     """A sets.Set using IrcStrings instead of regular strings."""
-    __slots__ = ()
+    __slots__ = ('casemapping',)
+    def __init__(self, iterable=(), casemapping=None):
+        self.casemapping = casemapping
+        super(IrcSet, self).__init__(iterable)
+
     def normalize(self, s):
-        return IrcString(s)
+        return ircString(s, self.casemapping)
+
+    def setCasemapping(self, casemapping):
+        """Changes the casemapping used to compare elements."""
+        items = list(self)
+        self.casemapping = casemapping
+        self.clear()
+        self.update(map(self.normalize, items))
 
     def __reduce__(self):
-        return (self.__class__, (list(self),))
+        return (self.__class__, (list(self), self.casemapping))
 
 
 class FloodQueue(object):
+    """Remembers what was enqueued for each key (by default, the host of
+    the sender of a message) during the last `timeout` seconds.
+
+    Keys with nothing left in their window are forgotten: they are put in a
+    timer wheel (with `resolution`-second slots) when they are created, and
+    expired or rescheduled when their slot is reached."""
     timeout = 0
+    resolution = 1
     def __init__(self, timeout=None, queues=None):
         if timeout is not None:
             self.timeout = timeout
         if queues is None:
-            queues = IrcDict()
+            queues = {}
+        # {normalized key: [(time, what), ...]}, oldest first
         self.queues = queues
+        # {(normalized key, what): number of times it is in the queue}
+        self.counts = {}
+        # {slot: [key, ...]}, and a heap of the slots in the wheel
+        self.wheel = {}
+        self.slots = []
+        self.lock = threading.Lock()
 
     def __repr__(self):
         return 'FloodQueue(timeout=%r, queues=%s)' % (self.timeout,
@@ -893,46 +999,92 @@ class FloodQueue(object):
         else:
             return self.timeout
 
-    def _getQueue(self, msg, insert=True):
-        key = self.key(msg)
-        try:
-            return self.queues[key]
-        except KeyError:
-            if insert:
-                # python--
-                # instancemethod.__repr__ calls the instance.__repr__, which
-                # means that our __repr__ calls self.queues.__repr__, which
-                # calls structures.TimeoutQueue.__repr__, which calls
-                # getTimeout.__repr__, which calls our __repr__, which calls...
-                getTimeout = lambda : self.getTimeout()
-                q = utils.structures.TimeoutQueue(getTimeout)
-                self.queues[key] = q
-                return q
+    def _normalize(self, key):
+        if key is not None:
+            key = toLower(key)
+        return key
+
+    def _schedule(self, key, at):
+        slot = int(at // self.resolution) + 1
+        keys = self.wheel.get(slot)
+        if keys is None:
+            keys = self.wheel[slot] = []
+            heapq.heappush(self.slots, slot)
+        keys.append(key)
+
+    def _prune(self, key, queue, now, timeout):
+        """Removes the expired elements at the beginning of the queue of
+        this key."""
+        i = 0
+        for (t, what) in queue:
+            if now - t <= timeout:
+                break
+            countKey = (key, what)
+            n = self.counts[countKey]
+            if n == 1:
+                del self.counts[countKey]
             else:
-                return None
+                self.counts[countKey] = n - 1
+            i += 1
+        if i:
+            del queue[:i]
+
+    def _expire(self, now, timeout):
+        """Forgets keys whose slot in the wheel is over, unless they still
+        have elements, in which case they are rescheduled."""
+        currentSlot = now // self.resolution
+        while self.slots and self.slots[0] <= currentSlot:
+            slot = heapq.heappop(self.slots)
+            for key in self.wheel.pop(slot):
+                queue = self.queues.get(key)
+                if queue is None:
+                    continue
+                self._prune(key, queue, now, timeout)
+                if queue:
+                    self._schedule(key, queue[0][0] + timeout)
+                else:
+                    del self.queues[key]
+
+    def _getQueue(self, key, now, timeout):
+        self._expire(now, timeout)
+        queue = self.queues.get(key)
+        if queue is not None:
+            self._prune(key, queue, now, timeout)
+        return queue
 
     def enqueue(self, msg, what=None):
         if what is None:
             what = msg
-        q = self._getQueue(msg)
-        q.enqueue(what)
+        key = self._normalize(self.key(msg))
+        now = time.time()
+        timeout = self.getTimeout()
+        with self.lock:
+            queue = self._getQueue(key, now, timeout)
+            if queue is None:
+                queue = self.queues[key] = []
+                self._schedule(key, now + timeout)
+            queue.append((now, what))
+            countKey = (key, what)
+            self.counts[countKey] = self.counts.get(countKey, 0) + 1
 
     def len(self, msg):
-        q = self._getQueue(msg, insert=False)
-        if q is not None:
-            return len(q)
-        else:
-            return 0
+        key = self._normalize(self.key(msg))
+        with self.lock:
+            queue = self._getQueue(key, time.time(), self.getTimeout())
+            if queue is not None:
+                return len(queue)
+            else:
+                return 0
 
     def has(self, msg, what=None):
-        q = self._getQueue(msg, insert=False)
-        if q is not None:
-            if what is None:
-                what = msg
-            for elt in q:
-                if elt == what:
-                    return True
-        return False
+        if what is None:
+            what = msg
+        key = self._normalize(self.key(msg))
+        with self.lock:
+            queue = self._getQueue(key, time.time(), self.getTimeout())
+            if queue is None:
+                return False
+            return (key, what) in self.counts
 
 
 mircColors = IrcDict({
@@ -31,6 +31,7 @@
 import os
 import sys
 import time
+import queue
 import types
 import atexit
 import logging
@@ -52,8 +53,31 @@ testing = False
 
 class Formatter(logging.Formatter):
     _fmtConf = staticmethod(lambda : conf.supybot.log.format())
+
+    # Value of _fmtConf(), so it is not looked up in the registry for every
+    # record.  Reset by invalidateCache() when the configuration changes.
+    _cachedFmt = None
+    _cachedTimestampFormat = None
+    _cacheTime = 0
+
+    def invalidateCache(self):
+        self._cachedFmt = None
+        self._cachedTimestampFormat = None
+
+    def _checkCache(self):
+        # Values reloaded from the registry file don't trigger callbacks
+        # until they are read.
+        if self._cachedFmt is None or self._cacheTime < registry._lastModified:
+            self._cacheTime = registry._lastModified
+            self._cachedFmt = self._fmtConf()
+            self._cachedTimestampFormat = conf.supybot.log.timestampFormat()
+            self._fmt = self._cachedFmt
+            if hasattr(self, '_style'): # Python 3
+                self._style._fmt = self._cachedFmt
+
     def formatTime(self, record, datefmt=None):
-        return timestamp(record.created)
+        self._checkCache()
+        return timestamp(record.created, self._cachedTimestampFormat)
 
     def formatException(self, exc_info):
         (E, e, tb) = exc_info
@@ -63,9 +87,7 @@ class Formatter(logging.Formatter):
         return logging.Formatter.formatException(self, (E, e, tb))
 
     def format(self, record):
-        self._fmt = self._fmtConf()
-        if hasattr(self, '_style'): # Python 3
-            self._style._fmt = self._fmtConf()
+        self._checkCache()
         return logging.Formatter.format(self, record)
 
 
@@ -117,7 +139,7 @@ class StdoutStreamHandler(logging.StreamHandler):
 
     def disable(self):
         self.setLevel(sys.maxsize) # Just in case.
-        _logger.removeHandler(self)
+        _removeHandler(self)
         logging._acquireLock()
         try:
             del logging._handlers[self]
@@ -144,6 +166,65 @@ class BetterFileHandler(logging.handlers.WatchedFileHandler):
                 raise
 
 
+class QueueHandler(logging.handlers.QueueHandler):
+    """Puts records in a queue, for the log thread to pass them to
+    `handler`.  Records that do not fit in the queue are dropped and
+    counted."""
+    def __init__(self, q, handler):
+        super().__init__(q)
+        self.handler = handler
+        self.dropped = 0
+        self._reportedDropped = 0
+
+    def handle(self, record):
+        # Check the level of the real handler now, so records it would
+        # ignore do not take room in the queue.
+        if record.levelno < self.handler.level:
+            return False
+        return super().handle(record)
+
+    def prepare(self, record):
+        # Unlike the parent class, don't format the record here: formatting
+        # is the job of the real handler, in the log thread.
+        return (self, record)
+
+    def enqueue(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def reportDropped(self):
+        """Called from the log thread to tell the real handler how many
+        records it missed, if any."""
+        dropped = self.dropped - self._reportedDropped
+        if dropped:
+            self._reportedDropped += dropped
+            record = _logger.makeRecord(_logger.name, logging.WARNING,
+                __file__, 0, '%s log records were dropped because the log '
+                'queue was full.' % dropped, (), None)
+            self.handler.handle(record)
+
+
+class QueueListener(logging.handlers.QueueListener):
+    """Log thread, passing records queued by QueueHandlers to their real
+    handler."""
+    def __init__(self, q):
+        super().__init__(q)
+
+    def handle(self, item):
+        (queueHandler, record) = item
+        try:
+            queueHandler.handler.handle(record)
+            queueHandler.reportDropped()
+        except Exception:
+            queueHandler.handler.handleError(record)
+
+    def enqueue_sentinel(self):
+        # Wait for room in the queue, instead of raising queue.Full
+        self.queue.put(self._sentinel)
+
+
 class ColorizedFormatter(Formatter):
     # This was necessary because these variables aren't defined until later.
     # The staticmethod is necessary because they get treated like methods.
@@ -304,6 +385,18 @@ conf.registerGlobalValue(conf.supybot.log.plugins, 'format',
     documentation on the available formattings is Python's documentation on
     its logging module."""))
 
+conf.registerGlobalValue(conf.supybot.log, 'asynchronous',
+    registry.Boolean(False, """Determines whether log records will be
+    formatted and written by a dedicated thread, instead of by the thread
+    logging them.  This keeps a slow disk or terminal from delaying the bot,
+    but the last records may be lost if the bot crashes."""))
+conf.registerGlobalValue(conf.supybot.log.asynchronous, 'queueSize',
+    registry.PositiveInteger(10000, """Determines how many log records may
+    wait to be written when supybot.log.asynchronous is enabled.  Further
+    records are dropped, and the number of dropped records is logged when
+    there is room again.  Changes take effect the next time
+    supybot.log.asynchronous is enabled."""))
+
 
 # These just make things easier.
 debug = _logger.debug
@@ -325,6 +418,56 @@ atexit.register(logging.shutdown)
 ircutils.debug = debug
 ircutils.warning = warning
 
+# Queue and thread used when supybot.log.asynchronous is enabled.
+_logQueue = None
+_listener = None
+
+# Maps each handler of supybot's loggers to its logger and to the handler
+# actually attached to the logger; which is either the handler itself or a
+# QueueHandler.
+_attachedHandlers = {}
+
+def _attachHandler(logger, handler, attached):
+    if handler in _attachedHandlers:
+        logger.removeHandler(_attachedHandlers[handler][1])
+    logger.addHandler(attached)
+    _attachedHandlers[handler] = (logger, attached)
+
+def _addHandler(logger, handler):
+    if _listener is None:
+        attached = handler
+    else:
+        attached = QueueHandler(_logQueue, handler)
+    _attachHandler(logger, handler, attached)
+
+def _removeHandler(handler):
+    if handler in _attachedHandlers:
+        (logger, attached) = _attachedHandlers.pop(handler)
+        logger.removeHandler(attached)
+
+def _setAsynchronous():
+    global _logQueue, _listener
+    enable = conf.supybot.log.asynchronous()
+    if enable == (_listener is not None):
+        return
+    if enable:
+        _logQueue = queue.Queue(conf.supybot.log.asynchronous.queueSize())
+        _listener = QueueListener(_logQueue)
+        for (handler, (logger, _)) in list(_attachedHandlers.items()):
+            _attachHandler(logger, handler, QueueHandler(_logQueue, handler))
+        _listener.start()
+    else:
+        for (handler, (logger, _)) in list(_attachedHandlers.items()):
+            _attachHandler(logger, handler, handler)
+        # Writes the records still in the queue.
+        _listener.stop()
+        _listener = None
+        _logQueue = None
+
+def _stopListener():
+    if _listener is not None:
+        _listener.stop()
+
 def getPluginLogger(name):
     if not conf.supybot.log.plugins.individualLogfiles():
         return _logger
@@ -334,15 +477,16 @@ def getPluginLogger(name):
         handler = BetterFileHandler(filename)
         handler.setLevel(-1)
         handler.setFormatter(pluginFormatter)
-        log.addHandler(handler)
+        _addHandler(log, handler)
     if name in sys.modules:
         log.info('Starting log for %s.', name)
     return log
 
-def timestamp(when=None):
+def timestamp(when=None, format=None):
     if when is None:
         when = time.time()
-    format = conf.supybot.log.timestampFormat()
+    if format is None:
+        format = conf.supybot.log.timestampFormat()
     t = time.localtime(when)
     if format:
         return time.strftime(format, t)
@@ -410,7 +554,7 @@ _handler.setFormatter(formatter)
 _handler.addFilter(PluginLogFilter())
 
 _handler.setLevel(conf.supybot.log.level())
-_logger.addHandler(_handler)
+_addHandler(_logger, _handler)
 _logger.setLevel(-1)
 
 _stdoutFormatter = ColorizedFormatter(
@@ -418,7 +562,18 @@ _stdoutFormatter = ColorizedFormatter(
 _stdoutHandler.setFormatter(_stdoutFormatter)
 _stdoutHandler.setLevel(conf.supybot.log.stdout.level())
 if not conf.daemonized:
-    _logger.addHandler(_stdoutHandler)
+    _addHandler(_logger, _stdoutHandler)
+
+for _value in (conf.supybot.log.format, conf.supybot.log.plugins.format,
+               conf.supybot.log.stdout.format,
+               conf.supybot.log.timestampFormat):
+    for _formatter in (formatter, pluginFormatter, _stdoutFormatter):
+        _value.addCallback(_formatter.invalidateCache)
+
+conf.supybot.log.asynchronous.addCallback(_setAsynchronous)
+_setAsynchronous()
+# Registered after logging.shutdown, so it runs before it.
+atexit.register(_stopListener)
 
 
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
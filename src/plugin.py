@@ -135,6 +135,7 @@ def renameCommand(cb, name, newName):
             return
         setattr(cb.__class__, newName, method)
         delattr(cb.__class__, name)
+        callbacks.commandIndex.invalidate()
 
 def registerRename(plugin, command=None, newName=None):
     g = conf.registerGlobalValue(conf.supybot.commands.renames, plugin,
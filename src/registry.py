@@ -75,9 +75,12 @@ monotonic_time = time.monotonic
 
 _cache = utils.InsensitivePreservingDict()
 _lastModified = 0
+# Incremented every time a value is set or the registry file is loaded, so
+# values read from the registry can be cached until one of them changes.
+_generation = 0
 def open_registry(filename, clear=False):
     """Initializes the module by loading the registry file into memory."""
-    global _lastModified
+    global _lastModified, _generation
     if clear:
         _cache.clear()
     _fd = open(filename, encoding='utf8')
@@ -111,6 +114,7 @@ def open_registry(filename, clear=False):
             )
         _cache[key] = value
     _lastModified = monotonic_time()
+    _generation += 1
     _fd.close()
 
 CONF_FILE_HEADER = """
@@ -521,6 +525,8 @@ class Value(Group):
         inherited=True means the value is inherited from the parent, so if
         the parent gets a new value, this group will get the new value as
         well."""
+        global _generation
+        _generation += 1
         self._lastModified = monotonic_time()
         self.value = v
         if self._supplyDefault:
@@ -0,0 +1,214 @@
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+"""
+Opens the SQLite databases of plugins, and shares them between the threads of
+the bot: each thread gets its own connection to a database, configured by
+supybot.databases.sqlite, and only the most recently used databases are kept
+open.
+"""
+
+import sqlite3
+import weakref
+import threading
+import contextlib
+
+from . import conf, plugins
+
+class Connection(sqlite3.Connection):
+    """A connection to an SQLite database, opened by :class:`Database`.
+    Plugins can subclass it to add attributes to their connections."""
+    filename = None
+    thread = None
+
+
+class Database(object):
+    """An SQLite database, with a connection for each thread using it.
+
+    `setup` is called with each new connection, to create the tables
+    if they do not exist yet, register functions, etc.; connections are
+    instances of `factory`."""
+    def __init__(self, filename, setup=None, factory=Connection):
+        assert issubclass(factory, Connection), factory
+        self.filename = filename
+        self._setup = setup
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()
+
+    def __repr__(self):
+        return 'Database(%r)' % self.filename
+
+    def connect(self):
+        """Returns the connection of the current thread to the database,
+        opening it if needed."""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._connect()
+            self._local.db = db
+        return db
+
+    def _connect(self):
+        sqlite = conf.supybot.databases.sqlite
+        # Only the current thread uses the connection, but it may be closed
+        # by another one.
+        db = sqlite3.connect(self.filename, factory=self._factory,
+                             timeout=sqlite.timeout(),
+                             cached_statements=sqlite.cachedStatements(),
+                             check_same_thread=False)
+        try:
+            db.filename = self.filename
+            db.thread = threading.current_thread()
+            db.execute('PRAGMA journal_mode = %s' % sqlite.journalMode())
+            db.execute('PRAGMA synchronous = %s' % sqlite.synchronous())
+            # A negative value is a number of KiB instead of pages.
+            db.execute('PRAGMA cache_size = %i' % -sqlite.cacheSize())
+            db.execute('PRAGMA mmap_size = %i' % sqlite.mmapSize())
+            if self._setup is not None:
+                self._setup(db)
+        except Exception:
+            db.close()
+            raise
+        with self._lock:
+            self._connections.add(db)
+        return db
+
+    def execute(self, sql, parameters=()):
+        """Runs a statement with the connection of the current thread, and
+        returns the cursor."""
+        return self.connect().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.connect().executemany(sql, parameters)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Context manager running its block in a transaction of the
+        connection of the current thread (which it returns), committed at
+        the end of the block, or rolled back if it raises an exception.
+        Blocks nested in a transaction are part of it."""
+        db = self.connect()
+        if db.in_transaction:
+            yield db
+            return
+        # Takes the write lock now, instead of failing to upgrade a read lock
+        # if another thread writes in the meantime.
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.rollback()
+            raise
+        else:
+            db.commit()
+
+    def _release(self):
+        """Closes the connections of the current thread and of the threads
+        which are over, and forgets the others, which are closed once their
+        threads are done with them."""
+        with self._lock:
+            connections = list(self._connections)
+            self._local = threading.local()
+            self._connections = weakref.WeakSet()
+        current = threading.current_thread()
+        for db in connections:
+            if db.thread is current or not db.thread.is_alive():
+                db.close()
+
+    def close(self):
+        """Closes the connections of all threads.  They are opened again if
+        the database is used again."""
+        with self._lock:
+            connections = list(self._connections)
+            self._local = threading.local()
+            self._connections = weakref.WeakSet()
+        for db in connections:
+            db.close()
+
+
+def get(filename, setup=None, factory=Connection):
+    """Returns the :class:`Database` stored in `filename`, with the given
+    `setup` and `factory` if it was not open yet.
+
+    Databases are kept in :data:`supybot.plugins.channelDbCache`, with the
+    other databases of plugins, so only the
+    supybot.databases.plugins.maximumOpen most recently used ones are open;
+    callers should get their database again instead of keeping it."""
+    return plugins.channelDbCache.get(
+        (Database, filename), lambda: Database(filename, setup, factory),
+        Database._release)
+
+def connect(filename, setup=None, factory=Connection):
+    """Returns the connection of the current thread to the database stored in
+    `filename`; see :func:`get`."""
+    return get(filename, setup, factory).connect()
+
+def close(filename):
+    """Closes the database stored in `filename`, if it is open."""
+    database = plugins.channelDbCache.pop((Database, filename))
+    if database is not None:
+        database.close()
+
+
+class ChannelDatabases(object):
+    """The SQLite databases of a plugin, one for each channel (or set of
+    linked channels, see supybot.databases.plugins.channelSpecific), stored
+    in files named `filename` in the data directories of the channels."""
+    def __init__(self, filename, setup=None, factory=Connection):
+        self.filename = filename
+        self.setup = setup
+        self.factory = factory
+        self.filenames = set()
+
+    def makeFilename(self, channel):
+        return plugins.makeChannelFilename(self.filename, channel)
+
+    def get(self, channel):
+        """Returns the :class:`Database` of the channel."""
+        filename = self.makeFilename(channel)
+        self.filenames.add(filename)
+        return get(filename, self.setup, self.factory)
+
+    def connect(self, channel):
+        """Returns the connection of the current thread to the database of
+        the channel."""
+        return self.get(channel).connect()
+
+    def transaction(self, channel):
+        """See :meth:`Database.transaction`."""
+        return self.get(channel).transaction()
+
+    def close(self):
+        """Closes the databases of all channels."""
+        for filename in self.filenames:
+            close(filename)
+        self.filenames.clear()
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
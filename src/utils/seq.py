@@ -92,5 +92,53 @@ def dameraulevenshtein(seq1, seq2):
                 thisrow[y] = min(thisrow[y], twoago[y - 2] + 1)
     return thisrow[len(seq2) - 1]
 
+def unrestricteddameraulevenshtein(seq1, seq2):
+    """Calculate the unrestricted Damerau-Levenshtein distance between
+    sequences.
+
+    :func:`dameraulevenshtein` actually computes the optimal string
+    alignment distance, which never edits a substring more than once, so
+    elements can not be inserted between transposed ones.  This does not
+    have this restriction, which makes it a metric (it satisfies the triangle
+    inequality), at the cost of being slower.  It is never greater than
+    :func:`dameraulevenshtein`.
+
+    The elements of the sequences must be hashable.
+
+    >>> dameraulevenshtein('ca', 'abc')
+    3
+    >>> unrestricteddameraulevenshtein('ca', 'abc')
+    2
+    """
+    # This is the algorithm of Lowrance and Wagner.  rows[i+1][j+1] is the
+    # distance between seq1[:i] and seq2[:j], with a first row and column
+    # larger than any distance.
+    infinity = len(seq1) + len(seq2)
+    rows = [[infinity] * (len(seq2) + 2),
+            [infinity] + list(range(len(seq2) + 1))]
+    lastRows = {} # last row where each element of seq1 was seen
+    for (i, x) in enumerate(seq1, 1):
+        previous = rows[i]
+        row = [infinity, i] + [0] * len(seq2)
+        lastColumn = 0 # last column where x was seen in seq2
+        for (j, y) in enumerate(seq2, 1):
+            k = lastRows.get(y, 0)
+            l = lastColumn
+            if x == y:
+                cost = 0
+                lastColumn = j
+            else:
+                cost = 1
+            row[j + 1] = min(previous[j] + cost, # substitution
+                             row[j] + 1, # addition
+                             previous[j + 1] + 1, # deletion
+                             # transposition of seq1[k-1] and seq1[i-1],
+                             # with what was between them deleted, and
+                             # what is between seq2[l-1] and seq2[j-1] added.
+                             rows[k][l] + (i - k - 1) + 1 + (j - l - 1))
+        rows.append(row)
+        lastRows[x] = i
+    return rows[-1][-1]
+
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
 
@@ -339,37 +339,59 @@ def perlVariableSubstitute(vars, text):
 def splitBytes(word, size):
     # I'm going to hell for this function
     for i in range(4): # a character takes at most 4 bytes in UTF-8
-        try:
-            word[size-i:].decode()
-        except UnicodeDecodeError:
-            continue
+        if 0 <= size-i < len(word):
+            # Only continuation bytes look like 0b10xxxxxx; no need to
+            # decode the rest of the word to know we are not in the middle
+            # of a character.
+            if word[size-i] & 0xc0 == 0x80:
+                continue
         else:
-            return (word[0:size-i], word[size-i:])
+            try:
+                word[size-i:].decode()
+            except UnicodeDecodeError:
+                continue
+        return (word[0:size-i], word[size-i:])
     assert False, (word, size)
 
 
 class ByteTextWrapper(textwrap.TextWrapper):
+    def _iter_wrap_chunks(self, words):
+        width = self.width
+        line = []
+        lineSize = 0
+        for word in words:
+            word = word.encode()
+            while word:
+                if len(word) > width:
+                    (before, word) = splitBytes(word, width)
+                else:
+                    (before, word) = (word, b'')
+                if lineSize + len(before) <= width:
+                    line.append(before)
+                    lineSize += len(before)
+                else:
+                    yield b''.join(line).decode()
+                    line = [before]
+                    lineSize = len(before)
+        yield b''.join(line).decode()
+
     def _wrap_chunks(self, words):
-        words.reverse() # use it as a stack
-        words = [w.encode() for w in words]
-        lines = [b'']
-        while words:
-            word = words.pop(-1)
-            if len(word) > self.width:
-                (before, after) = splitBytes(word, self.width)
-                words.append(after)
-                word = before
-            if len(lines[-1]) + len(word) <= self.width:
-                lines[-1] += word
-            else:
-                lines.append(word)
-        return [l.decode() for l in lines]
+        return list(self._iter_wrap_chunks(words))
+
+    def iterWrap(self, text):
+        """Like wrap(), but returns an iterator, which wraps the text as
+        lines are needed."""
+        return self._iter_wrap_chunks(self._split_chunks(text))
 
 def byteTextWrap(text, size, break_on_hyphens=False):
     """Similar to textwrap.wrap(), but considers the size of strings (in bytes)
     instead of their length (in characters)."""
     return ByteTextWrapper(width=size).wrap(text)
 
+def iterByteTextWrap(text, size, break_on_hyphens=False):
+    """Like byteTextWrap(), but returns an iterator of lines."""
+    return ByteTextWrapper(width=size).iterWrap(text)
+
 def commaAndify(seq, comma=',', And=None):
     """Given a a sequence, returns an English clause for that sequence.
 
@@ -653,4 +653,103 @@ class TruncatableSet(collections.abc.MutableSet):
             self._ordered_items = self._ordered_items[-size:]
             self._items = set(self._ordered_items)
 
+
+class BKTree(object):
+    """A Burkhard-Keller tree, to find the items close to a given one without
+    computing the distance to all of them.
+
+    `distance` must be a metric on the items; in particular, it must satisfy
+    the triangle inequality, or searches may miss some items.  Removed items
+    are only marked as such until they outnumber the others, as the tree is
+    then rebuilt."""
+    __slots__ = ('_distance', '_root', '_size', '_removed')
+    def __init__(self, distance, iterable=()):
+        self._distance = distance
+        self._root = None
+        self._size = 0
+        self._removed = 0
+        for item in iterable:
+            self.add(item)
+
+    def __repr__(self):
+        return 'BKTree(%r, %r)' % (self._distance, list(self))
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        # Nodes are [item, present, {distance: child}] lists.
+        nodes = [self._root] if self._root else []
+        while nodes:
+            (item, present, children) = nodes.pop()
+            if present:
+                yield item
+            nodes.extend(children.values())
+
+    def _find(self, item):
+        node = self._root
+        while node is not None:
+            distance = self._distance(item, node[0])
+            if distance == 0:
+                return node
+            node = node[2].get(distance)
+        return None
+
+    def __contains__(self, item):
+        node = self._find(item)
+        return node is not None and node[1]
+
+    def add(self, item):
+        if self._root is None:
+            self._root = [item, True, {}]
+            self._size += 1
+            return
+        node = self._root
+        while True:
+            distance = self._distance(item, node[0])
+            if distance == 0:
+                if not node[1]:
+                    node[1] = True
+                    self._size += 1
+                    self._removed -= 1
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [item, True, {}]
+                self._size += 1
+                return
+            node = child
+
+    def discard(self, item):
+        node = self._find(item)
+        if node is None or not node[1]:
+            return
+        node[1] = False
+        self._size -= 1
+        self._removed += 1
+        if self._removed > self._size:
+            items = list(self)
+            self._root = None
+            self._size = self._removed = 0
+            for item in items:
+                self.add(item)
+
+    def search(self, item, radius):
+        """Returns a list of (distance, item) pairs, for the items at most
+        `radius` away from `item`, in no particular order."""
+        results = []
+        nodes = [self._root] if self._root else []
+        while nodes:
+            (other, present, children) = nodes.pop()
+            distance = self._distance(item, other)
+            if present and distance <= radius:
+                results.append((distance, other))
+            # By the triangle inequality, the items under a child at
+            # childDistance of this node are at least
+            # |distance - childDistance| away from the one we look for.
+            for (childDistance, child) in children.items():
+                if distance - radius <= childDistance <= distance + radius:
+                    nodes.append(child)
+        return results
+
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
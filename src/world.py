@@ -91,15 +91,68 @@ class SupyProcess(SUPYPROCESS_MULTIPROCESSING_CONTEXT.Process):
 
 commandsProcessed = 0
 
-ircs = [] # A list of all the IRCs.
+class IrcList(list):
+    """A list of Irc objects, which also indexes them by network name, so
+    :py:func:`getIrc` does not have to go through the list."""
+    __slots__ = ('networks',)
+    def __init__(self, *args, **kwargs):
+        super(IrcList, self).__init__(*args, **kwargs)
+        self._reindex()
+
+    def _reindex(self):
+        networks = {}
+        for irc in reversed(self): # The first one wins
+            networks[irc.network.lower()] = irc
+        self.networks = networks
+
+def _reindexing(name):
+    method = getattr(list, name)
+    def newf(self, *args, **kwargs):
+        ret = method(self, *args, **kwargs)
+        self._reindex()
+        return ret
+    newf.__name__ = name
+    return newf
+
+for name in ('append', 'extend', 'insert', 'remove', 'pop', 'clear',
+             'sort', 'reverse', '__setitem__', '__delitem__', '__iadd__'):
+    setattr(IrcList, name, _reindexing(name))
+del name
+
+ircs = IrcList() # A list of all the IRCs.
 
 def getIrc(network):
     """Returns Irc object of the given network. <network> is string and not case-sensitive."""
-    network = network.lower()
-    for irc in ircs:
-        if irc.network.lower() == network:
-            return irc
-    return None
+    return ircs.networks.get(network.lower())
+
+# {channel: {irc: None}} for all the channels the bot is in, on any network.
+# Maintained by IrcState; use getIrcsInChannel() to read it.
+ircsByChannel = ircutils.IrcDict()
+
+def _addIrcToChannel(irc, channel):
+    ircsByChannel.setdefault(channel, {})[irc] = None
+
+def _removeIrcFromChannel(irc, channel):
+    channelIrcs = ircsByChannel.get(channel)
+    if channelIrcs is not None:
+        channelIrcs.pop(irc, None)
+        if not channelIrcs:
+            del ircsByChannel[channel]
+
+def _removeIrcFromChannels(irc):
+    for channel in list(ircsByChannel):
+        _removeIrcFromChannel(irc, channel)
+
+def getIrcsInChannel(channel):
+    """Returns the list of Irc objects of the networks where the bot is in
+    <channel>, in the order the bot joined it.  <channel> is not
+    case-sensitive."""
+    channelIrcs = ircsByChannel.get(channel)
+    if not channelIrcs:
+        return []
+    # The state of a network may have been changed without telling us (eg.
+    # in tests), so better be safe than sorry.
+    return [irc for irc in channelIrcs if channel in irc.state.channels]
 
 def _flushUserData():
     userdataFilename = os.path.join(conf.supybot.directories.conf(),
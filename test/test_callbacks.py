@@ -33,6 +33,7 @@ from supybot.test import *
 
 import supybot.conf as conf
 import supybot.utils as utils
+import supybot.registry as registry
 import supybot.ircmsgs as ircmsgs
 import supybot.utils.minisix as minisix
 import supybot.callbacks as callbacks
@@ -161,6 +162,75 @@ def testUnicode(self):
         s = s[:-1] + '\x0f'
         self.assertEqual(tokenize(s), [s])
 
+    def testCachedResultsAreCopies(self):
+        tokens = tokenize('foo [bar baz] qux')
+        tokens[1].append('quux')
+        tokens.append('corge')
+        self.assertEqual(tokenize('foo [bar baz] qux'),
+                         ['foo', ['bar', 'baz'], 'qux'])
+
+
+class ShlexTokenizer(callbacks.Tokenizer):
+    """The Tokenizer as it was before it got its own lexer, used as
+    a reference."""
+    def _getTokenFunction(self, s):
+        import supybot.shlex as shlex
+        lexer = shlex.shlex(minisix.io.StringIO(s))
+        lexer.commenters = ''
+        lexer.quotes = self.quotes
+        lexer.separators = self.separators
+        return lexer.get_token
+
+
+class TokenizerDifferentialTestCase(SupyTestCase):
+    corpus = [
+        '', ' ', 'foo', 'foo bar', ' foo  bar ', 'foo\tbar\r\nbaz',
+        '"foo bar"', '"foo', 'foo"', 'foo"bar"baz', 'a "b c" d',
+        '"\\""', '"\\\\"', '"\\"foo\\""', '"a \\" b"', '"\\x80"',
+        '"\\x"', '"\\n"', '"\\u00e9"', '"\\"', '"好"', '好 "好"',
+        '"\ud800"', '\x00', 'foo\x00bar', '"\x00"',
+        '[foo]', 'foo [bar baz] qux', '[[foo] bar]', '[foo', 'foo]',
+        '{foo}', 'foo {bar [baz]}', '"[foo]"', 'foo[bar]baz',
+        'foo | bar', 'foo|bar', '| foo', 'foo |', 'a | b | c', '"|"',
+        'foo [bar | baz]', "'foo bar'", "it's", "'a \"b\" c'",
+        '"a \'b\' c"', "'\\''",
+    ]
+    configurations = [(brackets, pipe, quotes)
+                      for brackets in ('', '[]', '{}')
+                      for pipe in (False, True)
+                      for quotes in ('"', '"\'')]
+
+    def tokenizeWith(self, cls, s, brackets, pipe, quotes):
+        try:
+            return cls(brackets=brackets, pipe=pipe, quotes=quotes) \
+                .tokenize(s)
+        except (SyntaxError, ValueError, UnicodeError) as e:
+            return (type(e), str(e))
+
+    def assertSameTokens(self, s):
+        for (brackets, pipe, quotes) in self.configurations:
+            expected = self.tokenizeWith(ShlexTokenizer, s,
+                                         brackets, pipe, quotes)
+            self.assertEqual(
+                self.tokenizeWith(callbacks.Tokenizer, s,
+                                  brackets, pipe, quotes),
+                expected,
+                '%r with brackets=%r, pipe=%r, quotes=%r' %
+                (s, brackets, pipe, quotes))
+
+    def testCorpus(self):
+        for s in self.corpus:
+            self.assertSameTokens(s)
+
+    def testRandomStrings(self):
+        import random
+        rng = random.Random(42)
+        alphabet = 'ab  \t"\'\\[]{}|\x00é'
+        for _ in range(2000):
+            length = rng.randint(1, 12)
+            self.assertSameTokens(
+                ''.join(rng.choice(alphabet) for _ in range(length)))
+
 
 class FunctionsTestCase(SupyTestCase):
     def testCanonicalName(self):
@@ -288,6 +358,52 @@ class FunctionsTestCase(SupyTestCase):
                                              prefixChars='@'),
                          'echo foo')
 
+    def testAddressedConfigurationChanges(self):
+        irc = getTestIrc()
+        chars = conf.supybot.reply.whenAddressedBy.chars
+        def addressed(channel, s):
+            msg = ircmsgs.privmsg(channel, s)
+            irc._tagMsg(msg)
+            return callbacks.addressed(irc, msg)
+        with chars.context('@'):
+            self.assertEqual(addressed('#foo', '@echo foo'), 'echo foo')
+            self.assertEqual(addressed('#foo', '!echo foo'), '')
+            with chars.get('#foo').context('!'):
+                self.assertEqual(addressed('#foo', '@echo foo'), '')
+                self.assertEqual(addressed('#foo', '!echo foo'), 'echo foo')
+                self.assertEqual(addressed('#bar', '@echo foo'), 'echo foo')
+            self.assertEqual(addressed('#foo', '@echo foo'), 'echo foo')
+            self.assertEqual(addressed('#foo', '!echo foo'), '')
+            nicks = conf.supybot.reply.whenAddressedBy.nicks
+            with nicks.context(['Biff']):
+                self.assertEqual(addressed('#foo', 'biff: echo foo'),
+                                 'echo foo')
+            self.assertEqual(addressed('#foo', 'biff: echo foo'), '')
+
+    def testAddressedConfigurationReload(self):
+        irc = getTestIrc()
+        chars = conf.supybot.reply.whenAddressedBy.chars
+        def addressed(s):
+            msg = ircmsgs.privmsg('#reload', s)
+            irc._tagMsg(msg)
+            return callbacks.addressed(irc, msg)
+        filename = conf.supybot.directories.conf.dirize(
+            'Callbacks_testReload.conf')
+        with chars.context('@'):
+            self.assertEqual(addressed('!echo foo'), '')
+            with open(filename, 'w') as fd:
+                fd.write('supybot.reply.whenAddressedBy.chars: !\n')
+            lastModified = registry._lastModified
+            try:
+                registry.open_registry(filename)
+                self.assertEqual(addressed('!echo foo'), 'echo foo')
+            finally:
+                # Or the other values would be set again from the registry
+                # file loaded by the tests.
+                del registry._cache['supybot.reply.whenAddressedBy.chars']
+                registry._lastModified = lastModified
+                os.remove(filename)
+
     def testReply(self):
         irc = getTestIrc()
         prefix = 'foo!bar@baz'
@@ -1173,6 +1289,105 @@ class SourceNestedPluginTestCase(PluginTestCase):
         self.assertResponse('e same', 'same')
 
 
+class CommandIndexTestCase(PluginTestCase):
+    plugins = ('Utilities',)
+    class Static(callbacks.Plugin):
+        def foo(self, irc, msg, args):
+            irc.reply('static foo')
+
+        class sub(callbacks.Commands):
+            def bar(self, irc, msg, args):
+                irc.reply('static sub bar')
+
+    class Indexed(callbacks.Plugin):
+        indexCommands = True
+        def __init__(self, irc):
+            self.__parent = super(CommandIndexTestCase.Indexed, self)
+            self.__parent.__init__(irc)
+            self.names = set()
+
+        def isCommandMethod(self, name):
+            return name in map(callbacks.canonicalName, self.names) or \
+                self.__parent.isCommandMethod(name)
+
+        def listCommands(self):
+            return self.__parent.listCommands(self.names)
+
+        def getCommandMethod(self, command):
+            try:
+                return self.__parent.getCommandMethod(command)
+            except AttributeError:
+                return lambda irc, msg, args: irc.reply(command[0])
+
+    class Unindexed(callbacks.Plugin):
+        def isCommandMethod(self, name):
+            return name == 'dyn' or \
+                super(CommandIndexTestCase.Unindexed, self) \
+                .isCommandMethod(name)
+
+        def getCommandMethod(self, command):
+            return lambda irc, msg, args: irc.reply('dynamic')
+
+    def find(self, args):
+        return [(cb.name(), L) for (cb, L)
+                in callbacks.commandIndex.find(self.irc.callbacks, args)]
+
+    def testStatic(self):
+        self.irc.addCallback(self.Static(self.irc))
+        self.assertEqual(self.find(['foo', 'baz']), [('Static', ['foo'])])
+        self.assertEqual(self.find(['static', 'foo']),
+                         [('Static', ['static', 'foo'])])
+        self.assertEqual(self.find(['sub', 'bar']),
+                         [('Static', ['sub', 'bar'])])
+        self.assertEqual(self.find(['static', 'sub', 'bar']),
+                         [('Static', ['static', 'sub', 'bar'])])
+        self.assertEqual(self.find(['sub']), [])
+        self.assertEqual(self.find(['echo', 'foo']),
+                         [('Utilities', ['echo'])])
+        self.assertResponse('foo', 'static foo')
+        self.assertResponse('static sub bar', 'static sub bar')
+
+    def testLoadUnload(self):
+        self.assertEqual(self.find(['foo']), [])
+        self.irc.addCallback(self.Static(self.irc))
+        self.assertEqual(self.find(['foo']), [('Static', ['foo'])])
+        self.irc.removeCallback('Static')
+        self.assertEqual(self.find(['foo']), [])
+
+    def testDisabled(self):
+        self.irc.addCallback(self.Static(self.irc))
+        callbacks.Plugin._disabled.add('foo', 'Static')
+        try:
+            self.assertEqual(self.find(['foo']), [])
+        finally:
+            callbacks.Plugin._disabled.remove('foo', 'Static')
+        self.assertEqual(self.find(['foo']), [('Static', ['foo'])])
+
+    def testCommandsChanged(self):
+        cb = self.Indexed(self.irc)
+        self.irc.addCallback(cb)
+        self.assertEqual(self.find(['qux']), [])
+        cb.names.add('qux')
+        cb.commandsChanged()
+        self.assertEqual(self.find(['qux']), [('Indexed', ['qux'])])
+        self.assertResponse('qux', 'qux')
+
+    def testCommandsNotCanonical(self):
+        cb = self.Indexed(self.irc)
+        self.irc.addCallback(cb)
+        cb.names.add('My-Feed')
+        cb.commandsChanged()
+        self.assertEqual(self.find(['myfeed']), [('Indexed', ['myfeed'])])
+        self.assertEqual(self.find(['indexed', 'myfeed']),
+                         [('Indexed', ['indexed', 'myfeed'])])
+        self.assertResponse('My-Feed', 'myfeed')
+
+    def testUnindexed(self):
+        self.irc.addCallback(self.Unindexed(self.irc))
+        self.assertEqual(self.find(['dyn']), [('Unindexed', ['dyn'])])
+        self.assertResponse('dyn', 'dynamic')
+
+
 class WithPrivateNoticeTestCase(ChannelPluginTestCase):
     plugins = ('Utilities',)
     class WithPrivateNotice(callbacks.Plugin):
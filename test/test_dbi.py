@@ -0,0 +1,130 @@
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+from supybot.test import *
+
+import os
+
+import supybot.dbi as dbi
+
+class FlatfileMappingTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.filename = os.path.join(conf.supybot.directories.data.tmp(),
+                                     'test_dbi.flat')
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        SupyTestCase.tearDown(self)
+
+    def testAddGet(self):
+        map = dbi.FlatfileMapping(self.filename)
+        self.assertEqual(map.add('foo'), 1)
+        self.assertEqual(map.add('bar:baz'), 2)
+        self.assertEqual(map.get(1), 'foo')
+        self.assertEqual(map.get(2), 'bar:baz')
+        self.assertRaises(dbi.NoRecordError, map.get, 3)
+        self.assertEqual(len(map), 2)
+
+    def testSetRemove(self):
+        map = dbi.FlatfileMapping(self.filename)
+        for s in ['foo', 'bar', 'baz']:
+            map.add(s)
+        map.set(2, 'qux')
+        self.assertEqual(map.get(2), 'qux')
+        map.remove(1)
+        self.assertRaises(dbi.NoRecordError, map.get, 1)
+        map.remove(1) # Removing twice is not an error
+        self.assertEqual(len(map), 2)
+        self.assertEqual(sorted(map), [(2, 'qux'), (3, 'baz')])
+
+    def testUnicode(self):
+        map = dbi.FlatfileMapping(self.filename)
+        map.add('é€')
+        map.add('foo')
+        map.set(1, 'ü')
+        self.assertEqual(map.get(1), 'ü')
+        self.assertEqual(map.get(2), 'foo')
+
+    def testReopen(self):
+        map = dbi.FlatfileMapping(self.filename)
+        for s in ['foo', 'bar', 'baz']:
+            map.add(s)
+        map.remove(2)
+        map.set(1, 'qux')
+        map = dbi.FlatfileMapping(self.filename)
+        self.assertEqual(len(map), 2)
+        self.assertEqual(map.get(1), 'qux')
+        self.assertEqual(map.get(3), 'baz')
+        self.assertRaises(dbi.NoRecordError, map.get, 2)
+        self.assertEqual(map.add('quux'), 4)
+
+    def testFileFormat(self):
+        map = dbi.FlatfileMapping(self.filename)
+        map.add('foo')
+        map.add('bar')
+        map.remove(1)
+        with open(self.filename) as fd:
+            self.assertEqual(fd.read(), '000003\n------:foo\n000002:bar\n')
+        map.vacuum()
+        with open(self.filename) as fd:
+            self.assertEqual(fd.read(), '000003\n000002:bar\n')
+        self.assertEqual(map.get(2), 'bar')
+        map.set(2, 'baz')
+        self.assertEqual(map.get(2), 'baz')
+
+    def testRandom(self):
+        map = dbi.FlatfileMapping(self.filename)
+        self.assertRaises(IndexError, map.random)
+        for s in ['foo', 'bar', 'baz']:
+            map.add(s)
+        map.remove(2)
+        for _ in range(20):
+            self.assertIn(map.random(), [(1, 'foo'), (3, 'baz')])
+
+    def testReversed(self):
+        map = dbi.FlatfileMapping(self.filename)
+        for s in ['foo', 'bar', 'baz']:
+            map.add(s)
+        map.set(1, 'qux')
+        map.remove(2)
+        self.assertEqual(list(reversed(map)), [(1, 'qux'), (3, 'baz')])
+        self.assertEqual(map.tombstones(), 2)
+        map = dbi.FlatfileMapping(self.filename)
+        self.assertEqual(list(reversed(map)), [(1, 'qux'), (3, 'baz')])
+        map.vacuum()
+        self.assertEqual(map.tombstones(), 0)
+        self.assertEqual(list(reversed(map)), [(1, 'qux'), (3, 'baz')])
+        self.assertEqual(list(reversed(map)), list(reversed(list(map))))
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
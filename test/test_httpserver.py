@@ -0,0 +1,168 @@
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+from supybot.test import *
+
+import threading
+import http.client
+
+import supybot.httpserver as httpserver
+
+class LengthCallback(httpserver.SupyHTTPServerCallback):
+    name = 'length'
+    def doGet(self, handler, path):
+        response = path.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', len(response))
+        self.end_headers()
+        self.wfile.write(response)
+
+class NoLengthCallback(httpserver.SupyHTTPServerCallback):
+    name = 'nolength'
+    def doGet(self, handler, path):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'no length')
+
+class StreamCallback(httpserver.SupyHTTPServerCallback):
+    name = 'stream'
+    streamBufferSize = 10
+    def doGet(self, handler, path):
+        self.writeStream(handler, 200, {'Content-Type': 'text/plain'},
+                         ('line %i\n' % i for i in range(100)))
+
+class BlockingCallback(httpserver.SupyHTTPServerCallback):
+    name = 'blocking'
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.unblock = threading.Event()
+    def doGet(self, handler, path):
+        self.started.set()
+        self.unblock.wait(10)
+        self.send_response(200)
+        self.send_header('Content-Length', 0)
+        self.end_headers()
+
+class RealHTTPServerTestCase(SupyTestCase):
+    workers = 2
+
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        with conf.supybot.servers.http.workers.context(self.workers):
+            self.server = httpserver.RealSupyHTTPServer(
+                ('127.0.0.1', 0), 4, httpserver.SupyHTTPRequestHandler)
+        self.blocking = BlockingCallback()
+        self.server.hook('length', LengthCallback())
+        self.server.hook('nolength', NoLengthCallback())
+        self.server.hook('stream', StreamCallback())
+        self.server.hook('blocking', self.blocking)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.blocking.unblock.set()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        SupyTestCase.tearDown(self)
+
+    def connect(self):
+        return http.client.HTTPConnection(*self.server.server_address,
+                                          timeout=10)
+
+    def testKeepAlive(self):
+        conn = self.connect()
+        conn.request('GET', '/length/foo')
+        response = conn.getresponse()
+        self.assertEqual(response.read(), b'/foo')
+        self.assertFalse(response.will_close)
+        sock = conn.sock
+        conn.request('GET', '/length/bar')
+        self.assertEqual(conn.getresponse().read(), b'/bar')
+        self.assertIs(conn.sock, sock)
+        conn.close()
+
+    def testCloseWithoutLength(self):
+        conn = self.connect()
+        conn.request('GET', '/nolength/')
+        response = conn.getresponse()
+        self.assertTrue(response.will_close)
+        self.assertEqual(response.read(), b'no length')
+        conn.close()
+
+    def testStream(self):
+        conn = self.connect()
+        conn.request('GET', '/stream/')
+        response = conn.getresponse()
+        self.assertEqual(response.getheader('Transfer-Encoding'), 'chunked')
+        self.assertEqual(response.read().decode(),
+                         ''.join('line %i\n' % i for i in range(100)))
+        conn.request('GET', '/length/baz')
+        self.assertEqual(conn.getresponse().read(), b'/baz')
+        conn.close()
+
+    def testConcurrent(self):
+        blocked = self.connect()
+        blocked.request('GET', '/blocking/')
+        self.assertTrue(self.blocking.started.wait(10))
+        conn = self.connect()
+        conn.request('GET', '/length/qux')
+        self.assertEqual(conn.getresponse().read(), b'/qux')
+        conn.close()
+        self.blocking.unblock.set()
+        self.assertEqual(blocked.getresponse().status, 200)
+        blocked.close()
+
+class SingleThreadedHTTPServerTestCase(RealHTTPServerTestCase):
+    workers = 0
+
+    def testKeepAlive(self):
+        conn = self.connect()
+        conn.request('GET', '/length/foo')
+        response = conn.getresponse()
+        self.assertTrue(response.will_close)
+        self.assertEqual(response.read(), b'/foo')
+        conn.close()
+
+    def testStream(self):
+        conn = self.connect()
+        conn.request('GET', '/stream/')
+        response = conn.getresponse()
+        self.assertEqual(response.getheader('Transfer-Encoding'), None)
+        self.assertEqual(response.read().decode(),
+                         ''.join('line %i\n' % i for i in range(100)))
+        conn.close()
+
+    def testConcurrent(self):
+        # Requests are handled one after the other in this mode.
+        pass
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
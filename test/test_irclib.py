@@ -275,6 +275,34 @@ class IrcMsgQueueTestCase(SupyTestCase):
         finally:
             configVar.setValue(original)
 
+    def testIdenticalsAfterDequeue(self):
+        with conf.supybot.protocols.irc.queuing.duplicates.context(True):
+            q = irclib.IrcMsgQueue()
+            self.assertTrue(q.enqueue(self.msg))
+            self.assertFalse(q.enqueue(self.msg))
+            self.assertEqual(self.msg, q.dequeue())
+            self.assertNotIn(self.msg, q)
+            self.assertTrue(q.enqueue(self.msg))
+            self.assertIn(self.msg, q)
+            self.assertEqual(len(q), 1)
+            q.reset()
+            self.assertNotIn(self.msg, q)
+
+    def testJoinRateLimit(self):
+        with conf.supybot.protocols.irc.queuing.rateLimit.join.context(10):
+            q = irclib.IrcMsgQueue()
+            join2 = ircmsgs.join('#bar')
+            q.enqueue(self.join)
+            q.enqueue(join2)
+            self.assertEqual(self.join, q.dequeue())
+            # Rate-limited; the join is moved to the end of the queue
+            self.assertIsNone(q.dequeue())
+            self.assertIn(join2, q)
+            self.assertEqual(len(q), 1)
+            q.lastJoin -= 10
+            self.assertEqual(join2, q.dequeue())
+            self.assertFalse(q)
+
     def testJoinBeforeWho(self):
         q = irclib.IrcMsgQueue()
         q.enqueue(self.join)
@@ -305,6 +333,66 @@ class IrcMsgQueueTestCase(SupyTestCase):
         self.assertEqual(self.msg, q.dequeue())
 
 
+class FairMsgQueueTestCase(SupyTestCase):
+    def testAlternatesTargets(self):
+        q = irclib.FairMsgQueue()
+        foo = [ircmsgs.privmsg('#foo', str(i)) for i in range(3)]
+        bar = [ircmsgs.privmsg('#bar', str(i)) for i in range(2)]
+        nick = ircmsgs.privmsg('nick', 'hi')
+        for msg in foo + bar + [nick]:
+            q.enqueue(msg)
+        self.assertEqual(len(q), 6)
+        self.assertEqual([q.dequeue() for i in range(6)],
+                         [foo[0], bar[0], nick, foo[1], bar[1], foo[2]])
+        self.assertFalse(q)
+
+    def testPriorities(self):
+        q = irclib.FairMsgQueue()
+        msg = ircmsgs.privmsg('#foo', 'hi')
+        topic = ircmsgs.topic('#foo', 'hi')
+        mode = ircmsgs.op('#foo', 'nick')
+        q.enqueue(msg)
+        q.enqueue(topic)
+        q.enqueue(mode)
+        self.assertIn(msg, q)
+        self.assertEqual([q.dequeue() for i in range(3)], [mode, topic, msg])
+        self.assertNotIn(msg, q)
+
+    def testWeight(self):
+        weight = conf.supybot.protocols.irc.queuing.weight
+        with weight.getSpecific('test', '#foo').context(2):
+            q = irclib.FairMsgQueue(network='test')
+            foo = [ircmsgs.privmsg('#foo', str(i)) for i in range(4)]
+            bar = [ircmsgs.privmsg('#Bar', str(i)) for i in range(2)]
+            for msg in foo + bar:
+                q.enqueue(msg)
+            self.assertEqual([q.dequeue() for i in range(6)],
+                             [foo[0], foo[1], bar[0], foo[2], foo[3], bar[1]])
+
+    def testJoinRateLimit(self):
+        with conf.supybot.protocols.irc.queuing.rateLimit.join.context(10):
+            q = irclib.FairMsgQueue()
+            q.enqueue(ircmsgs.join('#foo'))
+            q.enqueue(ircmsgs.join('#bar'))
+            self.assertEqual(q.dequeue(), ircmsgs.join('#foo'))
+            self.assertIsNone(q.dequeue())
+            self.assertEqual(len(q), 1)
+            q.lastJoin -= 10
+            self.assertEqual(q.dequeue(), ircmsgs.join('#bar'))
+
+    def testStats(self):
+        q = irclib.FairMsgQueue()
+        q.enqueue(ircmsgs.privmsg('#foo', 'a'))
+        q.enqueue(ircmsgs.privmsg('#foo', 'b'))
+        q.enqueue(ircmsgs.notice('nick', 'c'))
+        q.dequeue()
+        stats = q.stats()
+        self.assertEqual(stats['#FOO'][0:2], (1, 1))
+        self.assertEqual(stats['nick'][0:2], (1, 0))
+        self.assertGreaterEqual(stats['#foo'][2], 0)
+        self.assertEqual(stats['nick'][2:], (0, 0))
+
+
 class ChannelStateTestCase(SupyTestCase):
     def testPickleCopy(self):
         c = irclib.ChannelState()
@@ -347,6 +435,63 @@ class ChannelStateTestCase(SupyTestCase):
         self.assertNotIn('quuz', c.halfops)
         self.assertNotIn('quuz', c.voices)
 
+    def testMembers(self):
+        c = irclib.ChannelState()
+        c.addUser('@Foo')
+        c.addUser('+%bar')
+        c.ops.add('baz')
+        self.assertEqual(c.members, {'foo': c.USER | c.OP,
+                                     'bar': c.USER | c.HALFOP | c.VOICE,
+                                     'baz': c.OP})
+        self.assertEqual(len(c.users), 2)
+        self.assertEqual(len(c.ops), 2)
+        self.assertEqual(sorted(c.users), ['Foo', 'bar'])
+        self.assertEqual(sorted(c.users | set(['qux'])), ['Foo', 'bar', 'qux'])
+        self.assertIn('FOO', c.users & set(['foo']))
+        self.assertTrue(c.isVoicePlus('baz'))
+        self.assertFalse(c.isVoicePlus('qux'))
+
+        c.ops.discard('baz')
+        self.assertNotIn('baz', c.members)
+        c.voices.remove('BAR')
+        self.assertRaises(KeyError, c.voices.remove, 'bar')
+        c.replaceUser('bar', 'Qux')
+        self.assertEqual(c.members['qux'], c.USER | c.HALFOP)
+        self.assertNotIn('bar', c.members)
+        c.removeUser('foo')
+        self.assertEqual(list(c.users), ['Qux'])
+        self.assertEqual(list(c.ops), [])
+
+    def testMemberCounts(self):
+        def assertCounts(c):
+            for s in (c.users, c.ops, c.halfops, c.voices):
+                self.assertEqual(len(s), len(list(s)))
+        c = irclib.ChannelState(casemapping='ascii')
+        c.addUser('@Foo')
+        c.addUser('@foo')
+        c.addUser('+%bar')
+        c.ops.add('baz')
+        c.voices.add('foo')
+        assertCounts(c)
+        c.replaceUser('bar', 'Baz')
+        c.voices.discard('qux')
+        c.halfops.discard('foo')
+        assertCounts(c)
+        c = pickle.loads(pickle.dumps(c))
+        assertCounts(c)
+        c.removeUser('baz')
+        c.addUser('[foo]')
+        c.addUser('{foo}')
+        assertCounts(c)
+        c.setCasemapping('rfc1459')
+        assertCounts(c)
+        self.assertEqual(len(c.users), 2)
+        c.removeUser('foo')
+        c.removeUser('{FOO}')
+        assertCounts(c)
+        self.assertEqual(c.members, {})
+
+
 
 class IrcStateTestCase(SupyTestCase):
     class FakeIrc:
@@ -384,6 +529,101 @@ class IrcStateTestCase(SupyTestCase):
         self.assertIn('baz', st.channels['#foo'].users)
         self.assertTrue(st.channels['#foo'].isOp('baz'))
 
+    def testNicksToChannels(self):
+        st = irclib.IrcState()
+        st.addMsg(self.irc, ircmsgs.join('#foo', prefix=self.irc.prefix))
+        st.addMsg(self.irc, ircmsgs.join('#bar', prefix=self.irc.prefix))
+        st.addMsg(self.irc, ircmsgs.IrcMsg(
+            ':example.org 353 nick = #foo :nick @bar Baz'))
+        st.addMsg(self.irc, ircmsgs.join('#bar', prefix='baz!u@h'))
+        st.addMsg(self.irc, ircmsgs.join('#bar', prefix='qux!u@h'))
+        self.assertEqual(st.channels.getNickChannels('BAZ'),
+                         set(['#foo', '#bar']))
+        self.assertEqual(st.channels.getNickChannels('bar'), set(['#foo']))
+        self.assertEqual(st.channels.getNickChannels('nobody'), set())
+
+        m = ircmsgs.IrcMsg(':baz!u@h NICK :Baz2')
+        st.addMsg(self.irc, m)
+        self.assertEqual(m.tagged('channels'), set(['#foo', '#bar']))
+        self.assertEqual(st.channels.getNickChannels('baz'), set())
+        self.assertEqual(st.channels.getNickChannels('baz2'),
+                         set(['#foo', '#bar']))
+        self.assertIn('Baz2', st.channels['#foo'].users)
+
+        st.addMsg(self.irc, ircmsgs.part('#foo', prefix='baz2!u@h'))
+        self.assertEqual(st.channels.getNickChannels('baz2'), set(['#bar']))
+        st.addMsg(self.irc, ircmsgs.kick('#bar', 'qux', prefix='bar!u@h'))
+        self.assertEqual(st.channels.getNickChannels('qux'), set())
+        self.assertEqual(st.channels.nicks.get('qux').channels, ())
+
+        m = ircmsgs.IrcMsg(':baz2!u@h QUIT :Ping timeout')
+        st.addMsg(self.irc, m)
+        self.assertEqual(m.tagged('channels'), set(['#bar']))
+        self.assertNotIn('baz2', st.channels['#bar'].users)
+        self.assertIsNone(st.channels.nicks.get('baz2'))
+
+        # The bot leaving a channel removes it from the index.
+        st.addMsg(self.irc, ircmsgs.part('#foo', prefix=self.irc.prefix))
+        self.assertEqual(st.channels.getNickChannels('bar'), set())
+        self.assertEqual(st.channels.getNickChannels('nick'), set(['#bar']))
+
+        st2 = st.copy()
+        self.assertEqual(st2.channels.getNickChannels('nick'),
+                         set(['#bar']))
+        st2.addMsg(self.irc, ircmsgs.join('#bar', prefix='bar!u@h'))
+        self.assertEqual(st2.channels.getNickChannels('bar'), set(['#bar']))
+        self.assertEqual(st.channels.getNickChannels('bar'), set())
+
+        st.addMsg(self.irc, ircmsgs.IrcMsg(':example.org 005 nick CASEMAPPING=ascii :are supported by this server'))
+        self.assertEqual(st.channels.getNickChannels('NICK'), set(['#bar']))
+
+        st.reset()
+        self.assertEqual(st.channels.getNickChannels('nick'), set())
+
+    def testNickRecords(self):
+        st = irclib.IrcState()
+        st.addMsg(self.irc, ircmsgs.join('#foo', prefix=self.irc.prefix))
+        st.addMsg(self.irc, ircmsgs.join('#bar', prefix=self.irc.prefix))
+        st.addMsg(self.irc, ircmsgs.join('#foo', prefix='Baz!u@h'))
+        st.addMsg(self.irc, ircmsgs.join('#bar', prefix='baz!u@h2'))
+
+        # A single record and nick object, shared by both channels
+        record = st.channels.nicks.get('BAZ')
+        self.assertEqual(record.hostmask, 'baz!u@h2')
+        self.assertEqual(record.channels, ('#foo', '#bar'))
+        [nick] = [n for n in st.channels['#foo'].members if n == 'baz']
+        [nick2] = [n for n in st.channels['#bar'].members if n == 'baz']
+        self.assertIs(nick, nick2)
+
+        self.assertEqual(st.nicksToHostmasks['BAZ'], 'baz!u@h2')
+        self.assertEqual(st.nicksToHostmasks.keys(), ['nick', 'Baz'])
+        self.assertNotIn('baz', st.nicksToAccounts)
+        st.nicksToAccounts['baz'] = None
+        self.assertIsNone(st.nickToAccount('BAZ'))
+        self.assertEqual(st.nicksToAccounts, {'BAZ': None})
+
+        d = copy.deepcopy(st.nicksToHostmasks)
+        self.assertIsInstance(d, ircutils.IrcDict)
+        self.assertEqual(d['BAZ'], 'baz!u@h2')
+        self.assertEqual(st.nicksToHostmasks, d)
+        st2 = st.copy()
+        self.assertEqual(st2.nicksToHostmasks, d)
+        self.assertEqual(st2.nicksToAccounts, {'baz': None})
+        self.assertEqual(st2, st)
+        st3 = pickle.loads(pickle.dumps(st))
+        self.assertEqual(st3.nicksToHostmasks, d)
+        self.assertEqual(st3.channels.getNickChannels('baz'),
+                         set(['#foo', '#bar']))
+
+        # The record is dropped when nothing is known about the nick.
+        st.addMsg(self.irc, ircmsgs.part('#foo', prefix='baz!u@h2'))
+        st.addMsg(self.irc, ircmsgs.part('#bar', prefix='baz!u@h2'))
+        del st.nicksToAccounts['baz']
+        self.assertIsNotNone(st.channels.nicks.get('baz'))
+        del st.nicksToHostmasks['baz']
+        self.assertIsNone(st.channels.nicks.get('baz'))
+        self.assertRaises(KeyError, st.nickToHostmask, 'baz')
+
     def testHistory(self):
         if len(msgs) < 10:
             return
@@ -413,6 +653,36 @@ class IrcStateTestCase(SupyTestCase):
         state.addMsg(self.irc, ircmsgs.IrcMsg(':irc.inet.tele.dk 005 adkwbot WALLCHOPS KNOCK EXCEPTS INVEX MODES=4 MAXCHANNELS=20 MAXBANS=beI:100 MAXTARGETS=4 NICKLEN=9 TOPICLEN=120 KICKLEN=90 :are supported by this server'))
         self.assertEqual(state.supported['maxbans'], 100)
 
+    def testCasemapping005(self):
+        state = irclib.IrcState()
+        state.addMsg(self.irc, ircmsgs.join('#foo[]', prefix='bar!u@h'))
+        state.addMsg(self.irc, ircmsgs.join('#foo[]', prefix='Baz[]!u@h'))
+        self.assertIn('#FOO{}', state.channels)
+        self.assertIn('baz{}', state.channels['#foo[]'].users)
+        self.assertIn('baz{}', state.nicksToHostmasks)
+
+        state.addMsg(self.irc, ircmsgs.IrcMsg(':example.org 005 mybot CASEMAPPING=ascii :are supported by this server'))
+        self.assertIn('#FOO[]', state.channels)
+        self.assertNotIn('#FOO{}', state.channels)
+        self.assertIn('baz[]', state.channels['#foo[]'].users)
+        self.assertNotIn('baz{}', state.channels['#foo[]'].users)
+        self.assertNotIn('baz{}', state.nicksToHostmasks)
+        self.assertEqual(state.nicksToHostmasks['BAZ[]'], 'Baz[]!u@h')
+
+        state.addMsg(self.irc, ircmsgs.join('#bar[]', prefix='bar!u@h'))
+        self.assertNotIn('#BAR{}', state.channels)
+        self.assertIn('BAR', state.channels['#bar[]'].users)
+
+        # Unknown casemappings fall back to rfc1459
+        state.addMsg(self.irc, ircmsgs.IrcMsg(':example.org 005 mybot CASEMAPPING=rfc7613 :are supported by this server'))
+        self.assertIn('#FOO{}', state.channels)
+        self.assertIn('baz{}', state.channels['#foo[]'].users)
+
+        state.addMsg(self.irc, ircmsgs.IrcMsg(':example.org 005 mybot CASEMAPPING=ascii :are supported by this server'))
+        state.reset()
+        state.addMsg(self.irc, ircmsgs.join('#foo[]', prefix='bar!u@h'))
+        self.assertIn('#FOO{}', state.channels)
+
     def testSupportedUmodes(self):
         state = irclib.IrcState()
         state.addMsg(self.irc, ircmsgs.IrcMsg(':coulomb.oftc.net 004 testnick coulomb.oftc.net hybrid-7.2.2+oftc1.6.8 CDGPRSabcdfgiklnorsuwxyz biklmnopstveI bkloveI'))
@@ -1070,6 +1340,34 @@ class IrcTestCase(SupyTestCase):
         self.irc.feedMsg(ircmsgs.ping('123'))
         self.assertEqual(ircmsgs.pong('123'), self.irc.takeMsg())
 
+    def testGetIrc(self):
+        self.assertIs(world.getIrc('test'), self.irc)
+        self.assertIs(world.getIrc('TeSt'), self.irc)
+        self.assertIsNone(world.getIrc('test2'))
+        self.irc._reallyDie()
+        self.assertIsNone(world.getIrc('test'))
+
+    def testChannelIndex(self):
+        prefix = self.irc.prefix
+        for channel in ('#foo', '#bar', '#baz'):
+            self.irc.feedMsg(ircmsgs.join(channel, prefix=prefix))
+        self.irc.feedMsg(ircmsgs.join('#foo', prefix='other!user@host'))
+        self.assertEqual(world.getIrcsInChannel('#FOO'), [self.irc])
+        self.assertEqual(world.getIrcsInChannel('#qux'), [])
+
+        self.irc.feedMsg(ircmsgs.part('#foo', prefix='other!user@host'))
+        self.assertEqual(world.getIrcsInChannel('#foo'), [self.irc])
+        self.irc.feedMsg(ircmsgs.part('#foo', prefix=prefix))
+        self.assertEqual(world.getIrcsInChannel('#foo'), [])
+        self.irc.feedMsg(ircmsgs.kick('#bar', self.irc.nick,
+                                      prefix='other!user@host'))
+        self.assertEqual(world.getIrcsInChannel('#bar'), [])
+        self.assertEqual(world.getIrcsInChannel('#baz'), [self.irc])
+
+        self.irc.reset()
+        self.assertEqual(world.getIrcsInChannel('#baz'), [])
+        self.assertNotIn('#baz', world.ircsByChannel)
+
     def test433Response(self):
         # This is necessary; it won't change nick if irc.originalName==irc.nick
         self.irc.nick = 'somethingElse'
@@ -1092,6 +1390,30 @@ class IrcTestCase(SupyTestCase):
         msg = self.irc.takeMsg()
         self.assertEqual(msg.command, 'NOTICE')
 
+    def testThrottleBurst(self):
+        msgs = [ircmsgs.privmsg('#foo', str(i)) for i in range(4)]
+        with conf.supybot.protocols.irc.throttleTime.context(10), \
+                conf.supybot.protocols.irc.queuing.burst.context(3):
+            self.irc.lastTake = 0
+            self.irc.throttleTokens = 0
+            for msg in msgs:
+                self.irc.queueMsg(msg)
+            self.assertEqual(self.irc.takeMsg(), msgs[0])
+            self.assertEqual(self.irc.takeMsg(), msgs[1])
+            self.assertEqual(self.irc.takeMsg(), msgs[2])
+            self.assertIsNone(self.irc.takeMsg())
+            self.irc.lastTake -= 10
+            self.assertEqual(self.irc.takeMsg(), msgs[3])
+
+    def testSchedulerChange(self):
+        self.assertIs(type(self.irc.queue), irclib.IrcMsgQueue)
+        with conf.supybot.protocols.irc.queuing.scheduler.context('fair'):
+            self.irc.reset()
+            self.assertIs(type(self.irc.queue), irclib.FairMsgQueue)
+            self.assertEqual(self.irc.queue.network, 'test')
+        self.irc.reset()
+        self.assertIs(type(self.irc.queue), irclib.IrcMsgQueue)
+
     def testNoMsgLongerThan512(self):
         self.irc.queueMsg(ircmsgs.privmsg('whocares', 'x'*1000))
         msg = self.irc.takeMsg()
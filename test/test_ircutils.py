@@ -284,6 +284,47 @@ class FunctionsTestCase(SupyTestCase):
         r = ircutils.wrap(s, 91)
         self.assertLessEqual(max(map(pred, r)), 91)
 
+    def testIterWrap(self):
+        s = '\x02foo\x02 ' + ('bar ' * 1000)
+        chunks = ircutils.iterWrap(s, 50)
+        self.assertEqual(next(chunks), '\x02foo\x02 ' + 'bar ' * 10)
+        self.assertEqual(list(chunks), ircutils.wrap(s, 50)[1:])
+
+        s = '\x0304,12foo ' + 'bar ' * 20
+        r = ircutils.wrap(s, 30)
+        self.assertEqual(r[1], '\x034,12 ' + 'bar ' * 5 + '\x0f')
+        self.assertLessEqual(max(len(chunk.encode()) for chunk in r), 30)
+
+        s = '\x03,3foo ' + 'bar ' * 20
+        r = ircutils.wrap(s, 30)
+        self.assertEqual(r[1:3], ['\x0300,03' + 'bar ' * 6 + '\x0f'] * 2)
+
+    def testFormatParser(self):
+        def parse(s):
+            context = ircutils.FormatParser(s).parse()
+            return (context.fg, context.bg, context.bold, context.reverse,
+                    context.underline)
+        self.assertEqual(parse('\x02foo\x1f'),
+                         (None, None, True, False, True))
+        self.assertEqual(parse('\x02foo\x0f\x16'),
+                         (None, None, False, True, False))
+        self.assertEqual(parse('\x034foo'), (4, None, False, False, False))
+        self.assertEqual(parse('\x03159'), (15, None, False, False, False))
+        self.assertEqual(parse('\x03169'), (1, None, False, False, False))
+        self.assertEqual(parse('\x03004,'), (4, None, False, False, False))
+        self.assertEqual(parse('\x034,12foo'), (4, 12, False, False, False))
+        self.assertEqual(parse('\x034,12foo\x037'),
+                         (7, 12, False, False, False))
+        self.assertEqual(parse('\x034,12foo\x03'),
+                         (None, 12, False, False, False))
+        self.assertEqual(parse('\x03,5'), (None, 5, False, False, False))
+
+        context = ircutils.FormatParser('\x034,12\x02foo').parse()
+        context = ircutils.FormatParser('bar\x02\x1f').parse(context)
+        self.assertEqual((context.fg, context.bg, context.bold,
+                          context.reverse, context.underline),
+                         (4, 12, False, False, True))
+
     def testSafeArgument(self):
         s = 'I have been running for 9 seconds'
         bolds = ircutils.bold(s)
@@ -445,6 +486,19 @@ class FunctionsTestCase(SupyTestCase):
     def testToLower(self):
         self.assertEqual('jemfinch', ircutils.toLower('jemfinch'))
         self.assertEqual('{}|^', ircutils.toLower('[]\\~'))
+        self.assertEqual('{}|~', ircutils.toLower('[]\\~', 'strict-rfc1459'))
+        self.assertEqual('[]\\~', ircutils.toLower('[]\\~', 'ascii'))
+        self.assertEqual('jemfinch', ircutils.toLower('JemFinch', 'ascii'))
+        self.assertEqual('\xc9t\xe9', ircutils.toLower('\xc9T\xe9'))
+        self.assertRaises(ValueError, ircutils.toLower, 'foo', 'rfc7613')
+
+    def testToLowerIrcString(self):
+        s = ircutils.IrcString('[Foo]')
+        self.assertEqual(ircutils.toLower(s), '{foo}')
+        self.assertEqual(ircutils.toLower(s, 'ascii'), '[foo]')
+        s = ircutils.IrcString('[Foo]', 'ascii')
+        self.assertEqual(ircutils.toLower(s), '{foo}')
+        self.assertEqual(ircutils.toLower(s, 'ascii'), '[foo]')
 
     def testReplyTo(self):
         irc = getTestIrc()
@@ -524,6 +578,18 @@ class IrcDictTestCase(SupyTestCase):
         self.assertEqual(d, copy.copy(d))
         self.assertEqual(d, copy.deepcopy(d))
 
+    def testCasemapping(self):
+        d = ircutils.IrcDict(casemapping='ascii')
+        d['Foo[]'] = 1
+        self.assertEqual(d['foo[]'], 1)
+        self.assertNotIn('foo{}', d)
+        d2 = copy.deepcopy(d)
+        self.assertEqual(d2.casemapping, 'ascii')
+        self.assertNotIn('foo{}', d2)
+        d.setCasemapping(None)
+        self.assertEqual(d['foo{}'], 1)
+        self.assertEqual(list(d.keys()), ['Foo[]'])
+
 
 class IrcSetTestCase(SupyTestCase):
     def test(self):
@@ -555,6 +621,16 @@ class IrcSetTestCase(SupyTestCase):
         self.assertNotIn('foo', s1)
         self.assertNotIn('FOo', s1)
 
+    def testCasemapping(self):
+        s = ircutils.IrcSet(['Foo[]'], casemapping='ascii')
+        self.assertIn('FOO[]', s)
+        self.assertNotIn('foo{}', s)
+        self.assertNotIn(ircutils.IrcString('foo{}'), s)
+        self.assertNotIn('foo{}', copy.deepcopy(s))
+        s.setCasemapping(None)
+        self.assertIn('foo{}', s)
+        self.assertIn(ircutils.IrcString('foo{}'), s)
+
 
 class IrcStringTestCase(SupyTestCase):
     def testEquality(self):
@@ -571,6 +647,77 @@ class IrcStringTestCase(SupyTestCase):
         self.assertEqual(s1, s2)
         self.assertEqual(s1, s2)
 
+    def testCasemapping(self):
+        self.assertEqual('foo{}', ircutils.IrcString('FOO[]'))
+        self.assertNotEqual('foo{}', ircutils.IrcString('FOO[]', 'ascii'))
+        self.assertEqual('foo[]', ircutils.IrcString('FOO[]', 'ascii'))
+
+    def testInterned(self):
+        s = ircutils.ircString('Supybot')
+        self.assertIs(s, ircutils.ircString('Supybot'))
+        self.assertIs(s, ircutils.ircString(s))
+        self.assertEqual(s, 'SUPYBOT')
+        s2 = ircutils.ircString('Supybot', 'ascii')
+        self.assertEqual(s2.casemapping, 'ascii')
+        self.assertIsNot(s, s2)
+        self.assertIs(s2, ircutils.ircString(s, 'ascii'))
+
+
+class FloodQueueTestCase(SupyTestCase):
+    def testLenAndHas(self):
+        q = ircutils.FloodQueue(10)
+        msg1 = ircmsgs.privmsg('#foo', 'bar', prefix='foo!bar@baz')
+        msg2 = ircmsgs.privmsg('#foo', 'baz', prefix='FOO!bar@BAZ')
+        other = ircmsgs.privmsg('#foo', 'bar', prefix='foo!bar@qux')
+        self.assertEqual(q.len(msg1), 0)
+        self.assertFalse(q.has(msg1))
+        q.enqueue(msg1)
+        timeFastForward(6)
+        q.enqueue(msg2)
+        q.enqueue(msg2, 'something')
+        self.assertEqual(q.len(msg1), 3)
+        self.assertEqual(q.len(msg2), 3)
+        self.assertEqual(q.len(other), 0)
+        self.assertTrue(q.has(msg1))
+        self.assertTrue(q.has(msg2, 'something'))
+        self.assertFalse(q.has(other))
+        self.assertFalse(q.has(msg1, 'something else'))
+        timeFastForward(6)
+        self.assertEqual(q.len(msg1), 2)
+        self.assertFalse(q.has(msg1))
+        self.assertTrue(q.has(msg1, msg2))
+        timeFastForward(6)
+        self.assertEqual(q.len(msg1), 0)
+        self.assertFalse(q.has(msg1, msg2))
+
+    def testCallableTimeout(self):
+        timeout = [10]
+        q = ircutils.FloodQueue(lambda: timeout[0])
+        msg = ircmsgs.privmsg('#foo', 'bar', prefix='foo!bar@baz')
+        q.enqueue(msg)
+        timeFastForward(6)
+        self.assertEqual(q.len(msg), 1)
+        timeout[0] = 5
+        self.assertEqual(q.len(msg), 0)
+
+    def testIdleKeysAreForgotten(self):
+        q = ircutils.FloodQueue(10)
+        for i in range(100):
+            q.enqueue(ircmsgs.privmsg('#foo', 'bar',
+                                      prefix='foo!bar@host%i' % i))
+        self.assertEqual(len(q.queues), 100)
+        timeFastForward(5)
+        msg = ircmsgs.privmsg('#foo', 'bar', prefix='foo!bar@host0')
+        q.enqueue(msg)
+        timeFastForward(7)
+        self.assertEqual(q.len(msg), 1)
+        self.assertEqual(list(q.queues), ['host0'])
+        self.assertEqual(len(q.counts), 1)
+        timeFastForward(5)
+        self.assertEqual(q.len(msg), 0)
+        self.assertEqual(len(q.queues), 0)
+        self.assertEqual(q.counts, {})
+
 class AuthenticateTestCase(SupyTestCase):
     PAIRS = [
             (b'', ['+']),
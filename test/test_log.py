@@ -0,0 +1,126 @@
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+from supybot.test import *
+
+import queue
+import logging
+
+import supybot.log as log
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+class FormatterTestCase(SupyTestCase):
+    def makeRecord(self, msg):
+        return log._logger.makeRecord('supybot', logging.INFO, __file__, 0,
+                                      msg, (), None)
+
+    def testFormatChange(self):
+        formatter = log.formatter
+        with conf.supybot.log.format.context('%(levelname)s %(message)s'):
+            self.assertEqual(formatter.format(self.makeRecord('foo')),
+                             'INFO foo')
+            with conf.supybot.log.format.context('%(message)s!'):
+                self.assertEqual(formatter.format(self.makeRecord('bar')),
+                                 'bar!')
+            self.assertEqual(formatter.format(self.makeRecord('baz')),
+                             'INFO baz')
+
+    def testTimestampFormatChange(self):
+        formatter = log.formatter
+        with conf.supybot.log.format.context('%(asctime)s'):
+            record = self.makeRecord('foo')
+            with conf.supybot.log.timestampFormat.context('%Y'):
+                self.assertEqual(formatter.format(record),
+                    time.strftime('%Y', time.localtime(record.created)))
+            with conf.supybot.log.timestampFormat.context(''):
+                self.assertEqual(formatter.format(record),
+                                 str(int(record.created)))
+
+class AsynchronousTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.handler = ListHandler()
+        self.logger = logging.getLogger('supybot.test_log')
+        self.logger.propagate = False
+        log._addHandler(self.logger, self.handler)
+
+    def tearDown(self):
+        conf.supybot.log.asynchronous.setValue(False)
+        log._removeHandler(self.handler)
+        SupyTestCase.tearDown(self)
+
+    def testAsynchronous(self):
+        self.assertEqual(self.logger.handlers, [self.handler])
+        conf.supybot.log.asynchronous.setValue(True)
+        (attached,) = self.logger.handlers
+        self.assertIsInstance(attached, log.QueueHandler)
+        self.assertIs(attached.handler, self.handler)
+        self.assertIn(log._handler, [h.handler for h in log._logger.handlers])
+
+        self.logger.info('foo')
+        log._logQueue.join()
+        self.assertEqual([r.getMessage() for r in self.handler.records],
+                         ['foo'])
+
+        self.handler.setLevel(logging.WARNING)
+        self.logger.info('bar')
+        self.assertEqual(log._logQueue.qsize(), 0)
+        self.logger.warning('baz')
+
+        conf.supybot.log.asynchronous.setValue(False)
+        self.assertEqual(self.logger.handlers, [self.handler])
+        self.assertIn(log._handler, log._logger.handlers)
+        self.assertEqual([r.getMessage() for r in self.handler.records],
+                         ['foo', 'baz'])
+
+    def testDrops(self):
+        q = queue.Queue(2)
+        queueHandler = log.QueueHandler(q, self.handler)
+        for msg in ['foo', 'bar', 'baz', 'qux']:
+            queueHandler.handle(
+                self.logger.makeRecord(self.logger.name, logging.INFO,
+                                       __file__, 0, msg, (), None))
+        self.assertEqual(queueHandler.dropped, 2)
+        listener = log.QueueListener(q)
+        listener.start()
+        listener.stop()
+        self.assertEqual([r.getMessage() for r in self.handler.records],
+            ['foo',
+             '2 log records were dropped because the log queue was full.',
+             'bar'])
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
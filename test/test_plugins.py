@@ -29,8 +29,13 @@
 # POSSIBILITY OF SUCH DAMAGE.
 ###
 
+import sqlite3
+import threading
+import unittest.mock
+
 from supybot.test import *
 import supybot.conf as conf
+import supybot.dbi as dbi
 
 import supybot.irclib as irclib
 import supybot.plugins as plugins
@@ -49,3 +54,198 @@ class PluginsTestCase(SupyTestCase):
         self.assertEqual(
             plugins.makeChannelFilename('dir', '/../'),
             conf.supybot.directories.data() + '/__/dir')
+
+class TestChannelUserDB(plugins.ChannelUserDB):
+    journaled = True
+    minCompactionSize = 5
+
+    def serialize(self, v):
+        return [v]
+
+    def deserialize(self, channel, id, L):
+        (v,) = L
+        return v
+
+class ChannelUserDBTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.filename = os.path.join(conf.supybot.directories.data.tmp(),
+                                     'ChannelUserDB.db')
+        self.removeFiles()
+
+    def tearDown(self):
+        self.removeFiles()
+        SupyTestCase.tearDown(self)
+
+    def removeFiles(self):
+        for suffix in ('', '.journal', '.journal.old'):
+            if os.path.exists(self.filename + suffix):
+                os.remove(self.filename + suffix)
+
+    def waitForCompaction(self, db):
+        # Reset by the thread when it is done, possibly already.
+        thread = db._compactionThread
+        if thread is not None:
+            thread.join()
+
+    def reopen(self, db):
+        db.close()
+        return TestChannelUserDB(self.filename)
+
+    def testJournal(self):
+        db = TestChannelUserDB(self.filename)
+        db['#foo', 'bar'] = 'baz'
+        db['#foo', 1] = 'qux'
+        db.flush()
+        self.assertFalse(os.path.exists(self.filename))
+        db = self.reopen(db)
+        self.assertEqual(db['#FOO', 'bar'], 'baz')
+        self.assertEqual(db['#foo', 1], 'qux')
+
+        db['#foo', 'bar'] = 'quux'
+        del db['#foo', 1]
+        db = self.reopen(db)
+        self.assertEqual(db['#foo', 'bar'], 'quux')
+        self.assertNotIn(('#foo', 1), db)
+
+    def testCompaction(self):
+        db = TestChannelUserDB(self.filename)
+        for i in range(10):
+            db['#foo', 'nick%s' % i] = str(i)
+        del db['#foo', 'nick0']
+        db.flush()
+        self.waitForCompaction(db)
+        self.assertFalse(os.path.exists(self.filename + '.journal'))
+        self.assertFalse(os.path.exists(self.filename + '.journal.old'))
+        with open(self.filename) as fd:
+            self.assertEqual(len(fd.readlines()), 9)
+        db['#foo', 'nick1'] = 'changed'
+        db = self.reopen(db)
+        self.assertEqual(db['#foo', 'nick1'], 'changed')
+        self.assertEqual(db['#foo', 'nick9'], '9')
+        self.assertNotIn(('#foo', 'nick0'), db)
+
+    def testInterruptedCompaction(self):
+        db = TestChannelUserDB(self.filename)
+        db['#foo', 'bar'] = 'baz'
+        db['#foo', 'qux'] = 'quux'
+        db.close()
+        os.replace(self.filename + '.journal',
+                   self.filename + '.journal.old')
+        db = TestChannelUserDB(self.filename)
+        self.assertFalse(os.path.exists(self.filename + '.journal.old'))
+        self.assertEqual(db['#foo', 'bar'], 'baz')
+        self.assertEqual(db['#foo', 'qux'], 'quux')
+
+    def testFailedCompaction(self):
+        db = TestChannelUserDB(self.filename)
+        with unittest.mock.patch.object(db, '_merge',
+                                        side_effect=OSError('disk full')):
+            for i in range(10):
+                db['#foo', 'nick%s' % i] = str(i)
+            db.flush()
+            self.waitForCompaction(db)
+        self.assertIsNone(db._compactionThread)
+        self.assertTrue(os.path.exists(self.filename + '.journal.old'))
+        db['#foo', 'nick1'] = 'changed'
+        db.flush()
+        with unittest.mock.patch.object(TestChannelUserDB, '_merge',
+                                        side_effect=OSError('disk full')):
+            db = self.reopen(db)
+        self.assertEqual(db['#foo', 'nick1'], 'changed')
+        self.assertEqual(db['#foo', 'nick9'], '9')
+
+        # The next compaction merges both journals, in order.
+        for i in range(10):
+            db['#bar', 'nick%s' % i] = str(i)
+        del db['#foo', 'nick2']
+        db.flush()
+        self.waitForCompaction(db)
+        self.assertFalse(os.path.exists(self.filename + '.journal'))
+        self.assertFalse(os.path.exists(self.filename + '.journal.old'))
+        db = self.reopen(db)
+        self.assertEqual(db['#foo', 'nick1'], 'changed')
+        self.assertEqual(db['#bar', 'nick9'], '9')
+        self.assertNotIn(('#foo', 'nick2'), db)
+
+    def testNotJournaled(self):
+        class DB(TestChannelUserDB):
+            journaled = False
+        db = DB(self.filename)
+        db['#foo', 'bar'] = 'baz'
+        db['#foo', 'qux'] = 'quux'
+        del db['#foo', 'qux']
+        db.flush()
+        self.assertFalse(os.path.exists(self.filename + '.journal'))
+        self.assertEqual(db._dirty, set())
+        db.close()
+        db = DB(self.filename)
+        self.assertEqual(db['#foo', 'bar'], 'baz')
+
+class TestDbiChannelDB(plugins.DbiChannelDB):
+    class DB(dbi.DB):
+        class Record(dbi.Record):
+            __fields__ = ['text']
+
+class TestChannelDBHandler(plugins.ChannelDBHandler):
+    def makeDb(self, filename):
+        return sqlite3.connect(filename)
+
+class ChannelDBCacheTestCase(SupyTestCase):
+    channels = ('#foo', '#bar', '#baz')
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.cache = plugins.channelDbCache
+        self.removeFiles()
+
+    def tearDown(self):
+        self.removeFiles()
+        SupyTestCase.tearDown(self)
+
+    def removeFiles(self):
+        for channel in self.channels:
+            for name in ('ChannelDBCache.db', 'TestChannelDBHandler.db'):
+                filename = plugins.makeChannelFilename(name, channel)
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+    def testDbiChannelDB(self):
+        Record = TestDbiChannelDB.DB.Record
+        db = TestDbiChannelDB('ChannelDBCache.db')
+        with conf.supybot.databases.plugins.maximumOpen.context(2):
+            misses = self.cache.misses
+            evictions = self.cache.evictions
+            for channel in self.channels:
+                db.add(channel, Record(text=channel))
+            self.assertEqual(self.cache.misses, misses + 3)
+            self.assertGreaterEqual(self.cache.evictions, evictions + 1)
+            self.assertEqual(len(self.cache.getAll(db)), 2)
+
+            hits = self.cache.hits
+            self.assertEqual(db.get('#baz', 1).text, '#baz')
+            self.assertEqual(self.cache.hits, hits + 1)
+            # Evicted, so flushed to the disk and opened again.
+            self.assertEqual(db.get('#foo', 1).text, '#foo')
+            self.assertEqual(self.cache.misses, misses + 4)
+        db.close()
+        self.assertEqual(self.cache.getAll(db), [])
+
+    def testChannelDBHandler(self):
+        handler = TestChannelDBHandler()
+        db = handler.getDb('#foo')
+        self.assertIs(handler.getDb('#foo'), db)
+        L = []
+        def f():
+            L.append(handler.getDb('#foo'))
+            L.append(handler.getDb('#foo'))
+        thread = threading.Thread(target=f)
+        thread.start()
+        thread.join()
+        self.assertIs(L[0], L[1])
+        self.assertIsNot(L[0], db)
+        self.assertIn(L[0], self.cache.getAll(handler))
+        handler.getDb('#bar')
+        self.assertNotIn(L[0], self.cache.getAll(handler))
+        handler.die()
+        self.assertEqual(self.cache.getAll(handler), [])
+        self.assertRaises(sqlite3.ProgrammingError, db.execute, 'SELECT 1')
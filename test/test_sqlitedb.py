@@ -0,0 +1,152 @@
+###
+# Copyright (c) 2026, Valentin Lorentz
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+from supybot.test import *
+
+import os
+import sqlite3
+import threading
+
+import supybot.plugins as plugins
+import supybot.sqlitedb as sqlitedb
+
+def setup(db):
+    db.execute("""CREATE TABLE IF NOT EXISTS things (
+                  id INTEGER PRIMARY KEY,
+                  name TEXT
+                  )""")
+
+class SqliteDbTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.filenames = []
+
+    def tearDown(self):
+        for filename in self.filenames:
+            sqlitedb.close(filename)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(filename + suffix):
+                    os.remove(filename + suffix)
+        SupyTestCase.tearDown(self)
+
+    def makeFilename(self, name):
+        filename = os.path.join(conf.supybot.directories.data.tmp(),
+                                'test_sqlitedb_%s.db' % name)
+        self.filenames.append(filename)
+        return filename
+
+    def testConnect(self):
+        filename = self.makeFilename('connect')
+        db = sqlitedb.connect(filename, setup)
+        self.assertIs(sqlitedb.connect(filename, setup), db)
+        self.assertEqual(db.filename, filename)
+        self.assertEqual(db.execute('PRAGMA journal_mode').fetchone(),
+                         ('wal',))
+        self.assertEqual(db.execute('PRAGMA synchronous').fetchone(), (1,))
+        self.assertEqual(db.execute('PRAGMA cache_size').fetchone(),
+                         (-conf.supybot.databases.sqlite.cacheSize(),))
+        db.execute("INSERT INTO things VALUES (NULL, 'foo')")
+        db.commit()
+
+        # Other threads get their own connection
+        connections = []
+        def f():
+            other = sqlitedb.connect(filename, setup)
+            connections.append(other)
+            connections.append(
+                other.execute('SELECT name FROM things').fetchall())
+        thread = threading.Thread(target=f)
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], db)
+        self.assertEqual(connections[1], [('foo',)])
+
+    def testTransaction(self):
+        database = sqlitedb.get(self.makeFilename('transaction'), setup)
+        with database.transaction() as db:
+            db.execute("INSERT INTO things VALUES (NULL, 'foo')")
+            with database.transaction():
+                db.execute("INSERT INTO things VALUES (NULL, 'bar')")
+            self.assertTrue(db.in_transaction)
+        self.assertFalse(db.in_transaction)
+        try:
+            with database.transaction() as db:
+                db.execute("INSERT INTO things VALUES (NULL, 'baz')")
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(db.in_transaction)
+        self.assertEqual(
+            database.execute('SELECT name FROM things ORDER BY id').fetchall(),
+            [('foo',), ('bar',)])
+
+    def testClose(self):
+        filename = self.makeFilename('close')
+        db = sqlitedb.connect(filename, setup)
+        db.execute("INSERT INTO things VALUES (NULL, 'foo')")
+        db.commit()
+        sqlitedb.close(filename)
+        self.assertRaises(sqlite3.ProgrammingError, db.execute,
+                          'SELECT name FROM things')
+        db = sqlitedb.connect(filename, setup)
+        self.assertEqual(db.execute('SELECT name FROM things').fetchall(),
+                         [('foo',)])
+
+    def testMaximumOpen(self):
+        filenames = [self.makeFilename('lru%i' % i) for i in range(3)]
+        cache = plugins.channelDbCache
+        with conf.supybot.databases.plugins.maximumOpen.context(2):
+            dbs = [sqlitedb.connect(filename, setup)
+                   for filename in filenames[:2]]
+            (hits, evictions) = (cache.hits, cache.evictions)
+            sqlitedb.connect(filenames[0], setup)
+            self.assertEqual(cache.hits, hits + 1)
+            sqlitedb.connect(filenames[2], setup)
+            self.assertEqual(cache.evictions, evictions + 1)
+            # The least recently used one is closed
+            dbs[0].execute('SELECT * FROM things')
+            self.assertRaises(sqlite3.ProgrammingError, dbs[1].execute,
+                              'SELECT * FROM things')
+            self.assertIsNot(sqlitedb.connect(filenames[1], setup), dbs[1])
+
+    def testChannelDatabases(self):
+        dbs = sqlitedb.ChannelDatabases('test_sqlitedb.db', setup)
+        db = dbs.connect('#foo')
+        self.filenames.append(db.filename)
+        self.assertEqual(db.filename, plugins.makeChannelFilename(
+            'test_sqlitedb.db', '#foo'))
+        self.assertIs(dbs.connect('#FOO'), db)
+        with dbs.transaction('#foo'):
+            db.execute("INSERT INTO things VALUES (NULL, 'foo')")
+        dbs.close()
+        self.assertRaises(sqlite3.ProgrammingError, db.execute,
+                          'SELECT * FROM things')
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -68,6 +68,18 @@ class SeqTest(SupyTestCase):
         self.assertRaises(ValueError, wwindow, [], 0)
         self.assertRaises(ValueError, wwindow, [], -1)
 
+    def testDamerauLevenshtein(self):
+        osa = utils.seq.dameraulevenshtein
+        dl = utils.seq.unrestricteddameraulevenshtein
+        for (a, b, restricted, unrestricted) in [
+                ('', '', 0, 0), ('', 'abc', 3, 3), ('abc', 'abc', 0, 0),
+                ('ab', 'ba', 1, 1), ('fee', 'deed', 2, 2),
+                ('ca', 'abc', 3, 2), ('abcdef', 'badcfe', 3, 3),
+                ('kitten', 'sitting', 3, 3)]:
+            self.assertEqual(osa(a, b), restricted, (a, b))
+            self.assertEqual(dl(a, b), unrestricted, (a, b))
+            self.assertEqual(dl(b, a), unrestricted, (b, a))
+
 
 
 class GenTest(SupyTestCase):
@@ -203,6 +215,17 @@ class StrTest(SupyTestCase):
                          ['foo        bar', 'baz'])
         self.assertEqual(rsplit('foobarbaz', 'bar'), ['foo', 'baz'])
 
+    def testByteTextWrap(self):
+        s = 'foo bar ' + chr(233) * 10 + ' ' + chr(0x1f527) * 3
+        self.assertEqual(utils.str.byteTextWrap(s, 8),
+                         ['foo bar ', chr(233) * 4, chr(233) * 4,
+                          chr(233) * 2 + ' ', chr(0x1f527) * 2,
+                          chr(0x1f527)])
+        self.assertEqual(utils.str.byteTextWrap('', 8), [''])
+        it = utils.str.iterByteTextWrap(s, 8)
+        self.assertEqual(next(it), 'foo bar ')
+        self.assertEqual(list(it), utils.str.byteTextWrap(s, 8)[1:])
+
     def testMatchCase(self):
         f = utils.str.matchCase
         self.assertEqual('bar', f('foo', 'bar'))
@@ -1335,6 +1358,50 @@ class TestTruncatableSet(SupyTestCase):
         s.truncate(3)
         self.assertEqual(s, set(['foo', 'baz', 'qux']))
 
+class BKTreeTestCase(SupyTestCase):
+    words = ['foo', 'food', 'fool', 'bar', 'baz', 'barn', 'quux', 'fo',
+             'oof', 'boo', 'abc', 'ca']
+
+    def testBasics(self):
+        t = BKTree(utils.seq.unrestricteddameraulevenshtein, self.words)
+        self.assertEqual(len(t), len(self.words))
+        self.assertEqual(sorted(t), sorted(self.words))
+        self.assertIn('barn', t)
+        self.assertNotIn('bam', t)
+        t.add('barn')
+        self.assertEqual(len(t), len(self.words))
+
+    def testSearch(self):
+        distance = utils.seq.unrestricteddameraulevenshtein
+        t = BKTree(distance, self.words)
+        for query in ['fo', 'foo', 'bam', 'quxu', 'ac', 'zzzz', '']:
+            for radius in range(5):
+                expected = sorted((distance(query, word), word)
+                                  for word in self.words
+                                  if distance(query, word) <= radius)
+                self.assertEqual(sorted(t.search(query, radius)), expected,
+                                 (query, radius))
+        self.assertEqual(BKTree(distance).search('foo', 3), [])
+
+    def testDiscard(self):
+        t = BKTree(utils.seq.unrestricteddameraulevenshtein, self.words)
+        t.discard('foo')
+        t.discard('foo')
+        t.discard('nonexistent')
+        self.assertNotIn('foo', t)
+        self.assertEqual(len(t), len(self.words) - 1)
+        self.assertEqual(sorted(t.search('foo', 1)),
+                         [(1, 'boo'), (1, 'fo'), (1, 'food'), (1, 'fool')])
+        t.add('foo')
+        self.assertIn('foo', t)
+        self.assertEqual(sorted(t.search('foo', 0)), [(0, 'foo')])
+
+        # Rebuilt once most items are removed
+        for word in self.words[:-3]:
+            t.discard(word)
+        self.assertEqual(sorted(t), sorted(self.words[-3:]))
+        self.assertEqual(sorted(t.search('ab', 1)), [(1, 'abc')])
+
 class UtilsPythonTest(SupyTestCase):
     def test_dict(self):
         class Foo: